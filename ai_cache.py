@@ -0,0 +1,231 @@
+import hashlib # Calcolo dell'impronta (hash) delle chiavi
+import json # Serializzazione dei risultati
+import os # Percorsi e variabili d'ambiente
+import sqlite3 # Archivio persistente su disco
+import threading # Accesso concorrente da più sessioni Streamlit
+import time # Gestione della scadenza (TTL)
+from collections import OrderedDict # Struttura LRU in memoria
+
+# Impostazioni della cache (sovrascrivibili tramite variabili d'ambiente, utile in Docker)
+CACHE_DB_PATH = os.environ.get("ECOVISION_CACHE_DB", os.path.join(".cache", "analisi.sqlite3"))
+CACHE_TTL_SECONDI = int(os.environ.get("ECOVISION_CACHE_TTL", 7 * 24 * 3600)) # Una settimana
+CACHE_MAX_VOCI_MEMORIA = int(os.environ.get("ECOVISION_CACHE_MAX_VOCI", 256))
+CACHE_MAX_BYTES_DISCO = int(os.environ.get("ECOVISION_CACHE_MAX_BYTES", 50 * 1024 * 1024)) # 50 MB
+
+
+def calcola_chiave(dati_immagine, citta, prompt_version, model_id):
+    """
+    Calcola la chiave della cache a partire dai byte normalizzati dell'immagine
+    (quelli prodotti dalla pipeline di preprocessing, già ruotati, in RGB e
+    ricodificati), dalla città, dalla versione del prompt e dal modello usato.
+    """
+    impronta = hashlib.sha256(dati_immagine).hexdigest()
+
+    # Combiniamo l'impronta dell'immagine con i parametri che influenzano la risposta
+    componenti = [impronta, citta or "", str(prompt_version), model_id]
+    return hashlib.sha256("\x1f".join(componenti).encode("utf-8")).hexdigest()
+
+
+class CacheAnalisi:
+    """
+    Cache a due livelli per i risultati di analizza_immagine:
+    1. LRU in memoria, condivisa tra le sessioni dello stesso processo;
+    2. Archivio SQLite su disco, con scadenza (TTL) ed eliminazione per dimensione.
+    I due livelli hanno lock separati: mentre una sessione legge o scrive su disco
+    le altre continuano a trovare i risultati in memoria. Se il disco non è utilizzabile
+    (cartella in sola lettura, file danneggiato) resta attivo solo il livello in memoria.
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH, ttl=CACHE_TTL_SECONDI,
+                 max_voci_memoria=CACHE_MAX_VOCI_MEMORIA, max_bytes_disco=CACHE_MAX_BYTES_DISCO):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_voci_memoria = max_voci_memoria
+        self.max_bytes_disco = max_bytes_disco
+
+        self._memoria = OrderedDict() # chiave -> (scadenza, risultato)
+        self._lock = threading.Lock() # memoria e contatori
+        self._lock_disco = threading.Lock() # connessione SQLite, mai tenuto insieme a _lock
+        self._conn = None
+
+        # Contatori per dimensionare la cache
+        self.hit_memoria = 0
+        self.hit_disco = 0
+        self.miss = 0
+
+    # --- Livello su disco ---
+
+    def _connessione(self):
+        """
+        Apre (una sola volta) la connessione SQLite e crea la tabella se manca.
+        Va chiamata tenendo _lock_disco. Solleva OSError o sqlite3.Error se il disco non è utilizzabile.
+        """
+        if self._conn is None:
+            cartella = os.path.dirname(self.db_path)
+            if cartella:
+                os.makedirs(cartella, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS analisi (
+                    chiave TEXT PRIMARY KEY,
+                    valore TEXT NOT NULL,
+                    scadenza REAL NOT NULL,
+                    ultimo_accesso REAL NOT NULL,
+                    dimensione INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accesso ON analisi (ultimo_accesso)")
+        return self._conn
+
+    def _leggi_disco(self, chiave, adesso):
+        conn = self._connessione()
+        riga = conn.execute("SELECT valore, scadenza FROM analisi WHERE chiave = ?", (chiave,)).fetchone()
+        if riga is None:
+            return None, None
+        valore, scadenza = riga
+        if scadenza < adesso:
+            # Voce scaduta: la rimuoviamo subito
+            conn.execute("DELETE FROM analisi WHERE chiave = ?", (chiave,))
+            conn.commit()
+            return None, None
+        conn.execute("UPDATE analisi SET ultimo_accesso = ? WHERE chiave = ?", (adesso, chiave))
+        conn.commit()
+        return json.loads(valore), scadenza
+
+    def _scrivi_disco(self, chiave, valore, scadenza, adesso):
+        conn = self._connessione()
+        testo = json.dumps(valore, ensure_ascii=False)
+        conn.execute(
+            "INSERT OR REPLACE INTO analisi (chiave, valore, scadenza, ultimo_accesso, dimensione) VALUES (?, ?, ?, ?, ?)",
+            (chiave, testo, scadenza, adesso, len(testo.encode("utf-8")))
+        )
+        # Eliminiamo le voci scadute e, se serve, le meno usate di recente finché rientriamo nel limite
+        conn.execute("DELETE FROM analisi WHERE scadenza < ?", (adesso,))
+        totale = conn.execute("SELECT COALESCE(SUM(dimensione), 0) FROM analisi").fetchone()[0]
+        if totale > self.max_bytes_disco:
+            for vecchia_chiave, dimensione in conn.execute(
+                    "SELECT chiave, dimensione FROM analisi ORDER BY ultimo_accesso ASC").fetchall():
+                if totale <= self.max_bytes_disco:
+                    break
+                conn.execute("DELETE FROM analisi WHERE chiave = ?", (vecchia_chiave,))
+                totale -= dimensione
+        conn.commit()
+
+    # --- Livello in memoria ---
+
+    def _salva_memoria(self, chiave, valore, scadenza):
+        self._memoria[chiave] = (scadenza, valore)
+        self._memoria.move_to_end(chiave)
+        while len(self._memoria) > self.max_voci_memoria:
+            self._memoria.popitem(last=False) # Rimuove la voce usata meno di recente
+
+    # --- Interfaccia pubblica ---
+
+    def get(self, chiave):
+        """
+        Restituisce il risultato salvato per la chiave, oppure None.
+        Una copia del dizionario viene restituita per evitare modifiche alla cache.
+        """
+        adesso = time.time()
+        with self._lock:
+            voce = self._memoria.get(chiave)
+            if voce is not None:
+                scadenza, valore = voce
+                if scadenza >= adesso:
+                    self._memoria.move_to_end(chiave)
+                    self.hit_memoria += 1
+                    return json.loads(json.dumps(valore))
+                del self._memoria[chiave]
+
+        # La lettura da disco non blocca chi trova il risultato in memoria
+        try:
+            with self._lock_disco:
+                valore, scadenza = self._leggi_disco(chiave, adesso)
+        except (sqlite3.Error, OSError) as db_err:
+            print(f"Errore lettura cache su disco: {db_err}")
+            valore = None
+
+        with self._lock:
+            if valore is None:
+                self.miss += 1
+                return None
+
+            # Promuoviamo la voce nel livello in memoria
+            self._salva_memoria(chiave, valore, scadenza)
+            self.hit_disco += 1
+        return json.loads(json.dumps(valore))
+
+    def set(self, chiave, valore):
+        """
+        Salva il risultato in entrambi i livelli della cache.
+        """
+        adesso = time.time()
+        scadenza = adesso + self.ttl
+        valore = json.loads(json.dumps(valore)) # Copia: il chiamante può modificare il proprio dizionario
+        with self._lock:
+            self._salva_memoria(chiave, valore, scadenza)
+        try:
+            with self._lock_disco:
+                self._scrivi_disco(chiave, valore, scadenza, adesso)
+        except (sqlite3.Error, OSError) as db_err:
+            # La cache su disco è un'ottimizzazione: un errore non deve bloccare l'analisi
+            print(f"Errore scrittura cache su disco: {db_err}")
+
+    def svuota(self):
+        """
+        Svuota entrambi i livelli e azzera i contatori.
+        """
+        with self._lock:
+            self._memoria.clear()
+            self.hit_memoria = self.hit_disco = self.miss = 0
+        try:
+            with self._lock_disco:
+                conn = self._connessione()
+                conn.execute("DELETE FROM analisi")
+                conn.commit()
+        except (sqlite3.Error, OSError) as db_err:
+            print(f"Errore svuotamento cache su disco: {db_err}")
+
+    def statistiche(self):
+        """
+        Restituisce i contatori di hit/miss e l'occupazione attuale della cache.
+        """
+        voci_disco, bytes_disco = 0, 0
+        try:
+            with self._lock_disco:
+                voci_disco, bytes_disco = self._connessione().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(dimensione), 0) FROM analisi").fetchone()
+        except (sqlite3.Error, OSError):
+            pass
+        with self._lock:
+            richieste = self.hit_memoria + self.hit_disco + self.miss
+            return {
+                "hit_memoria": self.hit_memoria,
+                "hit_disco": self.hit_disco,
+                "miss": self.miss,
+                "hit_rate": (self.hit_memoria + self.hit_disco) / richieste if richieste else 0.0,
+                "voci_memoria": len(self._memoria),
+                "voci_disco": voci_disco,
+                "bytes_disco": bytes_disco,
+            }
+
+
+# Istanza condivisa da tutto il processo (tutte le sessioni Streamlit)
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """
+    Restituisce l'istanza di cache condivisa, creandola al primo utilizzo.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheAnalisi()
+        return _cache
+
+def statistiche_cache():
+    """
+    Scorciatoia per leggere i contatori della cache condivisa.
+    """
+    return get_cache().statistiche()
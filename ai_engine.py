@@ -1,130 +1,13 @@
 import streamlit as st # Framework per la creazione della web app
-import json # Gestione dei dati JSON
-import re # Gestione delle stringhe
-from google import genai # API Google Gemini ("cervello")
-from google.genai import types # Tipi di dati per Gemini
-
-# Impostare come constanti il modello di Gemini
-# Usiamo gemini-2.5-flash
-VISION_MODEL_ID = "gemini-2.5-flash"
-CHAT_MODEL_ID = "gemini-2.5-flash"
-
-def _get_client(api_key):
-    """
-    Funzione interna per inizializzare il Client GenAI.
-    L'uso di un'istanza client evita problemi di configurazione globale.
-    """
-    return genai.Client(api_key=api_key)
-
-def _clean_json_text(raw_text):
-    """
-    Funzione di supporto per ripulire i blocchi di codice markdown 
-    se l'IA li include (es. ```json ... ```) usando le regex
-    """
-    try:
-        # Regex per rimuovere ```json ... ``` o solo ``` ... ``` all'inizio/fine
-        cleaned = re.sub(r"^```json\s*", "", raw_text, flags=re.MULTILINE)
-        cleaned = re.sub(r"^```\s*", "", cleaned, flags=re.MULTILINE)
-        cleaned = re.sub(r"```\s*$", "", cleaned, flags=re.MULTILINE)
-        return cleaned.strip()
-    except Exception:
-        return raw_text
+import core_engine # Motore di analisi condiviso con l'API HTTP
+# Le funzioni senza elementi di interfaccia vengono usate così come sono
+from core_engine import analizza_batch, get_chatbot_response, get_chatbot_response_stream # noqa: F401
 
 def analizza_immagine(image, api_key, citta):
     """
-    Analizza un'immagine per identificare il tipo di rifiuto e le istruzioni di smaltimento.
-    Restituisce un dizionario Python (JSON parsato).
-    """
-    client = _get_client(api_key)
-    try:
-        with st.spinner("Sto analizzando l'oggetto..."):
-
-            # Configura lo schema della risposta usando il modulo "types"
-            # Forziamo il tipo MIME JSON per ottenere un output strutturato
-            config = types.GenerateContentConfig(
-                response_mime_type="application/json",
-                temperature = 0.2 # Temperatura bassa per risultati più deterministici e meno creativi
-            )
-
-            prompt = f"""
-            Agisci come un esperto di riciclo e raccolta differenziata.
-            Analizza questa immagine.
-            Se l'oggetto è composto da più parti di materiali diversi (es. bottiglia di vetro con tappo di plastica), DEVI separare i componenti.
-
-            Restituisci ESCLUSIVAMENTE un oggetto JSON con la seguente struttura:
-            {{
-                "oggetto_principale": "Nome dell'oggetto intero (es. Bottiglia d'acqua)",
-                "materiali": "Elenca tutti i materiali presenti (es. Vetro e Plastica)",
-                "azione": "Azione complessiva da compiere (es. Separa il tappo dalla bottiglia)",
-                "note": "Breve consiglio o motivazione",
-                "componenti": [
-                    {{
-                        "nome": "Nome del componente (es. Bottiglia, Tappo)",
-                        "destinazione": "Dove va buttato (Scegli tra: Plastica, Carta, Vetro, Organico, Indifferenziato, Rifiuto Speciale, Non identificato)"
-                    }}
-                ]
-            }}
-
-            L'utente si trova in {citta}.
-            1. Identifica l'oggetto principale.
-            2. Descrivi i materiali e l'azione globale.
-            3. Nella lista "componenti", inserisci SOLO la destinazione per ogni parte.
-            4. Se l'immagine non è chiara, restituisci un componente con "destinazione": "Non identificato".
-            """
-            
-            # Chiamate API usando client.models della nuova libreria
-            response = client.models.generate_content(
-                model=VISION_MODEL_ID,
-                contents=[prompt, image],
-                config=config
-            )
-
-            # Parsing JSON con meccanismo di sicurezza
-            try:
-                # Puliamo il testo, rimuovento i backticks del codice markdown
-                clean_text = _clean_json_text(response.text)
-                return json.loads(clean_text)
-
-            except json.JSONDecodeError as json_err:
-                print(f"Errore Parsing JSON: {json_err}. Testo grezzo: {response.text}")
-                # Dizionario di fallback per evitare che l'app vada in crash
-                return {
-                    "oggetto_principale": "Errore Analisi",
-                    "materiali": "Sconosciuto",
-                    "azione": "Riprova con una foto più chiara.",
-                    "note": "L'IA non ha restituito un formato valido.",
-                    "componenti": [{"nome": "Oggetto non identificato", "destinazione": "Non identificato"}]
-                }
-    except Exception as e:
-        # Solleviamo l'eccezione al main.py per mostrarla nell'interfaccia utente
-        raise e
-
-def get_chatbot_response(user_query, context_data, api_key):
-    """
-    Genera una risposta della chat basata sul contesto dell'analisi precedente.
+    Analizza un'immagine mostrando l'indicatore di attesa di Streamlit.
+    Restituisce il dizionario dell'analisi di core_engine.analizza_immagine;
+    le eccezioni (es. ServizioNonDisponibile) arrivano a main.py, che le mostra nell'interfaccia.
     """
-    client = _get_client(api_key)
-    
-    try:
-        # Convertiamo i dati del contesto in stringa
-        context_str = json.dumps(context_data, ensure_ascii=False, indent=2)
-        
-        prompt = f"""
-        Sei un assistente esperto di riciclo.
-        Dati dell'analisi:
-        {context_str}
-
-        Domanda utente: "{user_query}"
-
-        Rispondi in modo gentile e conciso. Riferisciti all'oggetto analizzato se pertinente.
-        """
-
-        # Generiamo una risposta testuale semplice
-        response = client.models.generate_content(
-            model=CHAT_MODEL_ID,
-            contents=prompt
-        )
-        return response.text
-
-    except Exception as e:
-        return f"Mi dispiace, c'è stato un problema nel generare la risposta: {e}"
\ No newline at end of file
+    with st.spinner("Sto analizzando l'oggetto..."):
+        return core_engine.analizza_immagine(image, api_key, citta)
@@ -0,0 +1,61 @@
+from enum import Enum # Bidoni ammessi nella risposta
+from pydantic import BaseModel, Field, ValidationError, field_validator # Schema e validazione della risposta
+from knowledge_base import BIDONI, normalizza_destinazione # Bidoni canonici e sinonimi
+
+
+# Le docstring delle classi finirebbero nello schema inviato a Gemini (e nei token del prompt):
+# qui usiamo commenti, le descrizioni per il modello stanno nei Field
+
+# Bidoni tra cui il modello deve scegliere (gli stessi di knowledge_base.BIDONI)
+class Destinazione(str, Enum):
+    PLASTICA = "Plastica"
+    CARTA = "Carta"
+    VETRO = "Vetro"
+    ORGANICO = "Organico"
+    INDIFFERENZIATO = "Indifferenziato"
+    RIFIUTO_SPECIALE = "Rifiuto Speciale"
+    NON_IDENTIFICATO = "Non identificato"
+
+
+class Componente(BaseModel):
+    nome: str = Field(description="Nome del componente (es. Bottiglia, Tappo)")
+    destinazione: Destinazione = Field(description="Bidone in cui va buttato il componente")
+
+    @field_validator("destinazione", mode="before")
+    @classmethod
+    def _bidone_canonico(cls, valore):
+        # Con lo schema il modello sceglie già tra i valori ammessi; in riparazione
+        # accettiamo anche i sinonimi ("Umido", "Plastica e metalli"...)
+        if isinstance(valore, str):
+            return BIDONI[normalizza_destinazione(valore)]
+        return valore
+
+
+# Struttura della risposta di analisi, passata a Gemini come response_schema:
+# le descrizioni dei campi sostituiscono lo schema che prima era scritto nel prompt
+class RisultatoAnalisi(BaseModel):
+    oggetto_principale: str = Field(description="Nome dell'oggetto intero (es. Bottiglia d'acqua)")
+    materiali: str = Field(description="Tutti i materiali presenti (es. Vetro e Plastica)")
+    azione: str = Field(description="Azione complessiva da compiere (es. Separa il tappo dalla bottiglia)")
+    note: str = Field(description="Breve consiglio o motivazione")
+    componenti: list[Componente] = Field(
+        min_length=1,
+        description="Una voce per ogni parte di materiale diverso, con il relativo bidone",
+    )
+
+    def in_dizionario(self):
+        """
+        Dizionario con gli stessi campi e tipi semplici usati da cache, regole e interfaccia.
+        """
+        return self.model_dump(mode="json")
+
+
+def valida_testo(testo):
+    """
+    Valida il testo JSON di una risposta. Restituisce la coppia (RisultatoAnalisi, None)
+    oppure (None, errore) se il testo non è JSON valido o non rispetta lo schema.
+    """
+    try:
+        return RisultatoAnalisi.model_validate_json(testo or ""), None
+    except ValidationError as errore:
+        return None, errore
@@ -0,0 +1,243 @@
+"""
+API HTTP di EcoVision (ASGI), per chioschi e app mobili.
+
+Usa lo stesso motore dell'app Streamlit (core_engine.py): cache, base di conoscenza,
+scheduler delle chiamate a Gemini e metriche sono condivisi.
+
+Endpoint:
+    POST /analizza         multipart: "immagine" + "codice_catasto" o "citta" (facoltativi)
+    POST /analizza/batch   multipart: più campi "immagini" + città come sopra
+    GET  /salute           stato del servizio e dello scheduler
+    GET  /metrics          metriche in formato Prometheus
+
+Avvio:
+    python api.py                 (porta ECOVISION_API_PORT, default 8000)
+    uvicorn api:app --port 8000   (senza token solo per richieste locali, vedi sotto)
+
+La chiave Gemini resta sul server (GOOGLE_API_KEY): i client non la ricevono mai.
+Gli endpoint di analisi la consumano, quindi richiedono il token condiviso
+ECOVISION_API_TOKEN ("Authorization: Bearer <token>"); senza token gli endpoint
+di analisi rispondono solo a richieste da loopback, comunque venga avviato il server
+(python api.py, inoltre, rifiuta di ascoltare su un indirizzo diverso da 127.0.0.1).
+Le analisi girano su thread, quindi il server gestisce più richieste contemporanee;
+il limite verso Gemini resta quello dello scheduler condiviso (scheduler.py).
+"""
+import hmac # Confronto del token a tempo costante
+import ipaddress # Indirizzo del client: loopback o no
+import os # Variabili d'ambiente
+from starlette.applications import Starlette # Applicazione ASGI
+from starlette.concurrency import run_in_threadpool # Analisi (bloccanti) fuori dall'event loop
+from starlette.requests import Request # Richieste HTTP
+from starlette.responses import JSONResponse, Response # Risposte JSON e testo
+from starlette.routing import Route # Instradamento degli endpoint
+import core_engine # Motore di analisi senza interfaccia
+import metrics # Durata delle fasi ed esportazione in formato Prometheus
+from city_search import risolvi_comune # Nome libero -> etichetta del comune
+from comuni_index import get_indice_comuni # Codice catastale -> etichetta del comune
+from image_preprocessing import preprocessa_immagine # Ottimizzazione delle immagini prima dell'invio
+from scheduler import ServizioNonDisponibile, statistiche_scheduler # Gemini sovraccarico o non raggiungibile
+
+# Indirizzo di ascolto del server
+API_HOST = os.environ.get("ECOVISION_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("ECOVISION_API_PORT", 8000))
+# Processi uvicorn: ognuno ha il proprio scheduler, quindi i limiti verso Gemini si moltiplicano
+API_WORKERS = int(os.environ.get("ECOVISION_API_WORKERS", 1))
+# Secondi per cui una connessione inattiva resta aperta (keep-alive) in attesa della richiesta successiva
+API_KEEPALIVE_SECONDI = int(os.environ.get("ECOVISION_API_KEEPALIVE", 30))
+
+# Token dei client degli endpoint di analisi (più token separati da virgole, per la rotazione)
+API_TOKEN = [t.strip() for t in os.environ.get("ECOVISION_API_TOKEN", "").split(",") if t.strip()]
+# Indirizzi su cui il server può ascoltare senza token
+HOST_LOCALI = {"127.0.0.1", "::1", "localhost"}
+
+# Limiti delle richieste
+MAX_MB_IMMAGINE = float(os.environ.get("ECOVISION_API_MAX_MB", 10))
+MAX_IMMAGINI_BATCH = int(os.environ.get("ECOVISION_API_MAX_IMMAGINI", 20))
+
+# Pausa suggerita ai client quando Gemini non è disponibile (header Retry-After)
+RIPROVA_DOPO_SECONDI = 30
+
+
+class RichiestaNonValida(Exception):
+    """
+    Errore del client (campo mancante, immagine illeggibile, città sconosciuta): risposta 400.
+    """
+
+
+def _errore(stato, messaggio, **header):
+    return JSONResponse({"errore": messaggio}, status_code=stato, headers=header or None)
+
+
+def _api_key():
+    return os.environ.get("GOOGLE_API_KEY")
+
+
+def _da_loopback(request):
+    """
+    True se la richiesta arriva dalla stessa macchina. Dietro un proxy locale uvicorn
+    sostituisce l'indirizzo con quello di X-Forwarded-For, quindi i client remoti non passano.
+    Senza indirizzo (socket Unix) la connessione è per forza locale.
+    """
+    if request.client is None:
+        return True
+    host = request.client.host
+    if host == "localhost":
+        return True
+    try:
+        indirizzo = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    # ::ffff:127.0.0.1 (IPv4 su socket IPv6) va controllato come indirizzo IPv4
+    indirizzo = getattr(indirizzo, "ipv4_mapped", None) or indirizzo
+    return indirizzo.is_loopback
+
+
+def _rifiuta(request):
+    """
+    Risposta di errore se il client non può usare gli endpoint di analisi, altrimenti None:
+    con i token serve uno di quelli configurati, senza token la richiesta deve essere locale.
+    """
+    if not API_TOKEN:
+        if _da_loopback(request):
+            return None
+        return _errore(403, "API senza ECOVISION_API_TOKEN: sono accettate solo richieste locali")
+    schema, _, token = request.headers.get("authorization", "").partition(" ")
+    if schema.lower() == "bearer" and token and \
+            any(hmac.compare_digest(token.strip().encode(), t.encode()) for t in API_TOKEN):
+        return None
+    return _errore(401, "Token mancante o non valido", **{"WWW-Authenticate": "Bearer"})
+
+
+def _risolvi_citta(form):
+    """
+    Etichetta del comune ("BARI, Puglia, Italy") dal codice catastale o dal nome.
+    Senza città l'analisi usa solo le regole generali, come nell'app.
+    """
+    codice = (form.get("codice_catasto") or "").strip()
+    if codice:
+        citta = get_indice_comuni().etichetta_da_codice(codice)
+        if citta is None:
+            raise RichiestaNonValida(f"Codice catastale sconosciuto: {codice}")
+        return citta
+    nome = (form.get("citta") or "").strip()
+    if nome:
+        citta = risolvi_comune(nome)
+        if citta is None:
+            raise RichiestaNonValida(f"Comune non trovato: {nome}")
+        return citta
+    return None
+
+
+async def _leggi_immagine(file):
+    """
+    Legge un file caricato controllandone la dimensione.
+    """
+    if not hasattr(file, "read"):
+        raise RichiestaNonValida("Il campo dell'immagine deve essere un file")
+    dati = await file.read()
+    if not dati:
+        raise RichiestaNonValida(f"{file.filename}: file vuoto")
+    if len(dati) > MAX_MB_IMMAGINE * 1024 * 1024:
+        raise RichiestaNonValida(f"{file.filename}: l'immagine supera {MAX_MB_IMMAGINE:g} MB")
+    return dati
+
+
+def _preprocessa(dati):
+    try:
+        return preprocessa_immagine(dati)
+    except (OSError, ValueError) as e: # PIL.UnidentifiedImageError è un OSError
+        raise RichiestaNonValida("Immagine non valida o formato non supportato") from e
+
+
+def _analizza(dati, citta):
+    """
+    Preprocessing e analisi di una singola immagine (eseguita su un thread).
+    """
+    return core_engine.analizza_immagine(_preprocessa(dati), _api_key(), citta)
+
+
+def _analizza_batch(voci, citta):
+    """
+    Analisi multipla (eseguita su un thread). Le immagini illeggibili vengono
+    segnalate singolarmente e non interrompono le altre.
+    """
+    risultati = [{"nome": nome, "risultato": None, "errore": None} for nome, _ in voci]
+    valide = []
+    for indice, (_, dati) in enumerate(voci):
+        try:
+            valide.append((indice, _preprocessa(dati)))
+        except RichiestaNonValida as e:
+            risultati[indice]["errore"] = str(e)
+
+    for posizione, risultato, errore in core_engine.analizza_batch([img for _, img in valide], _api_key(), citta):
+        voce = risultati[valide[posizione][0]]
+        voce["risultato"] = risultato
+        voce["errore"] = str(errore) if errore else None
+    return risultati
+
+
+async def analizza(request: Request):
+    if (rifiuto := _rifiuta(request)) is not None:
+        return rifiuto
+    if not _api_key():
+        return _errore(503, "Chiave API di Gemini non configurata sul server")
+    try:
+        async with request.form(max_files=1) as form:
+            citta = _risolvi_citta(form)
+            if form.get("immagine") is None:
+                raise RichiestaNonValida("Manca il campo 'immagine'")
+            dati = await _leggi_immagine(form["immagine"])
+        risultato = await run_in_threadpool(_analizza, dati, citta)
+    except RichiestaNonValida as e:
+        return _errore(400, str(e))
+    except ServizioNonDisponibile as e:
+        return _errore(503, str(e), **{"Retry-After": str(RIPROVA_DOPO_SECONDI)})
+    return JSONResponse({"citta": citta, "risultato": risultato})
+
+
+async def analizza_batch(request: Request):
+    if (rifiuto := _rifiuta(request)) is not None:
+        return rifiuto
+    if not _api_key():
+        return _errore(503, "Chiave API di Gemini non configurata sul server")
+    try:
+        async with request.form(max_files=MAX_IMMAGINI_BATCH) as form:
+            citta = _risolvi_citta(form)
+            file = form.getlist("immagini")
+            if not file:
+                raise RichiestaNonValida("Manca il campo 'immagini'")
+            voci = [(f.filename, await _leggi_immagine(f)) for f in file]
+        risultati = await run_in_threadpool(_analizza_batch, voci, citta)
+    except RichiestaNonValida as e:
+        return _errore(400, str(e))
+    return JSONResponse({"citta": citta, "risultati": risultati})
+
+
+async def salute(request: Request):
+    stato_scheduler = statistiche_scheduler()
+    # "degradato": il circuito verso Gemini è aperto, le analisi non in cache vengono rifiutate
+    stato = "degradato" if stato_scheduler["circuito_aperto"] else "ok"
+    return JSONResponse({"stato": stato, "chiave_api": bool(_api_key()), "scheduler": stato_scheduler})
+
+
+async def esporta_metriche(request: Request):
+    return Response(metrics.esporta_prometheus(), media_type=metrics.CONTENT_TYPE)
+
+
+app = Starlette(routes=[
+    Route("/analizza", analizza, methods=["POST"]),
+    Route("/analizza/batch", analizza_batch, methods=["POST"]),
+    Route("/salute", salute, methods=["GET"]),
+    Route("/metrics", esporta_metriche, methods=["GET"]),
+])
+
+
+if __name__ == "__main__":
+    import sys # Uscita con errore
+    if API_HOST not in HOST_LOCALI and not API_TOKEN:
+        # Senza token chiunque raggiunga il server consumerebbe la chiave Gemini
+        sys.exit(f"ECOVISION_API_HOST={API_HOST} richiede ECOVISION_API_TOKEN: "
+                 "senza token l'API può ascoltare solo su 127.0.0.1")
+    import uvicorn # Server ASGI (HTTP/1.1 con keep-alive)
+    uvicorn.run("api:app", host=API_HOST, port=API_PORT, workers=API_WORKERS,
+                timeout_keep_alive=API_KEEPALIVE_SECONDI)
@@ -0,0 +1,168 @@
+"""
+Icone e logo pronti per l'interfaccia.
+
+I file in icons/ sono pensati per la stampa (PNG 1024x1024 da ~60 KB, logo da 182 KB),
+mentre l'app li mostra a 80-150 px. Passando il percorso a st.image, Streamlit
+rilegge il file, lo ridimensiona e lo ricodifica a ogni rerun e per ogni riga dei risultati.
+
+Qui ogni immagine viene preparata una sola volta per processo e tenuta in memoria:
+- le icone dei bidoni usano gli SVG già presenti, ripuliti dai metadati dell'editor:
+  ~2,4 KB ciascuna invece di 60 KB, nitide a qualsiasi dimensione e senza alcuna
+  decodifica lato server (Streamlit le incorpora come data URI);
+- le immagini senza SVG (il logo) vengono ridotte alla larghezza di visualizzazione
+  e salvate come PNG a palette: Streamlit non deve più ridimensionarle e,
+  dato che i byte sono sempre gli stessi, le serve sempre allo stesso URL.
+
+Le varianti PNG usate dall'interfaccia (VARIANTI_RASTER) si possono preparare
+in fase di build, come comuni_index.bin, così la prima pagina di un nuovo
+container non le calcola:
+    python assets.py    scrive le varianti in icons/ridotte/
+"""
+import io # Codifica in memoria
+import os # Percorsi dei file
+import re # Pulizia degli SVG
+import threading # Cache condivisa tra le sessioni
+import metrics # Esportazione delle statistiche del registro
+
+DIR_ICONE = "icons"
+
+# Larghezze (px) a cui l'interfaccia mostra le immagini
+LARGHEZZA_LEGENDA = 80
+LARGHEZZA_ICONA_RISULTATO = 120
+LARGHEZZA_LOGO = 150
+LARGHEZZA_ICONA_PAGINA = 64 # favicon
+
+# Varianti PNG (immagini senza SVG) mostrate dall'interfaccia, preparate da "python assets.py"
+DIR_RIDOTTE = os.path.join(DIR_ICONE, "ridotte")
+VARIANTI_RASTER = (
+    ("logo_ecovision_highres", LARGHEZZA_LOGO),
+    ("logo_ecovision_highres", LARGHEZZA_ICONA_PAGINA),
+)
+
+# Parti degli SVG che il browser non usa: intestazioni, commenti, gruppi vuoti
+# e identificativi lasciati dall'editor, spazi tra i tag
+_RE_SVG_SUPERFLUO = (
+    (re.compile(r"<\?xml.*?\?>|<!DOCTYPE[^>]*>|<!--.*?-->", re.DOTALL), ""),
+    (re.compile(r"<g[^>]*/>"), ""),
+    (re.compile(r'\sid="[^"]*"'), ""),
+    # Coordinate a un decimale: su un viewBox di 512 unità mostrato a 80-120 px
+    # la differenza è di un centesimo di pixel
+    (re.compile(r"\d+\.\d{2,}"), lambda numero: f"{float(numero.group()):.1f}"),
+    (re.compile(r">\s+<"), "><"),
+    (re.compile(r"\s+"), " "),
+)
+# Sul tag <svg> togliamo anche la dimensione fissa: la decide st.image
+_RE_TAG_SVG = re.compile(r"<svg[^>]*>")
+_RE_ATTRIBUTI_SVG = re.compile(r'\s(?:width|height|version|xml:space|xmlns:xlink)="[^"]*"')
+
+
+def svg_ottimizzato(testo):
+    """
+    Restituisce l'SVG senza le parti inutili per la visualizzazione.
+    """
+    for regex, sostituzione in _RE_SVG_SUPERFLUO:
+        testo = regex.sub(sostituzione, testo)
+    testo = _RE_TAG_SVG.sub(lambda tag: _RE_ATTRIBUTI_SVG.sub("", tag.group(0)), testo, count=1)
+    return testo.strip()
+
+
+def png_ridotto(percorso, larghezza):
+    """
+    Riduce un'immagine raster alla larghezza indicata (senza mai ingrandirla)
+    e la salva come PNG a palette, che per icone e loghi è molto più leggero.
+    """
+    from PIL import Image # Serve solo per le immagini senza variante SVG
+    with Image.open(percorso) as image:
+        image = image.convert("RGBA")
+    if image.width > larghezza:
+        altezza = round(image.height * larghezza / image.width)
+        image = image.resize((larghezza, altezza), Image.Resampling.LANCZOS)
+    # La quantizzazione a 256 colori mantiene la trasparenza (PNG a palette con canale alfa)
+    image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+class RegistroAsset:
+    """
+    Varianti delle immagini già pronte, condivise da tutte le sessioni del processo.
+    """
+
+    def __init__(self, cartella=DIR_ICONE, cartella_ridotte=DIR_RIDOTTE):
+        self.cartella = cartella
+        self.cartella_ridotte = cartella_ridotte
+        self._varianti = {} # (nome, larghezza) -> testo SVG o byte PNG
+        self._lock = threading.Lock()
+
+    def _prepara(self, nome, larghezza):
+        svg = os.path.join(self.cartella, f"{nome}.svg")
+        if os.path.exists(svg):
+            with open(svg, encoding="utf-8") as f:
+                return svg_ottimizzato(f.read())
+        sorgente = os.path.join(self.cartella, f"{nome}.png")
+        # Variante preparata in fase di build: basta leggerla, se è più recente dell'originale
+        ridotta = self.percorso_ridotta(nome, larghezza)
+        try:
+            if os.path.getmtime(ridotta) >= os.path.getmtime(sorgente):
+                with open(ridotta, "rb") as f:
+                    return f.read()
+        except OSError:
+            pass
+        return png_ridotto(sorgente, larghezza)
+
+    def percorso_ridotta(self, nome, larghezza):
+        return os.path.join(self.cartella_ridotte, f"{nome}_{larghezza}.png")
+
+    def prepara_ridotte(self, varianti=VARIANTI_RASTER):
+        """
+        Scrive su disco le varianti PNG indicate. Restituisce il numero di file scritti.
+        """
+        os.makedirs(self.cartella_ridotte, exist_ok=True)
+        for nome, larghezza in varianti:
+            dati = png_ridotto(os.path.join(self.cartella, f"{nome}.png"), larghezza)
+            with open(self.percorso_ridotta(nome, larghezza), "wb") as f:
+                f.write(dati)
+        return len(varianti)
+
+    def get(self, nome, larghezza):
+        """
+        Restituisce l'immagine "nome" di icons/ pronta per st.image(..., width=larghezza):
+        il testo SVG se esiste, altrimenti i byte del PNG ridotto.
+        """
+        chiave = (nome, larghezza)
+        with self._lock:
+            variante = self._varianti.get(chiave)
+        if variante is None:
+            # Preparata fuori dal lock: due sessioni al primo avvio la calcolano al più due volte
+            variante = self._prepara(nome, larghezza)
+            with self._lock:
+                self._varianti.setdefault(chiave, variante)
+        return variante
+
+    def statistiche(self):
+        with self._lock:
+            return {
+                "varianti": len(self._varianti),
+                "byte": sum(len(v) for v in self._varianti.values()),
+            }
+
+
+# Istanza condivisa da tutto il processo (tutte le sessioni Streamlit)
+_registro = RegistroAsset()
+
+def immagine(nome, larghezza):
+    """
+    Scorciatoia per leggere una variante dal registro condiviso.
+    """
+    return _registro.get(nome, larghezza)
+
+def statistiche_asset():
+    return _registro.statistiche()
+
+
+metrics.registra_statistiche("asset", statistiche_asset)
+
+
+if __name__ == "__main__":
+    print(f"Preparate {_registro.prepara_ridotte()} varianti in {DIR_RIDOTTE}.")
@@ -0,0 +1,83 @@
+"""
+Benchmark delle icone: quanto costa disegnare legenda dei bidoni, logo e un'icona
+del risultato a ogni rerun, prima (percorsi dei PNG originali passati a st.image)
+e dopo (varianti già pronte di assets.py).
+
+Per ogni versione riporta la durata mediana di un rerun dello script di prova
+(AppTest, headless) e i byte di immagine che Streamlit deve elaborare a ogni rerun.
+
+Uso:
+    python benchmarks/bench_asset.py [--ripetizioni 30]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(RADICE)
+sys.path.insert(0, RADICE)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+import assets  # noqa: E402
+
+ICONE_LEGENDA = ("blue", "yellow", "green", "brown", "grey", "red")
+
+# Le stesse chiamate di config.py e main.py prima e dopo l'introduzione di assets.py
+def pagina_prima():
+    import streamlit as st
+    st.image("./icons/logo_ecovision_highres.png", width=150)
+    for col, nome in zip(st.columns(6), ("blue", "yellow", "green", "brown", "grey", "red")):
+        with col:
+            st.image(f"./icons/{nome}.png", width=80)
+    st.image("./icons/yellow.png", width=120)
+
+
+def pagina_dopo():
+    import streamlit as st
+    import assets
+    st.image(assets.immagine("logo_ecovision_highres", assets.LARGHEZZA_LOGO), width=assets.LARGHEZZA_LOGO)
+    for col, nome in zip(st.columns(6), ("blue", "yellow", "green", "brown", "grey", "red")):
+        with col:
+            st.image(assets.immagine(nome, assets.LARGHEZZA_LEGENDA), width=assets.LARGHEZZA_LEGENDA)
+    st.image(assets.immagine("yellow", assets.LARGHEZZA_ICONA_RISULTATO), width=assets.LARGHEZZA_ICONA_RISULTATO)
+
+
+def byte_prima():
+    nomi = ["logo_ecovision_highres", *ICONE_LEGENDA, "yellow"]
+    return sum(os.path.getsize(os.path.join(assets.DIR_ICONE, f"{nome}.png")) for nome in nomi)
+
+
+def byte_dopo():
+    varianti = [assets.immagine("logo_ecovision_highres", assets.LARGHEZZA_LOGO)]
+    varianti += [assets.immagine(nome, assets.LARGHEZZA_LEGENDA) for nome in ICONE_LEGENDA]
+    varianti.append(assets.immagine("yellow", assets.LARGHEZZA_ICONA_RISULTATO))
+    return sum(len(v) for v in varianti)
+
+
+def misura(pagina, ripetizioni):
+    app = AppTest.from_function(pagina, default_timeout=60)
+    app.run() # primo rerun: prepara le varianti (una volta per processo)
+    durate = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        app.run()
+        durate.append((time.perf_counter() - inizio) * 1000)
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    return statistics.median(durate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ripetizioni", type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"{'versione':<10}{'rerun ms':>10}{'byte immagini':>16}")
+    print(f"{'prima':<10}{misura(pagina_prima, args.ripetizioni):>10.1f}{byte_prima():>16}")
+    print(f"{'dopo':<10}{misura(pagina_dopo, args.ripetizioni):>10.1f}{byte_dopo():>16}")
+
+
+if __name__ == "__main__":
+    main()
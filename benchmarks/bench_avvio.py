@@ -0,0 +1,166 @@
+"""
+Test di regressione dell'avvio a freddo: quanto impiega un nuovo processo
+(una nuova replica del container) a servire la prima pagina.
+
+Per ogni versione misura, ogni volta in un processo Python nuovo, e ne riporta la mediana:
+- l'importazione dei moduli dell'app Streamlit (oltre a streamlit, già caricato
+  dal server) e dell'API (vedi profilo_avvio.py);
+- la prima esecuzione di main.py con AppTest (headless), cioè quello che paga
+  il primo utente di una replica: importazioni, indici, icone, rendering;
+  per confronto anche la seconda esecuzione, a processo ormai caldo.
+Prima delle misure vengono eseguiti i passi di build del Dockerfile
+(python comuni_index.py, python assets.py).
+
+Il test termina con codice 1 se una mediana supera il suo limite oppure se all'avvio
+vengono caricate dipendenze pesanti che devono essere importate solo quando servono
+(google.genai, pydantic, PIL, geopy, ...).
+
+Con --confronta-con REV viene misurata anche una revisione git precedente.
+
+Uso:
+    python benchmarks/bench_avvio.py [--ripetizioni 7] [--limite-ms 200] [--limite-api-ms 400]
+                                     [--limite-primo-ms 800] [--confronta-con HEAD~1]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RADICE)
+
+import profilo_avvio  # noqa: E402
+
+# Passi di build del Dockerfile che preparano i file letti all'avvio
+PASSI_BUILD = ("comuni_index.py", "assets.py")
+
+# Eseguito in un processo nuovo: prima e seconda esecuzione di main.py con AppTest
+_CODICE_PRIMO_RERUN = """
+import json, os, sys, tempfile, time
+cartella = tempfile.mkdtemp(prefix="ecovision-avvio-")
+os.environ["ECOVISION_CACHE_DB"] = os.path.join(cartella, "analisi.sqlite3")
+os.environ["ECOVISION_KB_DB"] = os.path.join(cartella, "knowledge_base.sqlite3")
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(os.path.abspath("main.py"), default_timeout=120)
+durate = []
+for _ in range(2):
+    inizio = time.perf_counter()
+    app.run()
+    durate.append((time.perf_counter() - inizio) * 1000)
+eccezione = app.exception[0].message if app.exception else None
+print(json.dumps({"primo_ms": durate[0], "secondo_ms": durate[1], "eccezione": eccezione}))
+"""
+
+
+def prepara_build(radice):
+    """
+    Esegue i passi di build presenti nella revisione (come il Dockerfile).
+    """
+    for script in PASSI_BUILD:
+        if os.path.exists(os.path.join(radice, script)):
+            subprocess.run([sys.executable, script], cwd=radice, capture_output=True, check=True)
+
+
+def primo_rerun(radice):
+    esito = subprocess.run([sys.executable, "-c", _CODICE_PRIMO_RERUN], cwd=radice,
+                           capture_output=True, text=True, check=False)
+    if esito.returncode != 0:
+        raise RuntimeError(f"Esecuzione di main.py non riuscita:\n{esito.stderr[-2000:]}")
+    dati = json.loads(esito.stdout.strip().splitlines()[-1])
+    if dati["eccezione"]:
+        raise RuntimeError(f"main.py ha sollevato un'eccezione: {dati['eccezione']}")
+    return dati["primo_ms"], dati["secondo_ms"]
+
+
+def misura_rerun(ripetizioni, radice=RADICE):
+    """
+    Mediane della prima e della seconda esecuzione di main.py su più processi nuovi.
+    """
+    primo_rerun(radice) # primo avvio: compila i .pyc
+    misure = [primo_rerun(radice) for _ in range(ripetizioni)]
+    return statistics.median(m[0] for m in misure), statistics.median(m[1] for m in misure)
+
+
+def misura(api, ripetizioni, radice=RADICE):
+    """
+    Mediana dell'importazione dei moduli su più avvii a freddo, con l'ultimo profilo.
+    """
+    base, moduli = profilo_avvio.bersaglio(api, radice)
+    profilo_avvio.profila(base, moduli, radice) # primo avvio: compila i .pyc
+    profili = [profilo_avvio.profila(base, moduli, radice) for _ in range(ripetizioni)]
+    return statistics.median(p.moduli_ms for p in profili), profili[-1]
+
+
+def estrai_revisione(rev):
+    """
+    Copia in una cartella temporanea i file della revisione indicata.
+    """
+    cartella = tempfile.mkdtemp(prefix="ecovision-avvio-")
+    archivio = subprocess.run(["git", "archive", "--format=tar", rev], cwd=RADICE,
+                              capture_output=True, check=True).stdout
+    percorso_tar = os.path.join(cartella, "sorgenti.tar")
+    with open(percorso_tar, "wb") as f:
+        f.write(archivio)
+    with tarfile.open(percorso_tar) as tar:
+        tar.extractall(cartella, filter="data")
+    os.remove(percorso_tar)
+    return cartella
+
+
+def misura_tutto(ripetizioni, radice=RADICE):
+    prepara_build(radice)
+    return misura(False, ripetizioni, radice), misura(True, ripetizioni, radice), misura_rerun(ripetizioni, radice)
+
+
+def stampa(nome, app, api, rerun):
+    (app_ms, profilo_app), (api_ms, profilo_api) = app, api
+    caricate = sorted(set(profilo_app.caricate) | set(profilo_api.caricate))
+    print(f"{nome:<12}{app_ms:>10.0f}{api_ms:>10.0f}{rerun[0]:>12.0f}{rerun[1]:>12.0f}   {', '.join(caricate) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ripetizioni", type=int, default=7)
+    parser.add_argument("--limite-ms", type=float, default=200.0, help="limite per i moduli dell'app Streamlit")
+    parser.add_argument("--limite-api-ms", type=float, default=400.0, help="limite per l'API HTTP")
+    parser.add_argument("--limite-primo-ms", type=float, default=800.0,
+                        help="limite per la prima esecuzione di main.py in un processo nuovo")
+    parser.add_argument("--confronta-con", metavar="REV", help="revisione git da misurare per confronto")
+    args = parser.parse_args()
+
+    print(f"{'versione':<12}{'app ms':>10}{'api ms':>10}{'1° rerun ms':>12}{'2° rerun ms':>12}"
+          "   dipendenze pesanti all'avvio")
+    if args.confronta_con:
+        cartella = estrai_revisione(args.confronta_con)
+        try:
+            stampa(args.confronta_con, *misura_tutto(args.ripetizioni, cartella))
+        finally:
+            shutil.rmtree(cartella, ignore_errors=True)
+
+    app, api, rerun = misura_tutto(args.ripetizioni)
+    stampa("attuale", app, api, rerun)
+    print()
+    print(profilo_avvio.formatta(app[1], soglia_ms=2.0))
+
+    errori = []
+    if app[0] > args.limite_ms:
+        errori.append(f"l'app impiega {app[0]:.0f} ms ad avviarsi (limite {args.limite_ms:.0f} ms)")
+    if api[0] > args.limite_api_ms:
+        errori.append(f"l'API impiega {api[0]:.0f} ms ad avviarsi (limite {args.limite_api_ms:.0f} ms)")
+    if rerun[0] > args.limite_primo_ms:
+        errori.append(f"la prima pagina richiede {rerun[0]:.0f} ms (limite {args.limite_primo_ms:.0f} ms)")
+    for nome, (_, profilo) in (("app", app), ("API", api)):
+        if profilo.caricate:
+            errori.append(f"all'avvio dell'{nome} vengono caricate {', '.join(profilo.caricate)}")
+    for errore in errori:
+        print(f"ERRORE: {errore}")
+    return 1 if errori else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Benchmark della memoria della chat: token in ingresso e latenza per turno.
+
+Simula una conversazione lunga con il client Gemini finto (stub_genai.py) e
+confronta il vecchio prompt (contesto con indent=2 a ogni domanda, nessuna
+memoria) con SessioneChat (contesto una sola volta, storia entro il budget).
+Con la sessione i token per turno devono restare piatti, non crescere.
+
+Uso:
+    python benchmarks/bench_chat_sessione.py [--turni 30] [--latenza-ms 50] [--budget 1200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Il limitatore di frequenza dello scheduler non deve falsare le latenze del benchmark
+os.environ.setdefault("ECOVISION_GEMINI_RPS", "1000")
+os.environ.setdefault("ECOVISION_GEMINI_RAFFICA", "1000")
+os.chdir(RADICE)
+sys.path.insert(0, RADICE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_genai  # noqa: E402
+import metrics  # noqa: E402
+import core_engine  # noqa: E402
+from chat_session import SessioneChat  # noqa: E402
+
+DOMANDE = [
+    "Devo staccare l'etichetta?",
+    "E il tappo dove lo butto?",
+    "Posso lasciarci dentro un po' d'acqua?",
+    "Se la bottiglia è sporca di olio cosa faccio?",
+    "Vale lo stesso per le bottiglie colorate?",
+]
+
+
+def token_prompt_chat():
+    """
+    Token del prompt consumati finora dalla chat (dai contatori di metrics).
+    """
+    for riga in metrics.TOKEN_TOTALI.esporta():
+        if 'operazione="chat"' in riga and 'tipo="prompt"' in riga:
+            return int(riga.rsplit(" ", 1)[1])
+    return 0
+
+
+def prompt_precedente(domanda, contesto):
+    """
+    Il prompt della chat prima di SessioneChat: contesto indentato a ogni domanda, nessuna storia.
+    """
+    return f"""
+    Sei un assistente esperto di riciclo.
+    Dati dell'analisi:
+    {json.dumps(contesto, ensure_ascii=False, indent=2)}
+
+    Domanda utente: "{domanda}"
+
+    Rispondi in modo gentile e conciso. Riferisciti all'oggetto analizzato se pertinente.
+    """
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turni", type=int, default=30)
+    parser.add_argument("--latenza-ms", type=float, default=50)
+    parser.add_argument("--budget", type=int, default=1200, help="budget di token della storia")
+    args = parser.parse_args()
+
+    stub_genai.installa(latenza_ms=args.latenza_ms)
+    contesto = stub_genai.RISPOSTA_ANALISI
+    sessione = SessioneChat(contesto, budget_token=args.budget)
+    token_precedente = stub_genai._token_prompt(prompt_precedente(DOMANDE[0], contesto))
+
+    print(f"{'turno':>6}{'token prompt':>14}{'ms':>8}{'storia':>8}   (vecchio prompt: ~{token_precedente} token, senza memoria)")
+    for turno in range(1, args.turni + 1):
+        domanda = DOMANDE[(turno - 1) % len(DOMANDE)]
+        prima = token_prompt_chat()
+        inizio = time.perf_counter()
+        core_engine.get_chatbot_response(domanda, contesto, "chiave-finta", sessione)
+        durata = (time.perf_counter() - inizio) * 1000
+        print(f"{turno:>6}{token_prompt_chat() - prima:>14}{durata:>8.0f}{sessione.token_storia():>8}")
+
+
+if __name__ == "__main__":
+    main()
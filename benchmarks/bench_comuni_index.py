@@ -0,0 +1,71 @@
+"""
+Benchmark del caricamento della lista dei comuni a freddo.
+
+Confronta il vecchio percorso (pandas.read_json su comuniitaliani.json) con
+l'indice binario compatto (comuni_index.bin). Ogni misura gira in un processo
+Python nuovo, così include gli import e rispecchia l'avvio di un container.
+
+Uso:
+    python benchmarks/bench_comuni_index.py [--ripetizioni 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Ogni snippet stampa un JSON con durata (ms), RSS massimo (KB) e numero di comuni
+_MISURA = """
+import json, resource, time
+inizio = time.perf_counter()
+{codice}
+durata = (time.perf_counter() - inizio) * 1000
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"ms": durata, "rss_kb": rss, "comuni": len(lista)}}))
+"""
+
+PERCORSI = {
+    "pandas.read_json": """
+import pandas as pd
+df = pd.read_json("comuniitaliani.json", orient="index")
+lista = (df["comune"] + ", " + df["regione"] + ", Italy").sort_values().tolist()
+""",
+    "comuni_index.bin": """
+from comuni_index import get_indice_comuni
+lista = list(get_indice_comuni().etichette())
+""",
+}
+
+
+def esegui(codice):
+    uscita = subprocess.run(
+        [sys.executable, "-c", _MISURA.format(codice=codice)],
+        cwd=RADICE, capture_output=True, text=True, check=True,
+    )
+    return json.loads(uscita.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    args = parser.parse_args()
+
+    # Ci assicuriamo che l'indice sia compilato prima di misurarne il caricamento
+    subprocess.run([sys.executable, "comuni_index.py"], cwd=RADICE, check=True, capture_output=True)
+
+    print(f"{'percorso':<20}{'avvio ms (mediana)':>20}{'RSS MB':>10}{'comuni':>10}")
+    for nome, codice in PERCORSI.items():
+        try:
+            misure = [esegui(codice) for _ in range(args.ripetizioni)]
+        except subprocess.CalledProcessError as e:
+            print(f"{nome:<20}  non eseguibile: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        print(f"{nome:<20}{statistics.median(m['ms'] for m in misure):>20.1f}"
+              f"{statistics.median(m['rss_kb'] for m in misure) / 1024:>10.1f}{misure[0]['comuni']:>10}")
+
+
+if __name__ == "__main__":
+    main()
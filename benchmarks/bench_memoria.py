@@ -0,0 +1,139 @@
+"""
+Test di carico della memoria per sessione: simula molte sessioni utente
+(foto analizzata + conversazione con l'esperto) e misura la RSS del processo
+man mano che le sessioni crescono.
+
+Ogni sessione fa quello che fa main.py: preprocessa una foto, la analizza
+(client Gemini finto), registra l'analisi nel registro delle sessioni e pone
+alcune domande in chat. Le sessioni restano "aperte" (nessuna viene chiusa),
+come con molti utenti contemporanei.
+
+Con i limiti di session_store la RSS si stabilizza quando il registro è pieno;
+con --senza-limiti (nessun tetto al numero di sessioni né alla chat) cresce
+con il numero di sessioni. Il test termina con codice 1 se, con i limiti attivi,
+la RSS cresce più di --tolleranza-mb nella seconda metà del carico.
+
+Uso:
+    python benchmarks/bench_memoria.py [--sessioni 2000] [--max-sessioni 200] [--turni 10]
+"""
+import argparse
+import gc
+import io
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cache e base di conoscenza su file temporanei: il benchmark non tocca quelli dell'app
+_TEMPORANEA = tempfile.mkdtemp(prefix="ecovision-bench-")
+os.environ.setdefault("ECOVISION_CACHE_DB", os.path.join(_TEMPORANEA, "analisi.sqlite3"))
+os.environ.setdefault("ECOVISION_KB_DB", os.path.join(_TEMPORANEA, "knowledge_base.sqlite3"))
+# Nessun limite di frequenza: misuriamo la memoria, non lo scheduler
+os.environ.setdefault("ECOVISION_GEMINI_RPS", "1000000")
+os.environ.setdefault("ECOVISION_GEMINI_RAFFICA", "1000000")
+
+os.chdir(RADICE)
+sys.path.insert(0, RADICE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_genai  # noqa: E402
+import core_engine  # noqa: E402
+import session_store  # noqa: E402
+from image_preprocessing import preprocessa_immagine  # noqa: E402
+from knowledge_base import firma_immagine  # noqa: E402
+
+
+def rss_mb():
+    """
+    Memoria residente attuale del processo (Linux); altrove il picco di getrusage.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for riga in f:
+                if riga.startswith("VmRSS:"):
+                    return int(riga.split()[1]) / 1024
+    except OSError:
+        pass
+    picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return picco / (1024 * 1024) if sys.platform == "darwin" else picco / 1024
+
+
+def foto(i):
+    """
+    Foto sintetica da 1,2 MP, diversa per ogni sessione (niente risposte dalla cache).
+    """
+    rng = np.random.default_rng(i)
+    base = rng.integers(0, 255, (24, 32, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(base, "RGB").resize((1280, 960), Image.Resampling.NEAREST).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def sessione(registro, i, turni):
+    """
+    Una sessione utente completa, come in main.py.
+    """
+    stato = registro.get(f"sessione-{i}")
+    immagine = preprocessa_immagine(foto(i))
+    risultato = core_engine.analizza_immagine(immagine, "chiave-finta", "BARI, Puglia, Italy")
+    stato.nuova_analisi(risultato, firma_immagine(immagine))
+    registro.contabilizza(stato)
+    for turno in range(turni):
+        domanda = f"Domanda {turno}: devo staccare l'etichetta?"
+        stato.chat.append({"role": "user", "content": domanda})
+        risposta = core_engine.get_chatbot_response(domanda, risultato, "chiave-finta", stato.chat_sessione)
+        stato.chat.append({"role": "assistant", "content": risposta})
+        registro.contabilizza(stato)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessioni", type=int, default=2000)
+    parser.add_argument("--max-sessioni", type=int, default=200, help="limite del registro delle sessioni")
+    parser.add_argument("--turni", type=int, default=10, help="domande in chat per sessione")
+    parser.add_argument("--campioni", type=int, default=10, help="numero di misure della RSS")
+    parser.add_argument("--senza-limiti", action="store_true", help="nessun limite: comportamento precedente")
+    parser.add_argument("--tolleranza-mb", type=float, default=15.0)
+    args = parser.parse_args()
+
+    stub_genai.installa(latenza_ms=0, ttft_ms=0)
+    if args.senza_limiti:
+        registro = session_store.RegistroSessioni(max_sessioni=sys.maxsize, idle_secondi=float("inf"),
+                                                  max_byte_sessione=sys.maxsize, max_messaggi_chat=None)
+    else:
+        registro = session_store.RegistroSessioni(max_sessioni=args.max_sessioni)
+
+    passo = max(1, args.sessioni // args.campioni)
+    misure = []
+    print(f"{'sessioni':>9}{'nel registro':>14}{'stima MB':>10}{'RSS MB':>9}{'s':>7}")
+    inizio = time.perf_counter()
+    for i in range(args.sessioni):
+        sessione(registro, i, args.turni)
+        if (i + 1) % passo == 0 or i + 1 == args.sessioni:
+            gc.collect()
+            statistiche = registro.statistiche()
+            misure.append((i + 1, rss_mb()))
+            print(f"{i + 1:>9}{statistiche['attive']:>14}{statistiche['byte_totali'] / 2**20:>10.1f}"
+                  f"{misure[-1][1]:>9.1f}{time.perf_counter() - inizio:>7.1f}")
+
+    statistiche = registro.statistiche()
+    print(f"\nSessioni eliminate per limite: {statistiche['eliminate_limite']}, "
+          f"sessione più grande: {statistiche['byte_max_sessione'] / 1024:.0f} KB")
+
+    meta = misure[len(misure) // 2][1]
+    crescita = misure[-1][1] - meta
+    print(f"Crescita della RSS nella seconda metà del carico: {crescita:+.1f} MB")
+    if not args.senza_limiti and crescita > args.tolleranza_mb:
+        print(f"ERRORE: la RSS cresce più di {args.tolleranza_mb:.0f} MB a registro pieno")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Benchmark della pipeline di preprocessing delle immagini.
+
+Confronta, per ogni immagine del corpus, il payload che l'SDK invierebbe
+partendo dall'immagine originale con quello prodotto da preprocessa_immagine,
+riportando tempi di codifica, byte inviati e tempo di upload stimato.
+
+Uso:
+    python benchmarks/bench_preprocessing.py [cartella_immagini] [--banda-mbit 10]
+
+Senza cartella viene generato un piccolo corpus sintetico di foto "da smartphone".
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_preprocessing import FORMATO_OUTPUT, LATO_MAX_PX, QUALITA_OUTPUT, preprocessa_immagine  # noqa: E402
+
+ESTENSIONI = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def genera_corpus(cartella):
+    """
+    Crea alcune immagini sintetiche con dimensioni e formati tipici degli smartphone.
+    Il rumore rende la compressione realistica (un'immagine piatta si comprimerebbe troppo).
+    """
+    rng = np.random.default_rng(42)
+    formati = [
+        ("foto_12mp.jpg", (4032, 3024), "JPEG", {"quality": 95}),
+        ("foto_8mp.jpg", (3264, 2448), "JPEG", {"quality": 92}),
+        ("foto_ruotata.jpg", (3024, 4032), "JPEG", {"quality": 95}),
+        ("screenshot.png", (1170, 2532), "PNG", {}),
+        ("web.webp", (1600, 1200), "WEBP", {"quality": 90}),
+    ]
+    percorsi = []
+    for nome, (larghezza, altezza), formato, opzioni in formati:
+        gradiente = np.linspace(0, 255, larghezza, dtype=np.float32)[None, :, None]
+        rumore = rng.normal(0, 25, (altezza, larghezza, 3)).astype(np.float32)
+        pixel = np.clip(gradiente + rumore, 0, 255).astype(np.uint8)
+        image = Image.fromarray(pixel, "RGB")
+        if nome == "foto_ruotata.jpg":
+            # Orientamento EXIF 6: la foto va ruotata di 90° in fase di visualizzazione
+            exif = image.getexif()
+            exif[0x0112] = 6
+            opzioni = {**opzioni, "exif": exif.tobytes()}
+        percorso = os.path.join(cartella, nome)
+        image.save(percorso, format=formato, **opzioni)
+        percorsi.append(percorso)
+    return percorsi
+
+
+def payload_sdk(image):
+    """
+    Riproduce la conversione che l'SDK google-genai applica a un'immagine PIL
+    passata così com'è: PNG per immagini PNG/RGBA, altrimenti JPEG a piena risoluzione.
+    """
+    buffer = io.BytesIO()
+    if image.format == "PNG" or image.mode == "RGBA":
+        image.save(buffer, format="PNG")
+    else:
+        image.convert("RGB").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def misura(percorso, ripetizioni):
+    with open(percorso, "rb") as f:
+        dati = f.read()
+
+    tempi_sdk, tempi_pipeline = [], []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        originale = payload_sdk(Image.open(io.BytesIO(dati)))
+        tempi_sdk.append((time.perf_counter() - inizio) * 1000)
+
+        inizio = time.perf_counter()
+        ottimizzata = preprocessa_immagine(dati)
+        tempi_pipeline.append((time.perf_counter() - inizio) * 1000)
+
+    return {
+        "file": os.path.basename(percorso),
+        "bytes_file": len(dati),
+        "bytes_sdk": len(originale),
+        "bytes_pipeline": ottimizzata.bytes_finali,
+        "ms_sdk": statistics.median(tempi_sdk),
+        "ms_pipeline": statistics.median(tempi_pipeline),
+        "dimensioni": ottimizzata.dimensioni,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cartella", nargs="?", help="Cartella con le immagini di prova")
+    parser.add_argument("--banda-mbit", type=float, default=10.0, help="Banda in upload per stimare il tempo di invio")
+    parser.add_argument("--ripetizioni", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.cartella:
+            percorsi = sorted(
+                os.path.join(args.cartella, nome) for nome in os.listdir(args.cartella)
+                if nome.lower().endswith(ESTENSIONI)
+            )
+        else:
+            percorsi = genera_corpus(tmp)
+
+        byte_al_ms = args.banda_mbit * 1_000_000 / 8 / 1000
+        print(f"Pipeline: lato max {LATO_MAX_PX}px, {FORMATO_OUTPUT} q{QUALITA_OUTPUT}, banda {args.banda_mbit} Mbit/s\n")
+        print(f"{'file':<20}{'SDK KB':>10}{'pipe KB':>10}{'risparmio':>11}{'SDK ms':>10}{'pipe ms':>10}{'totale SDK':>12}{'totale pipe':>13}")
+
+        totale_sdk, totale_pipeline = 0.0, 0.0
+        bytes_sdk, bytes_pipeline = 0, 0
+        for percorso in percorsi:
+            r = misura(percorso, args.ripetizioni)
+            # Tempo totale stimato = codifica + upload alla banda indicata
+            t_sdk = r["ms_sdk"] + r["bytes_sdk"] / byte_al_ms
+            t_pipe = r["ms_pipeline"] + r["bytes_pipeline"] / byte_al_ms
+            totale_sdk += t_sdk
+            totale_pipeline += t_pipe
+            bytes_sdk += r["bytes_sdk"]
+            bytes_pipeline += r["bytes_pipeline"]
+            risparmio = 100 * (1 - r["bytes_pipeline"] / r["bytes_sdk"])
+            print(f"{r['file']:<20}{r['bytes_sdk'] / 1024:>10.0f}{r['bytes_pipeline'] / 1024:>10.0f}{risparmio:>10.1f}%"
+                  f"{r['ms_sdk']:>10.1f}{r['ms_pipeline']:>10.1f}{t_sdk:>12.0f}{t_pipe:>13.0f}")
+
+        if percorsi:
+            print(f"\nPayload totale: {bytes_sdk / 1024:.0f} KB -> {bytes_pipeline / 1024:.0f} KB "
+                  f"(-{100 * (1 - bytes_pipeline / bytes_sdk):.1f}%)")
+            print(f"Latenza stimata (codifica + upload): {totale_sdk:.0f} ms -> {totale_pipeline:.0f} ms "
+                  f"(-{100 * (1 - totale_pipeline / totale_sdk):.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
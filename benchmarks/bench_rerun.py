@@ -0,0 +1,139 @@
+"""
+Benchmark dei rerun di Streamlit dopo un'analisi: quanto costa un messaggio in chat
+o un clic nel pannello dei risultati.
+
+Lo script esegue main.py in modalità headless (AppTest) con il client Gemini finto,
+carica una foto, la analizza e poi ripete le interazioni. AppTest riesegue sempre
+l'intera pagina, quindi per la versione attuale riportiamo due misure:
+    pagina     durata di un rerun completo (quello che costava ogni interazione prima dei frammenti)
+    frammento  durata del solo frammento coinvolto (quello che costa ora nel browser)
+Con --confronta-con REV viene misurato anche il main.py di una revisione git precedente.
+
+Uso:
+    python benchmarks/bench_rerun.py [--ripetizioni 10] [--confronta-con HEAD~1]
+"""
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cache e base di conoscenza su file temporanei: il benchmark non tocca quelli dell'app
+_TEMPORANEA = tempfile.mkdtemp(prefix="ecovision-bench-")
+os.environ.setdefault("ECOVISION_CACHE_DB", os.path.join(_TEMPORANEA, "analisi.sqlite3"))
+os.environ.setdefault("ECOVISION_KB_DB", os.path.join(_TEMPORANEA, "knowledge_base.sqlite3"))
+
+os.chdir(RADICE)
+sys.path.insert(0, RADICE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("ECOVISION_GEMINI_RPS", "1000")
+os.environ.setdefault("ECOVISION_GEMINI_RAFFICA", "1000")
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+import stub_genai  # noqa: E402
+import metrics  # noqa: E402
+
+
+def foto_di_prova():
+    rng = np.random.default_rng(7)
+    base = rng.integers(0, 255, (48, 64, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(base, "RGB").resize((4032, 3024), Image.Resampling.BILINEAR).save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def durate(fase, **etichette):
+    """
+    Somma e conteggio delle osservazioni di una fase registrate finora da metrics.
+    """
+    chiave = tuple(sorted({"fase": fase, **etichette}.items()))
+    with metrics.DURATA_FASE._lock:
+        serie = metrics.DURATA_FASE._serie.get(chiave)
+        return (serie[1], serie[2]) if serie else (0.0, 0)
+
+
+def misura_frammento(nome, azione):
+    """
+    Esegue l'azione (un rerun) e restituisce la durata del frammento indicato, in ms.
+    """
+    somma, conteggio = durate("frammento", nome=nome)
+    azione()
+    nuova_somma, nuovo_conteggio = durate("frammento", nome=nome)
+    return (nuova_somma - somma) * 1000 if nuovo_conteggio > conteggio else float("nan")
+
+
+def sessione_analizzata(percorso_main, foto):
+    app = AppTest.from_file(percorso_main, default_timeout=120)
+    app.run()
+    app.file_uploader[0].set_value(("rifiuto.jpg", foto, "image/jpeg")).run()
+    next(b for b in app.button if b.label.startswith("Analizza")).click().run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return app
+
+
+def misura(percorso_main, foto, ripetizioni, frammenti):
+    app = sessione_analizzata(percorso_main, foto)
+    risultati = {"chat": {"pagina": [], "frammento": []}, "conferma": {"pagina": [], "frammento": []}}
+    for i in range(ripetizioni):
+        for interazione, nome_frammento, azione in (
+            ("chat", "chat", lambda: app.chat_input[0].set_value(f"Domanda {i}").run()),
+            ("conferma", "risultati", lambda: app.button(key="valida_risultato").click().run()),
+        ):
+            inizio = time.perf_counter()
+            if frammenti:
+                durata_frammento = misura_frammento(nome_frammento, azione)
+            else:
+                azione()
+                durata_frammento = float("nan")
+            risultati[interazione]["pagina"].append((time.perf_counter() - inizio) * 1000)
+            risultati[interazione]["frammento"].append(durata_frammento)
+            if app.exception:
+                raise RuntimeError(app.exception[0].message)
+    return risultati
+
+
+def stampa(etichetta, risultati):
+    for interazione, misure in risultati.items():
+        pagina = statistics.median(misure["pagina"])
+        frammento = statistics.median(misure["frammento"])
+        testo_frammento = "-" if frammento != frammento else f"{frammento:.1f}"
+        print(f"{etichetta:<16}{interazione:<10}{pagina:>14.1f}{testo_frammento:>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ripetizioni", type=int, default=10)
+    parser.add_argument("--latenza-ms", type=float, default=0, help="latenza del modello finto (0 = solo interfaccia)")
+    parser.add_argument("--confronta-con", metavar="REV", help="revisione git di main.py da misurare per confronto")
+    args = parser.parse_args()
+
+    stub_genai.installa(latenza_ms=args.latenza_ms, ttft_ms=0)
+    os.environ["GOOGLE_API_KEY"] = "chiave-finta"
+    foto = foto_di_prova()
+
+    print(f"{'versione':<16}{'azione':<10}{'pagina ms':>14}{'frammento ms':>16}")
+    if args.confronta_con:
+        sorgente = subprocess.run(["git", "show", f"{args.confronta_con}:main.py"], cwd=RADICE,
+                                  capture_output=True, text=True, check=True).stdout
+        # Il file sta nella radice del progetto perché main.py usa percorsi relativi
+        percorso = os.path.join(RADICE, ".bench_main_precedente.py")
+        with open(percorso, "w", encoding="utf-8") as f:
+            f.write(sorgente)
+        try:
+            stampa(args.confronta_con, misura(percorso, foto, args.ripetizioni, frammenti=False))
+        finally:
+            os.remove(percorso)
+    stampa("attuale", misura(os.path.join(RADICE, "main.py"), foto, args.ripetizioni, frammenti=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Suite di benchmark offline di EcoVision, con un client Gemini finto (stub_genai.py).
+
+Scenari:
+    analisi        core_engine.analizza_immagine su immagini sempre diverse (cache fredda)
+    analisi_cache  le stesse immagini analizzate di nuovo (risposte dalla cache)
+    chat           core_engine.get_chatbot_response
+    geo            geo_loader.carica_dati_geografici (senza la cache di Streamlit)
+    app            esecuzione headless di main.py con AppTest: avvio, ricerca e scelta del comune
+    api            POST /analizza su un server uvicorn locale (api.py), con connessioni keep-alive
+
+Ogni scenario gira con più richieste in parallelo e riporta throughput e
+latenze p50/p95/p99. I risultati si possono salvare come baseline e ogni
+esecuzione successiva viene confrontata con essa, scenario per scenario (le baseline
+dipendono dalla macchina: vanno rigenerate quando si cambia ambiente).
+Salvando la baseline di alcuni scenari (--scenari ... --salva-baseline) con gli
+stessi parametri, quelli degli altri scenari restano validi: un nuovo scenario
+si aggiunge senza rimisurare tutto.
+
+Uso:
+    python benchmarks/bench_suite.py [--richieste 40] [--concorrenza 4] [--latenza-ms 800]
+                                     [--tasso-errore 0.05] [--malformate 0.1]
+                                     [--scenari analisi chat] [--salva-baseline] [--tolleranza 25]
+"""
+import argparse
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DEFAULT = os.path.join(RADICE, "benchmarks", "baseline.json")
+SCENARI = ("analisi", "analisi_cache", "chat", "geo", "app", "api")
+# Scenari che restano sotto questa latenza (es. geo, in microsecondi) non si confrontano in percentuale:
+# bastano pochi millisecondi di rumore per moltiplicarne p95 e throughput
+RUMORE_P95_MS = 10.0
+
+# Cache e base di conoscenza su file temporanei: il benchmark non tocca quelli dell'app
+_TEMPORANEA = tempfile.mkdtemp(prefix="ecovision-bench-")
+os.environ.setdefault("ECOVISION_CACHE_DB", os.path.join(_TEMPORANEA, "analisi.sqlite3"))
+os.environ.setdefault("ECOVISION_KB_DB", os.path.join(_TEMPORANEA, "knowledge_base.sqlite3"))
+
+# L'app usa percorsi relativi alla radice del progetto
+os.chdir(RADICE)
+sys.path.insert(0, RADICE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_genai  # noqa: E402
+
+
+def percentile(valori, p):
+    """
+    Percentile con il metodo nearest-rank (valori già ordinati).
+    """
+    if not valori:
+        return float("nan")
+    indice = max(0, min(len(valori) - 1, int(round(p / 100 * len(valori) + 0.5)) - 1))
+    return valori[indice]
+
+
+def esegui_carico(operazione, richieste, concorrenza):
+    """
+    Esegue operazione(i) per i in range(richieste) con "concorrenza" thread.
+    Restituisce le statistiche dello scenario.
+    """
+    latenze, errori = [], 0
+
+    def _una(i):
+        inizio = time.perf_counter()
+        try:
+            operazione(i)
+            return time.perf_counter() - inizio, None
+        except Exception as e:
+            return time.perf_counter() - inizio, e
+
+    inizio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrenza) as executor:
+        for durata, errore in executor.map(_una, range(richieste)):
+            latenze.append(durata * 1000)
+            errori += errore is not None
+    totale = time.perf_counter() - inizio
+
+    latenze.sort()
+    return {
+        "richieste": richieste,
+        "concorrenza": concorrenza,
+        "errori": errori,
+        "throughput_rps": richieste / totale if totale else 0.0,
+        "p50_ms": percentile(latenze, 50),
+        "p95_ms": percentile(latenze, 95),
+        "p99_ms": percentile(latenze, 99),
+    }
+
+
+def genera_immagini(n, seed=42):
+    """
+    Foto sintetiche 12 MP tutte diverse (così la cache non interviene nello scenario a freddo).
+    """
+    rng = np.random.default_rng(seed)
+    immagini = []
+    for _ in range(n):
+        base = rng.integers(0, 255, (48, 64, 3), dtype=np.uint8)
+        image = Image.fromarray(base, "RGB").resize((4032, 3024), Image.Resampling.BILINEAR)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=92)
+        immagini.append(buffer.getvalue())
+    return immagini
+
+
+def scenario_analisi(args, immagini):
+    import core_engine
+    fallback = [] # list.append è atomica: niente lock tra i thread
+
+    def _analizza(i):
+        risultato = core_engine.analizza_immagine(immagini[i], "chiave-finta", "BARI, Puglia, Italy")
+        if risultato["oggetto_principale"] == "Errore Analisi":
+            fallback.append(i)
+
+    statistiche = esegui_carico(_analizza, len(immagini), args.concorrenza)
+    statistiche["fallback"] = len(fallback)
+    return statistiche
+
+
+def scenario_chat(args, _immagini):
+    import core_engine
+    contesto = stub_genai.RISPOSTA_ANALISI
+
+    def _chat(i):
+        metriche = {}
+        risposta = core_engine.get_chatbot_response("Devo staccare l'etichetta?", contesto, "chiave-finta",
+                                                    metriche=metriche)
+        # get_chatbot_response non solleva eccezioni: l'esito è in metriche["errore"]
+        # (errori del modello e risposte rapide a circuito aperto contano entrambi come errori)
+        if metriche["errore"]:
+            raise RuntimeError(risposta)
+
+    return esegui_carico(_chat, args.richieste, args.concorrenza)
+
+
+def scenario_geo(args, _immagini):
+    import geo_loader
+    # Misuriamo il caricamento vero e proprio, non la lettura dalla cache di Streamlit
+    funzione = geo_loader.carica_dati_geografici.__wrapped__
+    return esegui_carico(lambda i: funzione(), args.richieste, args.concorrenza)
+
+
+def scenario_app(args, _immagini):
+    from streamlit.testing.v1 import AppTest
+    os.environ["GOOGLE_API_KEY"] = "chiave-finta"
+
+    def _sessione(i):
+        # Una sessione utente: primo caricamento, ricerca del comune, scelta del comune
+        app = AppTest.from_file(os.path.join(RADICE, "main.py"), default_timeout=60)
+        app.run()
+        app.text_input(key="ricerca_citta").input("bari").run()
+        app.selectbox(key="select_citta_manuale").select_index(0).run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+
+    # Le sessioni AppTest sono pesanti: ne eseguiamo al massimo una ogni 4 richieste
+    return esegui_carico(_sessione, max(1, args.richieste // 4), args.concorrenza)
+
+
+def scenario_api(args, _immagini):
+    import httpx
+    import uvicorn
+    import api
+    os.environ["GOOGLE_API_KEY"] = "chiave-finta"
+    # Immagini diverse da quelle degli altri scenari: la cache non interviene
+    immagini = genera_immagini(args.richieste, args.seed + 1)
+
+    # Il server gira nello stesso processo, così usa anch'esso il client Gemini finto
+    with socket.socket() as libero:
+        libero.bind(("127.0.0.1", 0))
+        porta = libero.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=porta, log_level="warning",
+                                           timeout_keep_alive=api.API_KEEPALIVE_SECONDI))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Impossibile avviare il server sulla porta {porta}")
+        time.sleep(0.05)
+
+    # Un solo client condiviso: le connessioni restano aperte tra una richiesta e l'altra
+    client = httpx.Client(base_url=f"http://127.0.0.1:{porta}", timeout=120,
+                          limits=httpx.Limits(max_keepalive_connections=args.concorrenza))
+
+    def _richiesta(i):
+        risposta = client.post("/analizza", data={"codice_catasto": "A662"},
+                               files={"immagine": (f"foto_{i}.jpg", immagini[i], "image/jpeg")})
+        risposta.raise_for_status()
+
+    try:
+        return esegui_carico(_richiesta, len(immagini), args.concorrenza)
+    finally:
+        client.close()
+        server.should_exit = True
+        thread.join()
+
+
+ESECUTORI = {
+    "analisi": scenario_analisi,
+    "analisi_cache": scenario_analisi,
+    "chat": scenario_chat,
+    "geo": scenario_geo,
+    "app": scenario_app,
+    "api": scenario_api,
+}
+
+
+def confronta(risultati, baseline, tolleranza):
+    """
+    Stampa le variazioni rispetto alla baseline e restituisce gli scenari peggiorati oltre la tolleranza.
+    """
+    peggiorati = []
+    print(f"\nConfronto con la baseline (tolleranza {tolleranza:.0f}% su p95 e throughput)")
+    for nome, attuale in risultati.items():
+        precedente = baseline.get(nome)
+        if not precedente:
+            print(f"{nome:<15} non presente nella baseline (si aggiunge con --scenari {nome} --salva-baseline)")
+            continue
+        if "errore" in attuale or "errore" in precedente:
+            continue
+        delta_p95 = 100 * (attuale["p95_ms"] / precedente["p95_ms"] - 1) if precedente["p95_ms"] else 0.0
+        delta_rps = 100 * (attuale["throughput_rps"] / precedente["throughput_rps"] - 1) if precedente["throughput_rps"] else 0.0
+        rumore = max(attuale["p95_ms"], precedente["p95_ms"]) < RUMORE_P95_MS
+        peggiorato = not rumore and (delta_p95 > tolleranza or delta_rps < -tolleranza)
+        esito = "   PEGGIORATO" if peggiorato else f"   (sotto {RUMORE_P95_MS:.0f} ms: rumore)" if rumore else ""
+        print(f"{nome:<15} p95 {delta_p95:+7.1f}%   throughput {delta_rps:+7.1f}%{esito}")
+        if peggiorato:
+            peggiorati.append(nome)
+    return peggiorati
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenari", nargs="+", choices=SCENARI, default=list(SCENARI))
+    parser.add_argument("--richieste", type=int, default=40)
+    parser.add_argument("--concorrenza", type=int, default=4)
+    parser.add_argument("--latenza-ms", type=float, default=800, help="latenza media simulata di Gemini")
+    parser.add_argument("--jitter-ms", type=float, default=150, help="deviazione standard della latenza")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="tempo al primo token in streaming")
+    parser.add_argument("--tasso-errore", type=float, default=0.0, help="frazione di chiamate che falliscono con 503")
+    parser.add_argument("--malformate", type=float, default=0.0, help="frazione di risposte con JSON non valido")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=BASELINE_DEFAULT)
+    parser.add_argument("--salva-baseline", action="store_true", help="sovrascrive la baseline con questi risultati")
+    parser.add_argument("--tolleranza", type=float, default=25.0, help="peggioramento massimo accettato (%%)")
+    parser.add_argument("--json", help="salva i risultati di questa esecuzione nel file indicato")
+    args = parser.parse_args()
+
+    risposte = {
+        "valida": max(0.0, 1 - args.malformate),
+        "malformata": args.malformate,
+    }
+    ripristina = stub_genai.installa(
+        latenza_ms=args.latenza_ms, jitter_ms=args.jitter_ms, tasso_errore=args.tasso_errore,
+        risposte={tipo: peso for tipo, peso in risposte.items() if peso > 0},
+        ttft_ms=args.ttft_ms, seed=args.seed,
+    )
+
+    immagini = genera_immagini(args.richieste, args.seed) if {"analisi", "analisi_cache"} & set(args.scenari) else []
+    if "analisi_cache" in args.scenari and "analisi" not in args.scenari:
+        # Senza lo scenario a freddo la cache va riempita prima di misurarla
+        scenario_analisi(args, immagini)
+
+    risultati = {}
+    print(f"{'scenario':<15}{'richieste':>10}{'errori':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    try:
+        for nome in SCENARI:
+            if nome not in args.scenari:
+                continue
+            try:
+                statistiche = ESECUTORI[nome](args, immagini)
+            except ImportError as e:
+                # Es. streamlit_js_eval non installato: lo scenario viene saltato
+                risultati[nome] = {"errore": str(e)}
+                print(f"{nome:<15}  non eseguibile: {e}")
+                continue
+            risultati[nome] = statistiche
+            print(f"{nome:<15}{statistiche['richieste']:>10}{statistiche['errori']:>8}"
+                  f"{statistiche['throughput_rps']:>9.1f}{statistiche['p50_ms']:>10.1f}"
+                  f"{statistiche['p95_ms']:>10.1f}{statistiche['p99_ms']:>10.1f}")
+    finally:
+        ripristina()
+
+    esecuzione = {
+        "data": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        # Parametri che influenzano le misure: la scelta degli scenari non ne fa parte
+        "parametri": {chiave: valore for chiave, valore in vars(args).items()
+                      if chiave not in ("scenari", "baseline", "salva_baseline", "tolleranza", "json")},
+        "scenari": risultati,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(esecuzione, f, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.salva_baseline:
+        if baseline and baseline.get("parametri") == esecuzione["parametri"]:
+            # Stessi parametri: gli scenari non eseguiti ora mantengono la misura precedente
+            esecuzione["scenari"] = {**baseline.get("scenari", {}), **risultati}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(esecuzione, f, indent=2)
+        print(f"\nBaseline salvata in {args.baseline}")
+        return 0
+
+    if baseline:
+        if baseline.get("parametri") != esecuzione["parametri"]:
+            print("\nAttenzione: la baseline è stata registrata con parametri diversi.")
+        if confronta(risultati, baseline.get("scenari", {}), args.tolleranza):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
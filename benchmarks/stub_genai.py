@@ -0,0 +1,198 @@
+"""
+Sostituto locale del client google-genai per i benchmark offline.
+
+Il client finto risponde come Gemini (stessi tipi di risposta dell'SDK, con
+usage_metadata) ma senza rete né chiave API: latenza, tasso di errore e tipo di
+risposta sono configurabili, così si possono misurare le parti dell'app che
+stanno intorno alla chiamata al modello.
+
+Uso:
+    import stub_genai
+    stub_genai.installa(latenza_ms=800, tasso_errore=0.05, risposte={"valida": 8, "malformata": 1})
+"""
+import json
+import random
+import threading
+import time
+
+from google.genai import errors, types
+
+import genai_pool
+
+# Risposta di analisi valida, nel formato richiesto dal prompt di core_engine
+RISPOSTA_ANALISI = {
+    "oggetto_principale": "Bottiglia d'acqua",
+    "materiali": "Plastica (PET) e tappo in plastica",
+    "azione": "Svuota e schiaccia la bottiglia",
+    "note": "Il tappo può restare avvitato.",
+    "componenti": [
+        {"nome": "Bottiglia", "destinazione": "Plastica"},
+        {"nome": "Tappo", "destinazione": "Plastica"},
+    ],
+}
+
+RISPOSTA_CHAT = (
+    "Sì, puoi lasciare l'etichetta: viene separata negli impianti di riciclo. "
+    "Ricordati solo di svuotare e schiacciare la bottiglia prima di buttarla nella plastica."
+)
+
+# Tipi di risposta dell'analisi:
+#   valida     JSON puro
+#   malformata JSON troncato (fa scattare la riparazione o il fallback)
+# Analisi e riparazioni chiedono sempre response_schema, quindi come nel servizio reale
+# non arrivano blocchi ```json, ma una risposta può comunque arrivare troncata.
+TIPI_RISPOSTA = ("valida", "malformata")
+
+
+def _testo_analisi(tipo):
+    testo = json.dumps(RISPOSTA_ANALISI, ensure_ascii=False)
+    if tipo == "valida":
+        return testo
+    if tipo == "malformata":
+        return testo[:len(testo) // 2]
+    raise ValueError(f"Tipo di risposta sconosciuto: {tipo}")
+
+
+def _risposta(testo, token_prompt, schema=None):
+    token_risposta = max(1, len(testo) // 4)
+    risposta = types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=testo)]))],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=token_prompt,
+            candidates_token_count=token_risposta,
+            total_token_count=token_prompt + token_risposta,
+        ),
+    )
+    # Come l'SDK: con uno schema Pydantic la risposta valida viene anche convertita in response.parsed
+    if schema is not None:
+        try:
+            risposta.parsed = schema.model_validate_json(testo)
+        except ValueError:
+            pass
+    return risposta
+
+
+def _parti(contents):
+    """
+    Appiattisce contents (stringhe, Part, Content) in una lista di stringhe e Part non testuali.
+    """
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    parti = []
+    for elemento in contents:
+        if isinstance(elemento, types.Content):
+            parti.extend(_parti(elemento.parts or []))
+        elif isinstance(elemento, types.Part) and elemento.text is not None:
+            parti.append(elemento.text)
+        else:
+            parti.append(elemento)
+    return parti
+
+
+def _contiene_immagine(contents):
+    return any(not isinstance(parte, str) for parte in _parti(contents))
+
+
+def _token_prompt(contents, config=None):
+    """
+    Stima grossolana dei token del prompt: ~4 caratteri per token,
+    258 token per ogni immagine (come conteggia Gemini per le immagini piccole).
+    Conta anche l'istruzione di sistema, che Gemini fattura come parte del prompt.
+    """
+    parti = _parti(contents)
+    istruzioni = getattr(config, "system_instruction", None)
+    if istruzioni:
+        parti += _parti(istruzioni)
+    token = 0
+    for parte in parti:
+        if isinstance(parte, str):
+            token += len(parte) // 4
+        else:
+            token += 258
+    return max(1, token)
+
+
+class ModelsStub:
+    """
+    Imita client.models: generate_content e generate_content_stream.
+    """
+
+    def __init__(self, latenza_ms, jitter_ms, tasso_errore, risposte, ttft_ms, chunk, rng):
+        self.latenza_ms = latenza_ms
+        self.jitter_ms = jitter_ms
+        self.tasso_errore = tasso_errore
+        self.risposte = risposte
+        self.ttft_ms = ttft_ms
+        self.chunk = chunk
+        self._rng = rng
+        self._lock = threading.Lock()
+        self.chiamate = 0
+
+    def _estrai(self):
+        # random.Random non è thread-safe per sequenze riproducibili: estraiamo tutto sotto lock
+        with self._lock:
+            self.chiamate += 1
+            latenza = max(0.0, self._rng.gauss(self.latenza_ms, self.jitter_ms)) if self.jitter_ms else self.latenza_ms
+            errore = self._rng.random() < self.tasso_errore
+            tipo = self._rng.choices(list(self.risposte), weights=list(self.risposte.values()))[0]
+        return latenza / 1000, errore, tipo
+
+    def _errore(self):
+        return errors.ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE",
+                                                  "message": "Errore simulato dallo stub"}})
+
+    def generate_content(self, model, contents, config=None):
+        latenza, errore, tipo = self._estrai()
+        time.sleep(latenza)
+        if errore:
+            raise self._errore()
+        schema = getattr(config, "response_schema", None)
+        # Le richieste con un'immagine o con uno schema sono analisi (o riparazioni), le altre chat
+        analisi = schema is not None or _contiene_immagine(contents)
+        testo = _testo_analisi(tipo) if analisi else RISPOSTA_CHAT
+        return _risposta(testo, _token_prompt(contents, config), schema)
+
+    def generate_content_stream(self, model, contents, config=None):
+        latenza, errore, _ = self._estrai()
+        time.sleep(min(latenza, self.ttft_ms / 1000))
+        if errore:
+            raise self._errore()
+        parole = RISPOSTA_CHAT.split(" ")
+        passo = max(1, len(parole) // self.chunk)
+        pezzi = [" ".join(parole[i:i + passo]) + " " for i in range(0, len(parole), passo)]
+        pausa = max(0.0, latenza - self.ttft_ms / 1000) / len(pezzi)
+        for i, pezzo in enumerate(pezzi):
+            if i:
+                time.sleep(pausa)
+            yield _risposta(pezzo, _token_prompt(contents, config))
+
+
+class ClientStub:
+    def __init__(self, latenza_ms=800, jitter_ms=0, tasso_errore=0.0, risposte=None,
+                 ttft_ms=300, chunk=8, seed=None):
+        risposte = risposte or {"valida": 1}
+        for tipo in risposte:
+            if tipo not in TIPI_RISPOSTA:
+                raise ValueError(f"Tipo di risposta sconosciuto: {tipo}")
+        self.models = ModelsStub(latenza_ms, jitter_ms, tasso_errore, risposte, ttft_ms, chunk,
+                                 random.Random(seed))
+
+    def close(self):
+        pass
+
+
+def installa(**opzioni):
+    """
+    Fa sì che il pool condiviso restituisca client finti al posto di genai.Client.
+    Le opzioni vengono passate a ClientStub. Restituisce la funzione che ripristina il client reale.
+    """
+    pool = genai_pool._pool
+    factory_originale = pool.factory
+    pool.chiudi_tutti()
+    pool.factory = lambda api_key: ClientStub(**opzioni)
+
+    def ripristina():
+        pool.chiudi_tutti()
+        pool.factory = factory_originale
+
+    return ripristina
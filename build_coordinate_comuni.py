@@ -0,0 +1,225 @@
+"""
+Genera comuni_coordinate.csv: per ogni comune presente in comuniitaliani.json
+un punto (lat, lon) e i confini semplificati del territorio, usati dal reverse
+geocoding offline (geo_index.py).
+
+Le sorgenti sono:
+- i confini dei comuni ISTAT in GeoJSON, con il codice catastale nella proprietà
+  com_catasto_code (es. limits_IT_municipalities.geojson di Openpolis, geojson-italy,
+  licenza CC BY 4.0);
+- un CSV in formato GeoNames "cities1000" con colonne lat,lon,name,admin1,admin2,cc
+  (es. il file rg_cities1000.csv distribuito con il pacchetto reverse_geocoder).
+  Dati GeoNames, licenza CC BY 4.0.
+
+Il punto è il centro abitato di GeoNames, se cade dentro i confini del comune,
+altrimenti un punto interno al territorio. I confini sono semplificati entro
+TOLLERANZA_GRADI (Douglas-Peucker) e codificati con comuni_index.codifica_confini.
+I pochi comuni senza confini (es. comuni fusi dopo la data dell'elenco) hanno
+solo il punto di GeoNames.
+
+Uso:
+    python build_coordinate_comuni.py percorso/rg_cities1000.csv percorso/limits_IT_municipalities.geojson
+"""
+import csv
+import json
+import math
+import sys
+from collections import defaultdict
+
+from city_search import normalizza
+from comuni_index import codifica_confini
+
+FILE_COMUNI = "comuniitaliani.json"
+FILE_OUTPUT = "comuni_coordinate.csv"
+
+# Scarto massimo dei confini semplificati da quelli originali (~50 m)
+TOLLERANZA_GRADI = 0.0005
+
+# GeoNames usa i nomi inglesi delle regioni
+REGIONI_GEONAMES = {
+    "Abruzzo": "Abruzzo",
+    "Aosta Valley": "Valle d'Aosta/Vallée d'Aoste",
+    "Apulia": "Puglia",
+    "Basilicate": "Basilicata",
+    "Calabria": "Calabria",
+    "Campania": "Campania",
+    "Emilia-Romagna": "Emilia-Romagna",
+    "Friuli Venezia Giulia": "Friuli-Venezia Giulia",
+    "Latium": "Lazio",
+    "Liguria": "Liguria",
+    "Lombardy": "Lombardia",
+    "Molise": "Molise",
+    "Piedmont": "Piemonte",
+    "Sardinia": "Sardegna",
+    "Sicily": "Sicilia",
+    "The Marches": "Marche",
+    "Trentino-Alto Adige": "Trentino-Alto Adige/Südtirol",
+    "Tuscany": "Toscana",
+    "Umbria": "Umbria",
+    "Veneto": "Veneto",
+}
+
+# Alcune città compaiono in GeoNames con il nome inglese
+ESONIMI = {
+    "rome": "roma",
+    "turin": "torino",
+    "milan": "milano",
+    "naples": "napoli",
+    "venice": "venezia",
+    "genoa": "genova",
+    "florence": "firenze",
+    "padua": "padova",
+    "mantua": "mantova",
+    "syracuse": "siracusa",
+    "leghorn": "livorno",
+}
+
+
+def carica_confini(percorso):
+    """
+    Confini dei comuni dal GeoJSON: codice catastale -> lista di poligoni,
+    ognuno come lista di anelli di coppie (lon, lat); il primo anello è il bordo esterno.
+    """
+    with open(percorso, encoding="utf-8") as f:
+        geojson = json.load(f)
+    confini = {}
+    for feature in geojson["features"]:
+        geometria = feature["geometry"]
+        poligoni = geometria["coordinates"] if geometria["type"] == "MultiPolygon" else [geometria["coordinates"]]
+        confini[feature["properties"]["com_catasto_code"]] = poligoni
+    return confini
+
+
+def contiene(poligoni, lon, lat):
+    """
+    Ray casting: True se il punto è dentro il territorio (buchi esclusi).
+    """
+    dentro = False
+    for poligono in poligoni:
+        for anello in poligono:
+            for (x1, y1), (x2, y2) in zip(anello, anello[1:] + anello[:1]):
+                if (y1 > lat) != (y2 > lat) and lon < (x2 - x1) * (lat - y1) / (y2 - y1) + x1:
+                    dentro = not dentro
+    return dentro
+
+
+def punto_interno(poligoni):
+    """
+    Baricentro del poligono più grande; se cade fuori (territori a forma di C o di L)
+    il centro del tratto interno più lungo sul parallelo del baricentro.
+    """
+    def area_e_baricentro(anello):
+        area = cx = cy = 0.0
+        for (x1, y1), (x2, y2) in zip(anello, anello[1:] + anello[:1]):
+            prodotto = x1 * y2 - x2 * y1
+            area += prodotto
+            cx += (x1 + x2) * prodotto
+            cy += (y1 + y2) * prodotto
+        return abs(area) / 2, (cx / (3 * area), cy / (3 * area)) if area else anello[0]
+
+    area, (lon, lat) = max((area_e_baricentro(p[0]) for p in poligoni), key=lambda a: a[0])
+    if contiene(poligoni, lon, lat):
+        return lon, lat
+    intersezioni = sorted(
+        x1 + (x2 - x1) * (lat - y1) / (y2 - y1)
+        for poligono in poligoni for anello in poligono
+        for (x1, y1), (x2, y2) in zip(anello, anello[1:] + anello[:1])
+        if (y1 > lat) != (y2 > lat)
+    )
+    tratti = list(zip(intersezioni[::2], intersezioni[1::2]))
+    inizio, fine = max(tratti, key=lambda t: t[1] - t[0])
+    return (inizio + fine) / 2, lat
+
+
+def semplifica(anello, tolleranza=TOLLERANZA_GRADI):
+    """
+    Douglas-Peucker su un anello chiuso: tiene i vertici che si discostano
+    più della tolleranza dalla linea semplificata.
+    """
+    if anello[0] == anello[-1]:
+        anello = anello[:-1]
+    if len(anello) < 4:
+        return anello
+    # L'anello è diviso in due linee al vertice più lontano dal primo
+    x0, y0 = anello[0]
+    lontano = max(range(len(anello)), key=lambda i: (anello[i][0] - x0) ** 2 + (anello[i][1] - y0) ** 2)
+    tenuti = {0, lontano, len(anello) - 1}
+    da_visitare = [(0, lontano), (lontano, len(anello) - 1)]
+    while da_visitare:
+        inizio, fine = da_visitare.pop()
+        if fine - inizio < 2:
+            continue
+        (x1, y1), (x2, y2) = anello[inizio], anello[fine]
+        lunghezza = math.hypot(x2 - x1, y2 - y1)
+        scarto, peggiore = max(
+            (abs((y2 - y1) * (x - x1) - (x2 - x1) * (y - y1)) / lunghezza if lunghezza else math.hypot(x - x1, y - y1), i)
+            for i, (x, y) in enumerate(anello[inizio + 1:fine], inizio + 1)
+        )
+        if scarto > tolleranza:
+            tenuti.add(peggiore)
+            da_visitare += [(inizio, peggiore), (peggiore, fine)]
+    return [anello[i] for i in sorted(tenuti)]
+
+
+def main(percorso_sorgente, percorso_confini):
+    confini = carica_confini(percorso_confini)
+    with open(FILE_COMUNI, encoding="utf-8") as f:
+        comuni = json.load(f)
+
+    # Indicizziamo i luoghi GeoNames italiani per (nome normalizzato, regione)
+    luoghi = defaultdict(list)
+    with open(percorso_sorgente, encoding="utf-8") as f:
+        for riga in csv.DictReader(f):
+            if riga["cc"] != "IT" or riga["admin1"] not in REGIONI_GEONAMES:
+                continue
+            nome = normalizza(riga["name"])
+            chiave = (ESONIMI.get(nome, nome), REGIONI_GEONAMES[riga["admin1"]])
+            luoghi[chiave].append(riga)
+
+    trovati, mancanti, senza_confini = [], [], []
+    for dati in comuni.values():
+        # I comuni bilingui (es. "BOLZANO/BOZEN") vengono cercati con ciascuno dei due nomi
+        candidati = []
+        for nome in dati["comune"].split("/"):
+            candidati += luoghi.get((normalizza(nome), dati["regione"]), [])
+        # A parità di nome preferiamo il luogo nella stessa provincia
+        provincia = normalizza(dati["provincia"])
+        scelto = next((c for c in candidati if provincia and provincia in normalizza(c["admin2"])),
+                      candidati[0] if candidati else None)
+        centro = (float(scelto["lon"]), float(scelto["lat"])) if scelto else None
+
+        poligoni = confini.get(dati["codice_catasto"])
+        if poligoni:
+            # Un omonimo di GeoNames fuori dal territorio non è il centro del comune
+            if centro is None or not contiene(poligoni, *centro):
+                centro = punto_interno(poligoni)
+            # Anelli come (lat, lon); esterni e buchi insieme: la ricerca usa la regola pari/dispari
+            anelli = [[(lat, lon) for lon, lat in semplifica(anello)] for poligono in poligoni for anello in poligono]
+            codificati = codifica_confini([anello for anello in anelli if len(anello) >= 3])
+        elif centro:
+            senza_confini.append(dati["comune"])
+            codificati = ""
+        else:
+            mancanti.append(dati["comune"])
+            continue
+        trovati.append((dati["codice_catasto"], round(centro[1], 5), round(centro[0], 5), codificati))
+
+    trovati.sort()
+    with open(FILE_OUTPUT, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["codice_catasto", "lat", "lon", "confini"])
+        writer.writerows(trovati)
+
+    print(f"Scritti {len(trovati)} comuni in {FILE_OUTPUT} "
+          f"({len(senza_confini)} senza confini, {len(mancanti)} senza coordinate).")
+    for nome in senza_confini:
+        print(f"  senza confini: {nome}")
+    for nome in mancanti:
+        print(f"  senza coordinate: {nome}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2])
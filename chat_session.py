@@ -0,0 +1,143 @@
+import json # Contesto dell'analisi in forma compatta
+import os # Variabili d'ambiente
+import threading # Compressione in background mentre arriva la domanda successiva
+
+# Token massimi per la storia della conversazione inviata a ogni domanda
+BUDGET_TOKEN_STORIA = int(os.environ.get("ECOVISION_CHAT_BUDGET_TOKEN", 1200))
+# Quando il budget viene superato la storia viene ridotta fino a questa frazione,
+# così la compressione non scatta a ogni domanda
+FRAZIONE_DOPO_COMPRESSIONE = 0.5
+# "riassunto": i turni più vecchi diventano un riassunto; "troncamento": vengono scartati
+STRATEGIA_COMPRESSIONE = os.environ.get("ECOVISION_CHAT_STRATEGIA", "riassunto")
+# Lunghezza massima del riassunto, in parole
+PAROLE_RIASSUNTO = 120
+
+
+def stima_token(testo):
+    """
+    Stima locale dei token di un testo (~4 caratteri per token in italiano):
+    evita una chiamata a count_tokens per ogni messaggio.
+    """
+    return len(testo) // 4 + 1
+
+
+class SessioneChat:
+    """
+    Conversazione con l'esperto su un'analisi.
+    Il contesto dell'analisi viene inviato una sola volta come istruzione di sistema,
+    sempre identica: è un prefisso stabile che Gemini può riutilizzare con la cache implicita.
+    (La cache esplicita, client.caches, richiede un prefisso di almeno 1024 token:
+    il contesto di un'analisi è molto più corto, quindi non conviene crearla.)
+    La storia resta entro BUDGET_TOKEN_STORIA riassumendo o scartando i turni più vecchi,
+    quindi i token in ingresso non crescono con la lunghezza della conversazione.
+    La compressione può girare in un altro thread: il riassunto viene chiesto
+    senza bloccare la sessione e i turni arrivati nel frattempo restano.
+    """
+
+    def __init__(self, contesto, budget_token=BUDGET_TOKEN_STORIA, strategia=STRATEGIA_COMPRESSIONE):
+        self.contesto = contesto
+        self.budget_token = budget_token
+        self.strategia = strategia
+        self.turni = [] # [{"ruolo": "user" | "model", "testo": ...}]
+        self.riassunto = ""
+        self._lock = threading.RLock()
+        self._in_compressione = False
+        # JSON compatto: nessuna indentazione né spazi superflui
+        contesto_json = json.dumps(contesto, ensure_ascii=False, separators=(",", ":"))
+        self.istruzioni = (
+            "Sei un assistente esperto di riciclo. Rispondi in modo gentile e conciso, "
+            "riferendoti all'oggetto analizzato se pertinente.\n"
+            f"Dati dell'analisi: {contesto_json}"
+        )
+
+    def token_storia(self):
+        return stima_token(self.riassunto) + sum(stima_token(turno["testo"]) for turno in self.turni)
+
+    def contenuti(self, domanda):
+        """
+        Messaggi da inviare per la nuova domanda: riassunto, turni recenti e domanda.
+        """
+        from google.genai import types # Caricato alla prima domanda, non all'avvio
+        with self._lock:
+            riassunto, turni = self.riassunto, list(self.turni)
+        contenuti = []
+        if riassunto:
+            contenuti.append(types.Content(role="user", parts=[types.Part(text=f"Riassunto della conversazione finora: {riassunto}")]))
+            contenuti.append(types.Content(role="model", parts=[types.Part(text="D'accordo, ne terrò conto.")]))
+        for turno in turni:
+            contenuti.append(types.Content(role=turno["ruolo"], parts=[types.Part(text=turno["testo"])]))
+        contenuti.append(types.Content(role="user", parts=[types.Part(text=domanda)]))
+        return contenuti
+
+    def registra_turno(self, domanda, risposta):
+        with self._lock:
+            self.turni.append({"ruolo": "user", "testo": domanda})
+            self.turni.append({"ruolo": "model", "testo": risposta})
+
+    def da_comprimere(self):
+        """
+        Restituisce i turni più vecchi da togliere per rientrare nel budget
+        (a coppie domanda/risposta), oppure una lista vuota se il budget è rispettato.
+        """
+        with self._lock:
+            return self._da_comprimere()
+
+    def _da_comprimere(self):
+        if self.token_storia() <= self.budget_token:
+            return []
+        obiettivo = self.budget_token * FRAZIONE_DOPO_COMPRESSIONE
+        totale = self.token_storia()
+        n = 0
+        # Teniamo sempre almeno l'ultima coppia domanda/risposta
+        while totale > obiettivo and n < len(self.turni) - 2:
+            totale -= stima_token(self.turni[n]["testo"]) + stima_token(self.turni[n + 1]["testo"])
+            n += 2
+        return self.turni[:n]
+
+    def comprimi(self, riassumi=None):
+        """
+        Riporta la storia entro il budget. Con la strategia "riassunto" i turni
+        tolti vengono passati a riassumi(riassunto_precedente, turni) -> nuovo riassunto;
+        se riassumi manca o fallisce, i turni vengono semplicemente scartati.
+        La chiamata a riassumi avviene senza tenere il lock; se un'altra compressione
+        è già in corso questa non fa nulla.
+        """
+        with self._lock:
+            if self._in_compressione:
+                return False
+            vecchi = self._da_comprimere()
+            if not vecchi:
+                return False
+            self._in_compressione = True
+            riassunto = self.riassunto
+        try:
+            if self.strategia == "riassunto" and riassumi is not None:
+                try:
+                    riassunto = riassumi(riassunto, vecchi)
+                except Exception as e:
+                    print(f"Errore riassunto della chat, i turni più vecchi vengono scartati: {e}")
+            # Anche il riassunto ha un limite: se da solo supera il budget lo tronchiamo
+            limite = self.budget_token * FRAZIONE_DOPO_COMPRESSIONE * 4
+            if len(riassunto) > limite:
+                riassunto = riassunto[-int(limite):]
+            with self._lock:
+                # I turni tolti sono sempre i primi: quelli registrati nel frattempo restano
+                del self.turni[:len(vecchi)]
+                self.riassunto = riassunto
+        finally:
+            with self._lock:
+                self._in_compressione = False
+        return True
+
+
+def prompt_riassunto(riassunto, turni):
+    """
+    Prompt per riassumere i turni più vecchi insieme al riassunto precedente.
+    """
+    dialogo = "\n".join(f"{'Utente' if t['ruolo'] == 'user' else 'Esperto'}: {t['testo']}" for t in turni)
+    precedente = f"Riassunto precedente: {riassunto}\n" if riassunto else ""
+    return (
+        f"{precedente}Conversazione:\n{dialogo}\n\n"
+        f"Riassumi in al massimo {PAROLE_RIASSUNTO} parole le domande dell'utente e le informazioni "
+        "date dall'esperto, includendo quanto già presente nel riassunto precedente."
+    )
@@ -0,0 +1,193 @@
+import bisect # Ricerca per prefisso su lista ordinata
+import heapq # Selezione dei migliori risultati approssimati
+import threading # Costruzione unica condivisa tra le sessioni
+import unicodedata # Rimozione degli accenti
+from collections import Counter, defaultdict # Indice dei trigrammi
+from itertools import chain # Unione veloce delle liste di trigrammi
+from comuni_index import get_indice_comuni # Elenco canonico dei comuni
+
+# Numero massimo di suggerimenti inviati al browser
+MAX_RISULTATI = 10
+# Somiglianza minima (0-1) perché un risultato con errori di battitura venga proposto
+SOGLIA_FUZZY = 0.35
+# Candidati (scelti per trigrammi) su cui calcolare la distanza di modifica
+CANDIDATI_FUZZY = 20
+# Somiglianza minima per associare automaticamente un nome (es. dal GPS) a un comune
+SOGLIA_RISOLUZIONE = 0.75
+
+
+def normalizza(testo):
+    """
+    Minuscolo, senza accenti e con apostrofi/trattini trasformati in spazi:
+    "AGLIÈ" e "Aglie" diventano entrambi "aglie".
+    """
+    testo = unicodedata.normalize("NFKD", testo.lower())
+    testo = "".join(c for c in testo if not unicodedata.combining(c))
+    for separatore in ("'", "’", "-", "/"):
+        testo = testo.replace(separatore, " ")
+    return " ".join(testo.split())
+
+
+def _distanza_modifica(a, b):
+    """
+    Distanza di Damerau-Levenshtein (variante OSA): inserimenti, cancellazioni,
+    sostituzioni e scambi di lettere adiacenti ("tornio" -> "torino" costa 1).
+    """
+    precedente2, precedente = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        corrente = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            costo = 0 if a[i - 1] == b[j - 1] else 1
+            corrente[j] = min(precedente[j] + 1, corrente[j - 1] + 1, precedente[j - 1] + costo)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                corrente[j] = min(corrente[j], precedente2[j - 2] + 1)
+        precedente2, precedente = precedente, corrente
+    return precedente[-1]
+
+
+def _trigrammi(testo):
+    testo = f"  {testo} "
+    return {testo[i:i + 3] for i in range(len(testo) - 2)}
+
+
+class IndiceRicerca:
+    """
+    Indice di ricerca dei comuni, tutto lato server:
+    - prefisso sul nome completo e sull'inizio di ogni parola (lista ordinata + bisect);
+    - trigrammi per tollerare gli errori di battitura.
+    """
+
+    def __init__(self, etichette):
+        self.etichette = list(etichette)
+        self._chiavi = [] # (testo normalizzato, priorità, indice)
+        self._nomi = defaultdict(list) # nome normalizzato -> indici (ricerca esatta)
+        self._trigrammi = defaultdict(list)
+        self._n_trigrammi = []
+        self._nome_normalizzato = []
+
+        for i, etichetta in enumerate(self.etichette):
+            comune = etichetta.split(", ")[0]
+            # I comuni bilingui (es. "BOLZANO/BOZEN") si trovano con entrambi i nomi
+            nomi = {normalizza(comune)} | {normalizza(parte) for parte in comune.split("/")}
+            for nome in nomi:
+                self._nomi[nome].append(i)
+                parole = nome.split(" ")
+                for p in range(len(parole)):
+                    # priorità 0 = inizio del nome, 1 = inizio di una parola interna
+                    self._chiavi.append((" ".join(parole[p:]), 0 if p == 0 else 1, i))
+            self._nome_normalizzato.append(normalizza(comune))
+            trigrammi = _trigrammi(self._nome_normalizzato[-1])
+            self._n_trigrammi.append(len(trigrammi))
+            for trigramma in trigrammi:
+                self._trigrammi[trigramma].append(i)
+        self._chiavi.sort()
+        self._trigrammi = dict(self._trigrammi)
+        self._testi = [chiave[0] for chiave in self._chiavi]
+        # Criterio di ordinamento dei risultati: inizio del nome prima dell'inizio di parola,
+        # poi nomi più corti (la corrispondenza esatta è sempre la più corta)
+        self._ordine = [(priorita, len(testo), i) for testo, priorita, i in self._chiavi]
+
+    def _prefisso(self, query, k):
+        """
+        Indici dei k migliori comuni il cui nome (o una sua parola) inizia con la query.
+        """
+        # Le chiavi che iniziano con la query formano un intervallo contiguo della lista ordinata
+        inizio = bisect.bisect_left(self._testi, query)
+        fine = bisect.bisect_left(self._testi, query + "\uffff", inizio)
+        # Lo stesso comune può comparire più volte (es. nomi bilingui): ne prendiamo qualcuno in più
+        migliori = heapq.nsmallest(2 * k, self._ordine[inizio:fine])
+        return list(dict.fromkeys(i for *_, i in migliori))[:k]
+
+    def _fuzzy(self, query, k):
+        """
+        Coppie (somiglianza, indice) dei k comuni più simili alla query.
+        """
+        trigrammi_query = _trigrammi(query)
+        # Counter e chain lavorano in C: contare i trigrammi in comune resta sotto il millisecondo
+        in_comune = Counter(chain.from_iterable(self._trigrammi.get(t, ()) for t in trigrammi_query))
+        n_query = len(trigrammi_query)
+        # Coefficiente di Dice tra gli insiemi di trigrammi, per scegliere pochi candidati
+        candidati = heapq.nlargest(
+            CANDIDATI_FUZZY,
+            ((2 * comuni / (n_query + self._n_trigrammi[i]), i) for i, comuni in in_comune.items()),
+            key=lambda p: (p[0], -p[1]),
+        )
+        # I candidati vengono riordinati per distanza di modifica: gli scambi di lettere
+        # (errore di battitura tipico) spezzano molti trigrammi ma costano una sola modifica
+        punteggi = []
+        for dice, i in candidati:
+            nome = self._nome_normalizzato[i]
+            somiglianza = 1 - _distanza_modifica(query, nome) / max(len(query), len(nome))
+            punteggi.append((max(dice, somiglianza), i))
+        punteggi.sort(key=lambda p: (-p[0], p[1]))
+        return punteggi[:k]
+
+    def cerca(self, query, k=MAX_RISULTATI):
+        """
+        Restituisce al massimo k etichette "Comune, Regione, Italy" che corrispondono
+        alla query, ignorando maiuscole, accenti ed eventuali errori di battitura.
+        """
+        query = normalizza(query or "")
+        if not query:
+            return []
+
+        trovati = self._prefisso(query, k)
+
+        # Nessun comune inizia così: probabilmente c'è un errore di battitura
+        if not trovati:
+            trovati = [i for punteggio, i in self._fuzzy(query, k) if punteggio >= SOGLIA_FUZZY]
+
+        return [self.etichette[i] for i in trovati]
+
+    def risolvi(self, nome):
+        """
+        Associa un nome libero (es. "Bari" restituito dal GPS) all'etichetta
+        canonica del comune. Restituisce None se non c'è una corrispondenza affidabile.
+        """
+        if not nome:
+            return None
+        # Accettiamo anche etichette già complete ("Bari, Puglia, Italy")
+        comune = nome.split(",")[0]
+        chiave = normalizza(comune)
+        if chiave in self._nomi:
+            candidati = self._nomi[chiave]
+            # Omonimi a meno degli accenti (es. PATERNO e PATERNÒ): preferiamo la grafia identica
+            identici = [i for i in candidati if self.etichette[i].split(", ")[0] == comune.strip().upper()]
+            candidati = identici or candidati
+            if len(candidati) > 1 and "," in nome:
+                # Omonimi: usiamo la regione indicata per scegliere
+                regione = normalizza(nome.split(",")[1])
+                candidati = [i for i in candidati if normalizza(self.etichette[i].split(", ")[1]) == regione] or candidati
+            return self.etichette[candidati[0]]
+
+        migliori = self._fuzzy(chiave, 1)
+        if migliori and migliori[0][0] >= SOGLIA_RISOLUZIONE:
+            return self.etichette[migliori[0][1]]
+        return None
+
+
+# Indice condiviso da tutto il processo, costruito al primo utilizzo
+_indice = None
+_indice_lock = threading.Lock()
+
+def get_indice_ricerca():
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceRicerca(get_indice_comuni().etichette())
+        return _indice
+
+def cerca_comuni(query, k=MAX_RISULTATI):
+    """
+    Scorciatoia per la ricerca sull'indice condiviso.
+    Senza testo non serve l'indice: la pagina vuota non ne paga la costruzione.
+    """
+    if not normalizza(query or ""):
+        return []
+    return get_indice_ricerca().cerca(query, k)
+
+def risolvi_comune(nome):
+    """
+    Scorciatoia per associare un nome libero all'etichetta canonica.
+    """
+    return get_indice_ricerca().risolvi(nome)
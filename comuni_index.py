@@ -0,0 +1,283 @@
+"""
+Indice binario compatto dei comuni italiani.
+
+comuniitaliani.json (e comuni_coordinate.csv, con punto e confini di ogni comune)
+restano la fonte dei dati: questo modulo li compila una sola volta in comuni_index.bin,
+un file a colonne pensato per essere mappato in memoria (mmap) e letto senza alcun parsing.
+
+Formato (little endian):
+    intestazione   MAGIC, versione, numero righe, numero colonne, sha256 dei sorgenti
+    directory      per ogni colonna: nome, tipo, offset, lunghezza
+    colonne        stringhe: offset uint32 (n+1) + testo UTF-8 separato da "\\n"
+                   numeri:   array float32 (NaN se il dato manca)
+
+Le righe sono ordinate per etichetta ("Comune, Regione, Italy"). I confini restano
+nel formato compatto del CSV (vedi decodifica_confini); il loro riquadro
+(lat_min, lat_max, lon_min, lon_max) è calcolato in compilazione.
+
+Uso:
+    python comuni_index.py            ricompila l'indice
+    python comuni_index.py --verifica controlla che l'indice sia aggiornato
+"""
+import array # Colonne numeriche compatte
+import csv # Lettura delle coordinate
+import hashlib # Verifica che l'indice corrisponda ai sorgenti
+import json # Lettura della fonte dei dati
+import math # Valori mancanti (NaN)
+import mmap # Lettura del file senza copiarlo in memoria
+import os # Percorsi
+import struct # Serializzazione binaria
+import sys # Argomenti da riga di comando
+import threading # Caricamento unico condiviso tra le sessioni
+
+FILE_COMUNI = "comuniitaliani.json"
+FILE_COORDINATE = "comuni_coordinate.csv"
+FILE_INDICE = "comuni_index.bin"
+
+MAGIC = b"ECOCOMUN"
+VERSIONE = 2
+_INTESTAZIONE = struct.Struct("<8sIII32s")
+_VOCE_DIRECTORY = struct.Struct("<16scxxxQQ")
+
+COLONNE_TESTO = ("etichetta", "comune", "regione", "provincia", "sigla_provincia", "codice_catasto", "confini")
+COLONNE_NUMERI = ("lat", "lon", "lat_min", "lat_max", "lon_min", "lon_max")
+
+# Risoluzione delle coordinate dei confini (1e-4 gradi, circa 10 m)
+PRECISIONE_CONFINI = 1e4
+
+
+def codifica_confini(anelli):
+    """
+    Codifica gli anelli dei confini [[(lat, lon), ...], ...] come polyline
+    (differenze successive in interi a 5 bit per carattere, ASCII 63-126),
+    un anello per parola separata da spazi.
+    """
+    parole = []
+    for anello in anelli:
+        caratteri, precedente = [], (0, 0)
+        for punto in anello:
+            corrente = tuple(round(valore * PRECISIONE_CONFINI) for valore in punto)
+            for delta in (corrente[0] - precedente[0], corrente[1] - precedente[1]):
+                delta = ~(delta << 1) if delta < 0 else delta << 1
+                while delta >= 0x20:
+                    caratteri.append(chr((0x20 | (delta & 0x1F)) + 63))
+                    delta >>= 5
+                caratteri.append(chr(delta + 63))
+            precedente = corrente
+        parole.append("".join(caratteri))
+    return " ".join(parole)
+
+
+def decodifica_confini(testo):
+    """
+    Inverso di codifica_confini: lista di anelli, ognuno lista di (lat, lon).
+    """
+    anelli = []
+    for parola in testo.split():
+        valori, valore, spostamento = [], 0, 0
+        for carattere in parola:
+            bit = ord(carattere) - 63
+            valore |= (bit & 0x1F) << spostamento
+            spostamento += 5
+            if bit < 0x20:
+                valori.append(~(valore >> 1) if valore & 1 else valore >> 1)
+                valore, spostamento = 0, 0
+        lat = lon = 0
+        anello = []
+        for delta_lat, delta_lon in zip(valori[::2], valori[1::2]):
+            lat += delta_lat
+            lon += delta_lon
+            anello.append((lat / PRECISIONE_CONFINI, lon / PRECISIONE_CONFINI))
+        anelli.append(anello)
+    return anelli
+
+
+def _impronta_sorgenti(file_comuni, file_coordinate):
+    impronta = hashlib.sha256()
+    for percorso in (file_comuni, file_coordinate):
+        if os.path.exists(percorso):
+            with open(percorso, "rb") as f:
+                impronta.update(f.read())
+    return impronta.digest()
+
+
+def _allinea(buffer):
+    # Allineiamo ogni colonna a 8 byte, così gli array possono essere letti direttamente
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def compila_indice(file_comuni=FILE_COMUNI, file_coordinate=FILE_COORDINATE, file_indice=FILE_INDICE):
+    """
+    Compila i sorgenti JSON/CSV nel file binario. Restituisce il numero di comuni.
+    """
+    with open(file_comuni, encoding="utf-8") as f:
+        comuni = json.load(f)
+
+    coordinate = {}
+    if os.path.exists(file_coordinate):
+        with open(file_coordinate, encoding="utf-8") as f:
+            for riga in csv.DictReader(f):
+                confini = riga.get("confini") or ""
+                punti = [punto for anello in decodifica_confini(confini) for punto in anello]
+                riquadro = (
+                    # Margine di un'unità di precisione: le colonne sono float32
+                    min(p[0] for p in punti) - 1 / PRECISIONE_CONFINI, max(p[0] for p in punti) + 1 / PRECISIONE_CONFINI,
+                    min(p[1] for p in punti) - 1 / PRECISIONE_CONFINI, max(p[1] for p in punti) + 1 / PRECISIONE_CONFINI,
+                ) if punti else (math.nan,) * 4
+                coordinate[riga["codice_catasto"]] = ((float(riga["lat"]), float(riga["lon"])) + riquadro, confini)
+
+    righe = []
+    for dati in comuni.values():
+        riga = {colonna: dati.get(colonna, "") for colonna in COLONNE_TESTO[1:]}
+        riga["etichetta"] = f"{dati['comune']}, {dati['regione']}, Italy"
+        numeri, riga["confini"] = coordinate.get(dati["codice_catasto"], ((math.nan,) * len(COLONNE_NUMERI), ""))
+        riga.update(zip(COLONNE_NUMERI, numeri))
+        righe.append(riga)
+    righe.sort(key=lambda r: r["etichetta"])
+
+    dati_colonne = []
+    for nome in COLONNE_TESTO:
+        valori = [riga[nome] for riga in righe]
+        testo = "\n".join(valori).encode("utf-8")
+        offset = array.array("I", [0])
+        for valore in valori:
+            # +1 per il separatore "\n"
+            offset.append(offset[-1] + len(valore.encode("utf-8")) + 1)
+        dati_colonne.append((nome, b"s", offset.tobytes() + testo))
+    for nome in COLONNE_NUMERI:
+        dati_colonne.append((nome, b"f", array.array("f", [riga[nome] for riga in righe]).tobytes()))
+
+    corpo = bytearray()
+    directory = []
+    inizio_dati = _INTESTAZIONE.size + _VOCE_DIRECTORY.size * len(dati_colonne)
+    inizio_dati += -inizio_dati % 8
+    for nome, tipo, contenuto in dati_colonne:
+        directory.append(_VOCE_DIRECTORY.pack(nome.encode(), tipo, inizio_dati + len(corpo), len(contenuto)))
+        corpo.extend(contenuto)
+        _allinea(corpo)
+
+    intestazione = bytearray(_INTESTAZIONE.pack(
+        MAGIC, VERSIONE, len(righe), len(dati_colonne), _impronta_sorgenti(file_comuni, file_coordinate)
+    ))
+    intestazione.extend(b"".join(directory))
+    _allinea(intestazione)
+
+    # Scrittura atomica: un altro processo non deve mai leggere un file a metà
+    temporaneo = f"{file_indice}.tmp{os.getpid()}"
+    with open(temporaneo, "wb") as f:
+        f.write(intestazione)
+        f.write(corpo)
+    os.replace(temporaneo, file_indice)
+    return len(righe)
+
+
+class IndiceComuniCompatto:
+    """
+    Vista a colonne sul file binario mappato in memoria.
+    Le colonne vengono decodificate solo quando servono e poi tenute in memoria.
+    """
+
+    def __init__(self, file_indice=FILE_INDICE):
+        with open(file_indice, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, versione, self.n, n_colonne, self.impronta = _INTESTAZIONE.unpack_from(self._mm, 0)
+        if magic != MAGIC or versione != VERSIONE:
+            raise ValueError(f"{file_indice} non è un indice dei comuni valido (versione {versione})")
+
+        self._directory = {}
+        for i in range(n_colonne):
+            nome, tipo, offset, lunghezza = _VOCE_DIRECTORY.unpack_from(
+                self._mm, _INTESTAZIONE.size + i * _VOCE_DIRECTORY.size)
+            self._directory[nome.rstrip(b"\0").decode()] = (tipo, offset, lunghezza)
+        self._cache_colonne = {}
+        self._righe_codice = None
+
+    def __len__(self):
+        return self.n
+
+    def _vista(self, nome):
+        tipo, offset, lunghezza = self._directory[nome]
+        return tipo, memoryview(self._mm)[offset:offset + lunghezza]
+
+    def colonna(self, nome):
+        """
+        Restituisce una colonna intera: lista di stringhe o array di float.
+        """
+        if nome not in self._cache_colonne:
+            tipo, vista = self._vista(nome)
+            if tipo == b"s":
+                inizio_testo = 4 * (self.n + 1)
+                valori = bytes(vista[inizio_testo:]).decode("utf-8").split("\n")
+            else:
+                valori = array.array("f")
+                valori.frombytes(vista)
+            self._cache_colonne[nome] = valori
+        return self._cache_colonne[nome]
+
+    def valore(self, nome, i):
+        """
+        Legge un singolo valore senza decodificare l'intera colonna.
+        """
+        tipo, vista = self._vista(nome)
+        if tipo == b"s":
+            offset = vista[:4 * (self.n + 1)].cast("I")
+            inizio_testo = 4 * (self.n + 1)
+            return bytes(vista[inizio_testo + offset[i]:inizio_testo + offset[i + 1] - 1]).decode("utf-8")
+        return vista.cast("f")[i]
+
+    def etichette(self):
+        """
+        Elenco ordinato "Comune, Regione, Italy" (stesso formato di carica_dati_geografici).
+        """
+        return self.colonna("etichetta")
+
+    def etichetta_da_codice(self, codice_catasto):
+        """
+        Etichetta del comune con il codice catastale indicato (es. "A662" -> "BARI, Puglia, Italy"),
+        oppure None se il codice non esiste.
+        """
+        if self._righe_codice is None:
+            self._righe_codice = {codice: i for i, codice in enumerate(self.colonna("codice_catasto")) if codice}
+        i = self._righe_codice.get(codice_catasto.strip().upper())
+        return None if i is None else self.valore("etichetta", i)
+
+
+def indice_aggiornato(file_comuni=FILE_COMUNI, file_coordinate=FILE_COORDINATE, file_indice=FILE_INDICE):
+    """
+    True se il file binario esiste ed è stato compilato dagli stessi sorgenti.
+    """
+    if not os.path.exists(file_indice):
+        return False
+    try:
+        with open(file_indice, "rb") as f:
+            magic, versione, _, _, impronta = _INTESTAZIONE.unpack(f.read(_INTESTAZIONE.size))
+    except (OSError, struct.error):
+        return False
+    return magic == MAGIC and versione == VERSIONE and impronta == _impronta_sorgenti(file_comuni, file_coordinate)
+
+
+# Indice condiviso da tutto il processo, caricato al primo utilizzo
+_indice = None
+_indice_lock = threading.Lock()
+
+def get_indice_comuni():
+    """
+    Restituisce l'indice compatto, ricompilandolo se manca o se i sorgenti sono cambiati.
+    """
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            if not indice_aggiornato():
+                compila_indice()
+            _indice = IndiceComuniCompatto()
+        return _indice
+
+
+if __name__ == "__main__":
+    if "--verifica" in sys.argv[1:]:
+        if indice_aggiornato():
+            print(f"{FILE_INDICE} è aggiornato.")
+            sys.exit(0)
+        print(f"{FILE_INDICE} non corrisponde ai sorgenti: eseguire python comuni_index.py")
+        sys.exit(1)
+    print(f"Compilati {compila_indice()} comuni in {FILE_INDICE}.")
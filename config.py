@@ -1,12 +1,12 @@
 import streamlit as st
-from PIL import Image
+import assets # Icone e logo già ridimensionati e tenuti in memoria
 
 # CONFIGURAZIONE PAGINA
 
 def configura_pagina():
         st.set_page_config(
         page_title="Assistente Raccolta Differenziata", # Titolo della pagina
-        page_icon="./icons/logo_ecovision_highres.png", # Icona della pagina
+        page_icon=assets.immagine("logo_ecovision_highres", assets.LARGHEZZA_ICONA_PAGINA), # Icona della pagina
         layout="centered" # Layout centrato, moderno
 ) 
 
@@ -16,12 +16,12 @@ def mostra_legenda_bidoni():
 
         # Lista dei tuoi bidoni con nomi e immagini
         bidoni = [
-        {"nome": "Carta",     "img": "./icons/blue.png"},
-        {"nome": "Plastica",  "img": "./icons/yellow.png"},
-        {"nome": "Vetro",     "img": "./icons/green.png"},
-        {"nome": "Umido",     "img": "./icons/brown.png"},
-        {"nome": "Secco",     "img": "./icons/grey.png"},
-        {"nome": "Rifiuti Speciali", "img": "./icons/red.png"}
+        {"nome": "Carta",     "img": "blue"},
+        {"nome": "Plastica",  "img": "yellow"},
+        {"nome": "Vetro",     "img": "green"},
+        {"nome": "Umido",     "img": "brown"},
+        {"nome": "Secco",     "img": "grey"},
+        {"nome": "Rifiuti Speciali", "img": "red"}
         ]
 
         # Crea tante colonne quanti sono i bidoni nella lista
@@ -31,5 +31,6 @@ def mostra_legenda_bidoni():
         for col, bidone in zip(cols, bidoni):  #zip per iterare su due liste contemporaneamente... crea delle coppie (Carta, colonna1), (Plastica, colonna2), ...
                 with col:
                         # width=50 o 60 li tiene piccoli e ordinati, tipo icone
-                        st.image(bidone["img"], width=80) 
+                        # Variante già pronta in memoria (vedi assets.py): niente lettura da disco né ridimensionamento
+                        st.image(assets.immagine(bidone["img"], assets.LARGHEZZA_LEGENDA), width=assets.LARGHEZZA_LEGENDA)
                         st.caption(bidone["nome"])
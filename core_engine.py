@@ -0,0 +1,425 @@
+"""
+Motore di analisi di EcoVision, senza interfaccia: riconoscimento dei rifiuti
+e chat con l'esperto. È usato sia dall'app Streamlit (tramite ai_engine.py)
+sia dall'API HTTP (api.py), quindi qui non va importato streamlit.
+"""
+import os # Variabili d'ambiente
+import re # Gestione delle stringhe
+import time # Misura dei tempi di risposta della chat
+from concurrent.futures import ThreadPoolExecutor, as_completed # Analisi multiple in parallelo
+from itertools import chain # Primo pezzo dello streaming + pezzi successivi
+import genai_pool # Registro condiviso dei client GenAI
+import ai_cache # Cache dei risultati delle analisi
+import knowledge_base # Regole locali per gli oggetti più comuni
+import metrics # Durata delle fasi e token consumati
+import scheduler # Limiti condivisi, nuovi tentativi e circuit breaker per le chiamate a Gemini
+from scheduler import ServizioNonDisponibile # Messaggio chiaro quando Gemini non è disponibile
+from chat_session import SessioneChat, prompt_riassunto # Conversazioni con memoria entro un budget di token
+from image_preprocessing import ImmaginePreprocessata, preprocessa_immagine # Ottimizzazione immagini
+
+# Impostare come constanti il modello di Gemini
+# Usiamo gemini-2.5-flash
+VISION_MODEL_ID = "gemini-2.5-flash"
+CHAT_MODEL_ID = "gemini-2.5-flash"
+
+# Versione del prompt di analisi: va incrementata ogni volta che il prompt cambia,
+# così i risultati salvati in cache con il prompt precedente non vengono più usati
+PROMPT_VERSION = 2
+
+# Tentativi di riparazione (solo testo, senza reinviare l'immagine) se la risposta non rispetta lo schema
+MAX_RIPARAZIONI = 1
+
+# Numero massimo di analisi contemporanee nella modalità "analisi multipla"
+# (per singola richiesta; il limite dell'intero processo resta quello dello scheduler)
+BATCH_MAX_CONCORRENZA = int(os.environ.get("ECOVISION_BATCH_CONCORRENZA", 4))
+
+# Tempo massimo per una richiesta a Gemini, comprese attese in coda e nuovi tentativi
+TIMEOUT_ANALISI_SECONDI = 60
+TIMEOUT_CHAT_SECONDI = 30
+
+# Risposte della chat quando il modello non risponde; chi chiama le distingue
+# da una risposta vera tramite metriche["errore"] ("non_disponibile" oppure "errore")
+CHAT_NON_DISPONIBILE = "⏳ L'esperto non può rispondere in questo momento: troppe richieste o servizio sovraccarico. Riprova tra poco."
+CHAT_ERRORE = "Mi dispiace, c'è stato un problema nel generare la risposta: {}"
+
+# I contatori già tenuti da cache, pool dei client e base di conoscenza
+# vengono esportati insieme alle metriche delle fasi
+metrics.registra_statistiche("cache", ai_cache.statistiche_cache)
+metrics.registra_statistiche("pool", genai_pool.statistiche_pool)
+metrics.registra_statistiche("knowledge_base", knowledge_base.statistiche_knowledge_base)
+metrics.registra_statistiche("scheduler", scheduler.statistiche_scheduler)
+
+# google.genai (tipi delle richieste) e ai_schema (pydantic) non vengono importati qui
+# ma nelle funzioni che li usano: importare questo modulo, e quindi avviare l'app o l'API,
+# non ne paga il costo, che si sposta sulla prima analisi o domanda in chat
+
+def _get_client(api_key):
+    """
+    Funzione interna per ottenere il Client GenAI, da usare con "with" per tutta la richiesta.
+    L'uso di un'istanza client evita problemi di configurazione globale;
+    il client viene preso in prestito dal pool condiviso, così connessioni e handshake TLS
+    vengono riutilizzati tra rerun e sessioni diverse e il client non viene chiuso mentre è in uso.
+    """
+    return genai_pool.presta_client(api_key)
+
+# Blocco di codice markdown (```json ... ``` o ``` ... ```) intorno al JSON
+_RE_BLOCCO_CODICE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*(?:```\s*)?$", re.DOTALL)
+
+def _clean_json_text(raw_text):
+    """
+    Funzione di supporto per ripulire i blocchi di codice markdown
+    se l'IA li include (es. ```json ... ```). Con response_schema non dovrebbe
+    più succedere, ma resta utile nella riparazione delle risposte non valide.
+    """
+    if not raw_text:
+        return ""
+    trovato = _RE_BLOCCO_CODICE.match(raw_text)
+    return trovato.group(1) if trovato else raw_text.strip()
+
+def _config_analisi(timeout_ms=None):
+    """
+    Configurazione comune alle chiamate di analisi e di riparazione:
+    output JSON vincolato allo schema RisultatoAnalisi.
+    timeout_ms è il tempo rimasto prima della scadenza della richiesta.
+    """
+    from google.genai import types # Tipi di dati per Gemini
+    from ai_schema import RisultatoAnalisi # Schema della risposta di analisi
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=RisultatoAnalisi,
+        temperature = 0.2, # Temperatura bassa per risultati più deterministici e meno creativi
+        http_options=types.HttpOptions(timeout=timeout_ms) if timeout_ms else None
+    )
+
+def _valida_risposta(response):
+    """
+    Restituisce la coppia (RisultatoAnalisi, None) oppure (None, errore).
+    L'SDK valida già la risposta con lo schema (response.parsed): ripuliamo
+    e rivalidiamo il testo solo se quella validazione non è andata a buon fine.
+    """
+    from ai_schema import RisultatoAnalisi, valida_testo # Schema della risposta di analisi
+    if isinstance(response.parsed, RisultatoAnalisi):
+        return response.parsed, None
+    return valida_testo(_clean_json_text(response.text))
+
+def _ripara_risposta(client, testo, errore):
+    """
+    Chiede al modello di correggere una risposta che non rispetta lo schema.
+    È una chiamata di solo testo: costa molto meno di una nuova analisi dell'immagine.
+    """
+    prompt = f"""
+    La seguente risposta di un'analisi di un rifiuto non è un JSON valido per lo schema richiesto.
+    Errori: {errore}
+    Risposta: {testo}
+    Restituisci la stessa analisi corretta secondo lo schema, senza aggiungere informazioni non presenti.
+    """
+    def _chiamata(timeout_ms):
+        with metrics.misura("gemini", operazione="riparazione"):
+            return client.models.generate_content(model=VISION_MODEL_ID, contents=prompt, config=_config_analisi(timeout_ms))
+
+    response = scheduler.esegui(_chiamata, "riparazione", TIMEOUT_ANALISI_SECONDI)
+    metrics.registra_token(response.usage_metadata, "riparazione", VISION_MODEL_ID)
+    return response
+
+def _esegui_analisi(image, api_key, citta):
+    """
+    Esegue l'analisi vera e propria. Non usa elementi di interfaccia,
+    quindi può essere chiamata anche da thread secondari (analisi multipla, API).
+    L'immagine può essere già preprocessata (ImmaginePreprocessata) oppure
+    un'immagine PIL / file caricato, che viene ottimizzato prima dell'invio.
+    Se la stessa immagine è già stata analizzata per la stessa città,
+    il risultato viene letto dalla cache senza chiamare l'API.
+    """
+    if not isinstance(image, ImmaginePreprocessata):
+        image = preprocessa_immagine(image)
+
+    kb = knowledge_base.get_knowledge_base()
+    cache = ai_cache.get_cache()
+    with metrics.misura("cache"):
+        # Con una nuova regola validata per il comune le analisi già in cache non valgono più
+        versione = f"{PROMPT_VERSION}.{kb.versione_regole(citta)}"
+        chiave = ai_cache.calcola_chiave(image.dati, citta, versione, VISION_MODEL_ID)
+        risultato = cache.get(chiave)
+    if risultato is not None:
+        kb.registra_origine("cache")
+        return risultato
+
+    # Foto quasi identica a una già confermata nello stesso comune: rispondiamo con la sua regola
+    with metrics.misura("knowledge_base"):
+        risultato = kb.cerca(image, citta)
+    if risultato is not None:
+        kb.registra_origine("locale")
+        return risultato
+
+    from google.genai import types # Tipi di dati per Gemini
+
+    # La struttura della risposta è imposta da response_schema (vedi ai_schema.py):
+    # il prompt contiene solo le istruzioni, non più lo schema scritto a mano
+    prompt = f"""
+    Agisci come un esperto di riciclo e raccolta differenziata. L'utente si trova in {citta}.
+    Identifica l'oggetto nell'immagine, i suoi materiali e l'azione da compiere.
+    Se l'oggetto è composto da più parti di materiali diversi (es. bottiglia di vetro con tappo di plastica), DEVI separare i componenti.
+    Se l'immagine non è chiara, restituisci un solo componente con destinazione "Non identificato".
+    """
+
+    # Il client resta in prestito fino all'ultima riparazione
+    with _get_client(api_key) as client:
+        # Chiamate API usando client.models della nuova libreria
+        def _chiamata(timeout_ms):
+            with metrics.misura("gemini", operazione="analisi"):
+                return client.models.generate_content(
+                    model=VISION_MODEL_ID,
+                    # Inviamo direttamente i byte già ricodificati, senza che l'SDK li converta di nuovo
+                    contents=[prompt, types.Part.from_bytes(data=image.dati, mime_type=image.mime_type)],
+                    config=_config_analisi(timeout_ms)
+                )
+
+        # Lo scheduler condiviso limita le chiamate di tutte le sessioni e ripete quelle
+        # fallite per quota o sovraccarico; se Gemini resta giù solleva ServizioNonDisponibile
+        response = scheduler.esegui(_chiamata, "analisi", TIMEOUT_ANALISI_SECONDI)
+        metrics.registra_token(response.usage_metadata, "analisi", VISION_MODEL_ID)
+
+        with metrics.misura("parsing"):
+            analisi, errore = _valida_risposta(response)
+
+        # Riparazione limitata, solo se la validazione fallisce (es. risposta troncata)
+        riparazioni = 0
+        while analisi is None and response.text and riparazioni < MAX_RIPARAZIONI:
+            print(f"Risposta non valida: {errore}. Testo grezzo: {response.text}")
+            metrics.registra_evento("errore_parsing")
+            riparazioni += 1
+            response = _ripara_risposta(client, response.text, errore)
+            with metrics.misura("parsing"):
+                analisi, errore = _valida_risposta(response)
+            metrics.registra_evento("riparazione", esito="riuscita" if analisi else "fallita")
+
+    kb.registra_origine("modello")
+    if analisi is not None:
+        # Destinazioni riportate ai bidoni canonici (e alle regole del comune, se presenti)
+        risultato = kb.applica_regole(analisi.in_dizionario(), citta)
+        # Salviamo in cache solo le risposte valide, mai il dizionario di fallback
+        cache.set(chiave, risultato)
+        return risultato
+
+    else:
+        print(f"Risposta non valida dopo {riparazioni} riparazioni: {errore}")
+        metrics.registra_evento("errore_parsing")
+        metrics.registra_evento("fallback")
+        # Dizionario di fallback per evitare che l'app vada in crash
+        return {
+            "oggetto_principale": "Errore Analisi",
+            "materiali": "Sconosciuto",
+            "azione": "Riprova con una foto più chiara.",
+            "note": "L'IA non ha restituito un formato valido.",
+            "componenti": [{"nome": "Oggetto non identificato", "destinazione": "Non identificato"}]
+        }
+
+def analizza_immagine(image, api_key, citta):
+    """
+    Analizza un'immagine per identificare il tipo di rifiuto e le istruzioni di smaltimento.
+    Restituisce un dizionario Python (JSON parsato).
+    Le eccezioni (es. ServizioNonDisponibile) arrivano al chiamante, che le mostra all'utente.
+    """
+    return _esegui_analisi(image, api_key, citta)
+
+def analizza_batch(immagini, api_key, citta, max_concorrenza=BATCH_MAX_CONCORRENZA):
+    """
+    Analizza più immagini in parallelo su un pool di thread.
+    È un generatore: restituisce le tuple (indice, risultato, errore) man mano
+    che le singole analisi terminano, così l'interfaccia può mostrarle subito.
+    Un errore su un'immagine non interrompe le altre: in quel caso
+    risultato è None ed errore contiene l'eccezione.
+    """
+    immagini = list(immagini)
+    if not immagini:
+        return
+
+    # Le chiamate a Gemini passano la maggior parte del tempo in attesa di rete,
+    # quindi i thread bastano per sovrapporle: il tempo totale si avvicina a quello della più lenta
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concorrenza, len(immagini))),
+                            thread_name_prefix="ecovision-batch") as executor:
+        futures = {
+            executor.submit(_esegui_analisi, image, api_key, citta): indice
+            for indice, image in enumerate(immagini)
+        }
+        for future in as_completed(futures):
+            indice = futures[future]
+            try:
+                yield indice, future.result(), None
+            except Exception as e:
+                yield indice, None, e
+
+def _config_chat(sessione, timeout_ms):
+    """
+    Il contesto dell'analisi viaggia come istruzione di sistema, identica a ogni turno.
+    """
+    from google.genai import types # Tipi di dati per Gemini
+    return types.GenerateContentConfig(
+        system_instruction=sessione.istruzioni,
+        http_options=types.HttpOptions(timeout=timeout_ms)
+    )
+
+def _riassumi_con(client):
+    """
+    Funzione di riassunto per SessioneChat.comprimi: una breve chiamata di solo testo.
+    """
+    def riassumi(riassunto, turni):
+        from google.genai import types # Tipi di dati per Gemini
+        prompt = prompt_riassunto(riassunto, turni)
+
+        def _chiamata(timeout_ms):
+            with metrics.misura("gemini", operazione="riassunto"):
+                return client.models.generate_content(
+                    model=CHAT_MODEL_ID,
+                    contents=prompt,
+                    config=types.GenerateContentConfig(http_options=types.HttpOptions(timeout=timeout_ms))
+                )
+
+        response = scheduler.esegui(_chiamata, "riassunto", TIMEOUT_CHAT_SECONDI)
+        metrics.registra_token(response.usage_metadata, "riassunto", CHAT_MODEL_ID)
+        return response.text.strip()
+
+    return riassumi
+
+def _comprimi(sessione, client):
+    if sessione.comprimi(_riassumi_con(client)):
+        metrics.registra_evento("chat_compressione", strategia=sessione.strategia)
+
+def _chiudi_turno(sessione, client, domanda, risposta):
+    """
+    Aggiunge il turno alla storia e, se il budget è superato, comprime i turni più vecchi.
+    """
+    sessione.registra_turno(domanda, risposta)
+    _comprimi(sessione, client)
+
+def _comprimi_in_background(sessione, api_key):
+    """
+    Comprime la storia in un thread a parte, con un client preso in prestito per l'occasione:
+    chi ha ricevuto la risposta in streaming non aspetta anche il riassunto.
+    Se il riassunto non è ancora pronto alla domanda successiva, quella usa la storia intera.
+    """
+    def _lavoro():
+        try:
+            with _get_client(api_key) as client:
+                _comprimi(sessione, client)
+        except Exception as e:
+            print(f"Errore compressione della chat in background: {e}")
+
+    _esecutore_riassunti.submit(_lavoro)
+
+# Riassunti della chat in streaming, eseguiti dopo che la risposta è stata consegnata
+_esecutore_riassunti = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ecovision-riassunti")
+
+def get_chatbot_response(user_query, context_data, api_key, sessione=None, metriche=None):
+    """
+    Genera una risposta della chat basata sul contesto dell'analisi precedente.
+    Passando la stessa SessioneChat a ogni domanda la chat ricorda i turni precedenti;
+    senza sessione la domanda viene trattata come la prima della conversazione.
+    Non solleva eccezioni: in caso di errore restituisce un messaggio per l'utente
+    e, se viene passato un dizionario "metriche", ne imposta la chiave "errore".
+    """
+    if metriche is None:
+        metriche = {}
+    metriche["errore"] = None
+    if sessione is None:
+        sessione = SessioneChat(context_data)
+    
+    try:
+        contenuti = sessione.contenuti(user_query)
+
+        with _get_client(api_key) as client:
+            # Generiamo una risposta testuale semplice
+            def _chiamata(timeout_ms):
+                with metrics.misura("gemini", operazione="chat"):
+                    return client.models.generate_content(
+                        model=CHAT_MODEL_ID,
+                        contents=contenuti,
+                        config=_config_chat(sessione, timeout_ms)
+                    )
+
+            response = scheduler.esegui(_chiamata, "chat", TIMEOUT_CHAT_SECONDI)
+            metrics.registra_token(response.usage_metadata, "chat", CHAT_MODEL_ID)
+            _chiudi_turno(sessione, client, user_query, response.text)
+        return response.text
+
+    except ServizioNonDisponibile:
+        metriche["errore"] = "non_disponibile"
+        return CHAT_NON_DISPONIBILE
+
+    except Exception as e:
+        metriche["errore"] = "errore"
+        return CHAT_ERRORE.format(e)
+
+def get_chatbot_response_stream(user_query, context_data, api_key, metriche=None, sessione=None):
+    """
+    Variante in streaming di get_chatbot_response: è un generatore che
+    restituisce i pezzi di testo man mano che il modello li produce,
+    pronto per essere passato a st.write_stream o a una risposta HTTP in streaming. La sessione funziona come in get_chatbot_response.
+    Se viene passato un dizionario "metriche", al termine contiene il tempo
+    al primo token (ttft_ms), il tempo totale (totale_ms), il numero di pezzi ricevuti
+    e l'eventuale errore, come in get_chatbot_response.
+    Il messaggio di errore viene restituito come pezzo solo se non era ancora arrivato testo;
+    se lo streaming si interrompe a metà resta in metriche["messaggio_errore"], così chi chiama
+    lo mostra separato dalla risposta parziale invece di attaccarlo in coda.
+    La compressione della storia, se serve, parte in background a streaming concluso.
+    """
+    if metriche is None:
+        metriche = {}
+    inizio = time.perf_counter()
+    metriche.update({"ttft_ms": None, "totale_ms": None, "chunk": 0, "errore": None, "messaggio_errore": None})
+    usage_metadata = None
+    if sessione is None:
+        sessione = SessioneChat(context_data)
+
+    try:
+        with _get_client(api_key) as client:
+            contenuti = sessione.contenuti(user_query)
+            risposta = []
+
+            def _apri_stream(timeout_ms):
+                # Gli errori dell'API (quota, sovraccarico) arrivano con il primo pezzo:
+                # lo leggiamo dentro lo scheduler, così anche lo streaming viene ripetuto se serve
+                pezzi = client.models.generate_content_stream(
+                    model=CHAT_MODEL_ID,
+                    contents=contenuti,
+                    config=_config_chat(sessione, timeout_ms)
+                )
+                primo = next(pezzi, None)
+                return chain([primo] if primo is not None else [], pezzi)
+
+            # Lo scheduler controlla l'avvio dello streaming; i pezzi successivi arrivano fuori dalla coda
+            for chunk in scheduler.esegui(_apri_stream, "chat", TIMEOUT_CHAT_SECONDI):
+                # I conteggi dei token arrivano aggiornati nei pezzi: teniamo l'ultimo
+                usage_metadata = chunk.usage_metadata or usage_metadata
+                # Alcuni pezzi (es. quello finale con i metadati) non contengono testo
+                if not chunk.text:
+                    continue
+                if metriche["ttft_ms"] is None:
+                    metriche["ttft_ms"] = (time.perf_counter() - inizio) * 1000
+                    metrics.DURATA_FASE.osserva(metriche["ttft_ms"] / 1000, fase="gemini_primo_token", operazione="chat")
+                metriche["chunk"] += 1
+                risposta.append(chunk.text)
+                yield chunk.text
+
+        # Il turno entra nella storia solo se la risposta è arrivata per intero;
+        # il client torna al pool prima del riassunto, che ne prende uno suo
+        sessione.registra_turno(user_query, "".join(risposta))
+        if sessione.da_comprimere():
+            _comprimi_in_background(sessione, api_key)
+
+    except ServizioNonDisponibile:
+        metriche["errore"] = "non_disponibile"
+        metriche["messaggio_errore"] = CHAT_NON_DISPONIBILE
+
+    except Exception as e:
+        metriche["errore"] = "errore"
+        metriche["messaggio_errore"] = CHAT_ERRORE.format(e)
+
+    finally:
+        metriche["totale_ms"] = (time.perf_counter() - inizio) * 1000
+        metrics.DURATA_FASE.osserva(metriche["totale_ms"] / 1000, fase="gemini", operazione="chat_stream")
+        metrics.registra_token(usage_metadata, "chat", CHAT_MODEL_ID)
+
+    # Senza testo già mostrato l'errore prende il posto della risposta
+    if metriche["messaggio_errore"] and metriche["chunk"] == 0:
+        yield metriche["messaggio_errore"]
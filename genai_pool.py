@@ -0,0 +1,181 @@
+import hashlib # Le chiavi API non vengono mai conservate in chiaro come chiavi del registro
+import os # Variabili d'ambiente
+import threading # Accesso concorrente da più sessioni Streamlit
+import time # Gestione dell'inattività dei client
+from collections import OrderedDict # Registro ordinato per ultimo utilizzo
+from contextlib import contextmanager # Prestito dei client con restituzione garantita
+
+# Numero massimo di client tenuti aperti e tempo massimo di inattività prima della chiusura
+POOL_MAX_CLIENT = int(os.environ.get("ECOVISION_POOL_MAX_CLIENT", 32))
+POOL_IDLE_SECONDI = int(os.environ.get("ECOVISION_POOL_IDLE", 15 * 60))
+
+
+def _crea_client(api_key):
+    """
+    Costruisce un nuovo Client GenAI. Il client mantiene le proprie connessioni
+    HTTP aperte (keep-alive), quindi riutilizzarlo evita un nuovo handshake TLS.
+    """
+    # google.genai è la dipendenza più lenta da caricare: la importiamo al primo client,
+    # così l'avvio dell'app (e di ogni nuovo container) non ne paga il costo
+    from google import genai # API Google Gemini
+    return genai.Client(api_key=api_key)
+
+
+class PoolClient:
+    """
+    Registro thread-safe dei Client GenAI, uno per chiave API, condiviso da tutte
+    le sessioni e i rerun dello stesso processo.
+    I client inattivi da troppo tempo, o in eccesso rispetto al limite, escono dal registro;
+    ogni client viene dato in prestito (presta) e chiuso solo quando nessuna richiesta
+    o streaming lo sta ancora usando.
+    """
+
+    def __init__(self, max_client=POOL_MAX_CLIENT, idle_secondi=POOL_IDLE_SECONDI, factory=_crea_client):
+        self.max_client = max_client
+        self.idle_secondi = idle_secondi
+        self.factory = factory
+
+        self._client = OrderedDict() # impronta chiave -> {"client", "ultimo_uso", "prestiti", "ritirato"}
+        self._lock = threading.Lock()
+
+        # Contatori di costruzione e riutilizzo
+        self.creati = 0
+        self.riusati = 0
+        self.chiusi = 0
+        self.in_prestito = 0
+
+    @staticmethod
+    def _ritira(voce, da_chiudere):
+        # Un client ancora in prestito viene chiuso da chi lo restituisce per ultimo
+        voce["ritirato"] = True
+        if voce["prestiti"] == 0:
+            da_chiudere.append(voce["client"])
+
+    def _elimina_scaduti(self, adesso):
+        """
+        Rimuove dal registro i client inattivi o in eccesso.
+        Va chiamata tenendo il lock; restituisce i client da chiudere subito.
+        """
+        da_chiudere = []
+        for impronta in list(self._client):
+            voce = self._client[impronta]
+            if adesso - voce["ultimo_uso"] <= self.idle_secondi:
+                # Il registro è ordinato per ultimo uso: i successivi sono più recenti
+                break
+            self._ritira(self._client.pop(impronta), da_chiudere)
+        while len(self._client) > self.max_client:
+            self._ritira(self._client.popitem(last=False)[1], da_chiudere)
+        return da_chiudere
+
+    def _chiudi(self, clients):
+        if not clients:
+            return
+        with self._lock:
+            self.chiusi += len(clients)
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                print(f"Errore chiusura client GenAI: {e}")
+
+    def _usa(self, voce, impronta, adesso):
+        # Va chiamata tenendo il lock
+        voce["ultimo_uso"] = adesso
+        voce["prestiti"] += 1
+        self._client.move_to_end(impronta)
+        self.in_prestito += 1
+
+    def _acquisisci(self, api_key):
+        impronta = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        adesso = time.monotonic()
+        with self._lock:
+            voce = self._client.get(impronta)
+            if voce is not None:
+                self._usa(voce, impronta, adesso)
+                self.riusati += 1
+                da_chiudere = self._elimina_scaduti(adesso)
+
+        if voce is None:
+            # Costruito fuori dal lock: le altre sessioni non aspettano un nuovo client
+            nuovo = self.factory(api_key)
+            with self._lock:
+                # Un'altra sessione con la stessa chiave può averlo creato nel frattempo
+                voce = self._client.get(impronta)
+                if voce is None:
+                    voce = self._client[impronta] = {"client": nuovo, "ultimo_uso": adesso, "prestiti": 0, "ritirato": False}
+                    self.creati += 1
+                    nuovo = None
+                else:
+                    self.riusati += 1
+                self._usa(voce, impronta, adesso)
+                da_chiudere = self._elimina_scaduti(adesso)
+            if nuovo is not None:
+                da_chiudere.append(nuovo)
+
+        # La chiusura delle connessioni avviene fuori dal lock per non bloccare le altre sessioni
+        self._chiudi(da_chiudere)
+        return voce
+
+    def _restituisci(self, voce):
+        with self._lock:
+            voce["prestiti"] -= 1
+            self.in_prestito -= 1
+            chiudi = voce["ritirato"] and voce["prestiti"] == 0
+        if chiudi:
+            self._chiudi([voce["client"]])
+
+    @contextmanager
+    def presta(self, api_key):
+        """
+        Presta il client associato alla chiave API, creandolo se necessario:
+        va usato con "with" per tutta la durata della richiesta (o dello streaming),
+        così il client non viene chiuso mentre è in uso.
+        """
+        voce = self._acquisisci(api_key)
+        try:
+            yield voce["client"]
+        finally:
+            self._restituisci(voce)
+
+    def chiudi_tutti(self):
+        """
+        Chiude tutti i client aperti (es. allo spegnimento del processo).
+        """
+        da_chiudere = []
+        with self._lock:
+            for voce in self._client.values():
+                self._ritira(voce, da_chiudere)
+            self._client.clear()
+        self._chiudi(da_chiudere)
+
+    def statistiche(self):
+        """
+        Restituisce i contatori di costruzione e riutilizzo dei client.
+        """
+        with self._lock:
+            richieste = self.creati + self.riusati
+            return {
+                "client_attivi": len(self._client),
+                "creati": self.creati,
+                "riusati": self.riusati,
+                "chiusi": self.chiusi,
+                "in_prestito": self.in_prestito,
+                "reuse_rate": self.riusati / richieste if richieste else 0.0,
+            }
+
+
+# Istanza condivisa da tutto il processo (tutte le sessioni Streamlit)
+_pool = PoolClient()
+
+def presta_client(api_key):
+    """
+    Presta un Client GenAI riutilizzabile per la chiave API indicata:
+        with presta_client(api_key) as client: ...
+    """
+    return _pool.presta(api_key)
+
+def statistiche_pool():
+    """
+    Scorciatoia per leggere i contatori del pool condiviso.
+    """
+    return _pool.statistiche()
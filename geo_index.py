@@ -0,0 +1,134 @@
+import math # Calcolo delle distanze
+import threading # Caricamento unico condiviso tra le sessioni
+from collections import defaultdict # Celle della griglia spaziale
+from comuni_index import get_indice_comuni, decodifica_confini # Anagrafica, confini e coordinate dei comuni
+
+# Lato delle celle della griglia in gradi (~11 km in latitudine)
+CELLA_GRADI = 0.1
+# Comuni senza confini nei dati (vedi build_coordinate_comuni.py): il punto deve
+# essere così vicino al loro centro abitato da non poter essere altrove
+RAGGIO_SENZA_CONFINI_KM = 2.0
+
+KM_PER_GRADO_LAT = 110.57
+KM_PER_GRADO_LON = 111.32
+
+
+def _contiene(anelli, lat, lon):
+    """
+    Ray casting con la regola pari/dispari: True se il punto è dentro i confini
+    (gli anelli interni, cioè i buchi e le enclavi di altri comuni, sono esclusi).
+    """
+    dentro = False
+    for anello in anelli:
+        lat_prec, lon_prec = anello[-1]
+        for lat_v, lon_v in anello:
+            if (lat_v > lat) != (lat_prec > lat) and \
+                    lon < (lon_prec - lon_v) * (lat - lat_v) / (lat_prec - lat_v) + lon_v:
+                dentro = not dentro
+            lat_prec, lon_prec = lat_v, lon_v
+    return dentro
+
+
+class IndiceComuni:
+    """
+    Indice spaziale a griglia dei comuni italiani per il reverse geocoding offline.
+    Ogni cella della griglia elenca i comuni il cui riquadro la tocca: la ricerca
+    verifica i confini (semplificati) solo di quei pochi comuni, decodificandoli
+    al primo utilizzo, quindi una richiesta costa pochi microsecondi.
+    I punti che non cadono nel territorio di alcun comune (estero, mare)
+    non vengono attribuiti al comune più vicino.
+    """
+
+    def __init__(self, comuni, cella_gradi=CELLA_GRADI):
+        # comuni: lista di tuple (etichetta, lat, lon, riquadro, confini):
+        # riquadro (lat_min, lat_max, lon_min, lon_max) e confini codificati, oppure None e ""
+        self.cella_gradi = cella_gradi
+        self._etichette = [c[0] for c in comuni]
+        self._riquadri = [c[3] for c in comuni]
+        self._codificati = [c[4] for c in comuni]
+        self._confini = {} # indice del comune -> anelli decodificati (due sessioni al più li decodificano entrambe)
+        self._celle = defaultdict(list)
+        self._senza_confini = []
+        for i, (_, lat, lon, riquadro, confini) in enumerate(comuni):
+            if not confini:
+                self._senza_confini.append((lat, lon, i))
+                continue
+            lat_min, lat_max, lon_min, lon_max = riquadro
+            riga_min, colonna_min = self._cella(lat_min, lon_min)
+            riga_max, colonna_max = self._cella(lat_max, lon_max)
+            for riga in range(riga_min, riga_max + 1):
+                for colonna in range(colonna_min, colonna_max + 1):
+                    self._celle[(riga, colonna)].append(i)
+
+    def __len__(self):
+        return len(self._etichette)
+
+    def _cella(self, lat, lon):
+        return (math.floor(lat / self.cella_gradi), math.floor(lon / self.cella_gradi))
+
+    def _anelli(self, i):
+        anelli = self._confini.get(i)
+        if anelli is None:
+            anelli = self._confini[i] = decodifica_confini(self._codificati[i])
+        return anelli
+
+    def comune_di(self, lat, lon):
+        """
+        Restituisce l'etichetta del comune nel cui territorio cade il punto,
+        oppure None se il punto non è nel territorio di alcun comune noto.
+        """
+        for i in self._celle.get(self._cella(lat, lon), ()):
+            lat_min, lat_max, lon_min, lon_max = self._riquadri[i]
+            if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max and _contiene(self._anelli(i), lat, lon):
+                return self._etichette[i]
+
+        # Territori di cui conosciamo solo il centro abitato (pochi comuni)
+        cos_lat = math.cos(math.radians(lat))
+        migliore, distanza_migliore = None, RAGGIO_SENZA_CONFINI_KM
+        for lat_c, lon_c, i in self._senza_confini:
+            distanza = math.hypot((lat_c - lat) * KM_PER_GRADO_LAT, (lon_c - lon) * KM_PER_GRADO_LON * cos_lat)
+            if distanza <= distanza_migliore:
+                migliore, distanza_migliore = i, distanza
+        return None if migliore is None else self._etichette[migliore]
+
+
+def costruisci_indice():
+    """
+    Costruisce l'indice spaziale a partire dalle colonne di confini, riquadri e
+    coordinate dell'indice compatto dei comuni (vedi comuni_index.py). Le etichette
+    hanno lo stesso formato di carica_dati_geografici: "Comune, Regione, Italy".
+    """
+    comuni = get_indice_comuni()
+    colonne = [comuni.colonna(nome) for nome in ("lat", "lon", "lat_min", "lat_max", "lon_min", "lon_max")]
+    voci = []
+    for i, (etichetta, confini) in enumerate(zip(comuni.etichette(), comuni.colonna("confini"))):
+        lat, lon, *riquadro = (colonna[i] for colonna in colonne)
+        if math.isnan(lat) and not confini: # Comuni senza coordinate
+            continue
+        voci.append((etichetta, lat, lon, tuple(riquadro) if confini else None, confini))
+    return IndiceComuni(voci)
+
+
+# Indice condiviso da tutto il processo, caricato al primo utilizzo
+_indice = None
+_indice_lock = threading.Lock()
+
+def get_indice():
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = costruisci_indice()
+        return _indice
+
+def comune_da_coordinate(lat, lon):
+    """
+    Reverse geocoding offline: restituisce "Comune, Regione, Italy"
+    per il comune nel cui territorio cadono le coordinate, oppure None
+    se il punto non è in Italia (estero, mare) o i dati non sono disponibili:
+    in quel caso decide Nominatim.
+    """
+    try:
+        return get_indice().comune_di(lat, lon)
+    except (OSError, ValueError) as e:
+        print(f"Indice dei comuni non disponibile: {e}")
+        return None
@@ -1,31 +1,32 @@
 import streamlit as st  # Framework per la creazione della web app
-import pandas as pd     # Aggiungiamo pandas per gestire facilmente i dati
-from geopy.geocoders import Nominatim
+from comuni_index import get_indice_comuni  # Indice compatto dei comuni
+from geo_index import comune_da_coordinate  # Reverse geocoding offline
+from city_search import risolvi_comune  # Nomi liberi -> comuni dell'elenco canonico
+from metrics import misura  # Durata delle fasi della richiesta
+
+# Se True, quando l'indice offline non trova un comune si prova con Nominatim (online)
+GEO_FALLBACK_ONLINE = True
 
 
 @st.cache_data # Cache dei dati per evitare ricaricamenti inutili
 def carica_dati_geografici():
     '''
-        Scarica e processa il file JSON dei comuni italiani.
-        Restituisce una lista di stringhe formattate: "Comune, Regione, Italy".
+        Restituisce la lista ordinata alfabeticamente dei comuni italiani,
+        come stringhe formattate: "Comune, Regione, Italy" (Stile Google Maps).
     '''
-    # URL ufficiale o raw github con i comuni italiani aggiornati
-    file_comuni = "comuniitaliani.json"
-    
-    # Leggiamo il JSON direttamente in un DataFrame pandas
-    # 'orient=index': Fondamentale perché il JSON è strutturato come un dizionario
-    # (es. {"AGLIÈ": {dati}, ...}) invece di essere una lista di oggetti.
-    df = pd.read_json(file_comuni, orient='index') 
-
-    # Creazione della stringa di ricerca univoca (Stile Google Maps)
-    # Combiniamo le colonne per ottenere: "NomeCittà, NomeRegione, Italy"
-    lista_comuni = df["comune"]+ ", " + df["regione"] + ", Italy"
-    
-    # Restituiamo la lista ordinata alfabeticamente per facilitare la ricerca
-    return lista_comuni.sort_values().tolist()
+    # La lista è già pronta e ordinata nell'indice binario compilato da
+    # comuniitaliani.json (vedi comuni_index.py): nessun parsing del JSON all'avvio
+    return list(get_indice_comuni().etichette())
 
 
-def get_city_from_latlon_italian(lat, lon):
+def _reverse_nominatim(lat, lon):
+    """
+    Reverse geocoding online tramite Nominatim (OpenStreetMap).
+    Il servizio pubblico è limitato a circa 1 richiesta al secondo:
+    lo usiamo solo come ripiego quando l'indice offline non trova nulla.
+    """
+    from geopy.geocoders import Nominatim # Importato solo se serve davvero
+
     # 'user_agent' è obbligatorio, metti un nome a caso per la tua app
     geolocator = Nominatim(user_agent="eco_vision_app")
     
@@ -45,6 +46,25 @@ def get_city_from_latlon_italian(lat, lon):
     except Exception as e:
         return "Errore di connessione"
 
+
+def get_city_from_latlon_italian(lat, lon, fallback_online=GEO_FALLBACK_ONLINE):
+    """
+    Restituisce il comune corrispondente alle coordinate nel formato
+    "Comune, Regione, Italy", identico alle voci di carica_dati_geografici.
+    La ricerca avviene offline sull'indice spaziale dei comuni; Nominatim
+    viene interpellato solo se il punto non è coperto e fallback_online è attivo.
+    """
+    with misura("geocoding", sorgente="offline"):
+        citta = comune_da_coordinate(lat, lon)
+    if citta:
+        return citta
+    if fallback_online:
+        with misura("geocoding", sorgente="nominatim"):
+            citta = _reverse_nominatim(lat, lon)
+        # Riportiamo il nome di Nominatim (es. "Bari") alla voce dell'elenco ("BARI, Puglia, Italy")
+        return risolvi_comune(citta) or citta
+    return "Città non identificata"
+
 # 1. Definiamo la funzione di callback (va messa PRIMA di usarla)
 def disattiva_gps():
     # Se esiste la chiave nel session state, la impostiamo a False
@@ -0,0 +1,155 @@
+import io # Buffer in memoria per la codifica
+import time # Misura della durata dell'elaborazione
+from dataclasses import dataclass # Contenitore per il risultato
+from metrics import misura # Durata delle fasi della richiesta
+
+# Impostazioni di default della pipeline
+# Un lato massimo di 1024 px è più che sufficiente per riconoscere un rifiuto
+# e riduce drasticamente il peso delle foto scattate dallo smartphone (12 MP e oltre)
+LATO_MAX_PX = 1024
+FORMATO_OUTPUT = "JPEG" # "JPEG" oppure "WEBP"
+QUALITA_OUTPUT = 85
+
+# Tipi MIME accettati da Gemini per i formati di output supportati
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+@dataclass
+class ImmaginePreprocessata:
+    """
+    Risultato della pipeline: byte pronti per l'invio a Gemini e statistiche.
+    """
+    dati: bytes
+    mime_type: str
+    dimensioni_originali: tuple
+    dimensioni: tuple
+    bytes_originali: int
+    bytes_finali: int
+    durata_ms: float
+
+    @property
+    def riduzione(self):
+        """
+        Percentuale di byte risparmiati rispetto all'originale (0-100).
+        """
+        if not self.bytes_originali:
+            return 0.0
+        return max(0.0, 100 * (1 - self.bytes_finali / self.bytes_originali))
+
+    def report(self):
+        """
+        Riepilogo leggibile delle dimensioni prima e dopo l'elaborazione.
+        """
+        return {
+            "bytes_originali": self.bytes_originali,
+            "bytes_finali": self.bytes_finali,
+            "riduzione_percentuale": round(self.riduzione, 1),
+            "dimensioni_originali": self.dimensioni_originali,
+            "dimensioni": self.dimensioni,
+            "durata_ms": round(self.durata_ms, 1),
+        }
+
+
+def _leggi_sorgente(sorgente):
+    """
+    Accetta byte, file caricati con Streamlit (o qualsiasi file-like) e immagini PIL.
+    Restituisce la coppia (immagine PIL, numero di byte originali).
+    """
+    from PIL import Image # PIL viene caricato alla prima immagine, non all'avvio
+    if isinstance(sorgente, Image.Image):
+        # Per un'immagine già aperta stimiamo il peso dal file di origine, se disponibile
+        bytes_originali = 0
+        fp = getattr(sorgente, "fp", None)
+        if fp is not None and hasattr(fp, "seek") and hasattr(fp, "tell"):
+            try:
+                posizione = fp.tell()
+                fp.seek(0, io.SEEK_END)
+                bytes_originali = fp.tell()
+                fp.seek(posizione)
+            except (OSError, ValueError):
+                bytes_originali = 0
+        return sorgente, bytes_originali
+
+    if hasattr(sorgente, "getvalue"):
+        dati = sorgente.getvalue()
+    elif hasattr(sorgente, "read"):
+        dati = sorgente.read()
+    else:
+        dati = bytes(sorgente)
+    return Image.open(io.BytesIO(dati)), len(dati)
+
+
+def _in_rgb(image):
+    """
+    Converte l'immagine in RGB. Le parti trasparenti vengono appoggiate su
+    sfondo bianco (altrimenti diventerebbero nere nel JPEG).
+    """
+    if image.mode == "RGB":
+        return image
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        from PIL import Image # Caricato solo se serve davvero
+        rgba = image.convert("RGBA")
+        sfondo = Image.new("RGB", rgba.size, (255, 255, 255))
+        sfondo.paste(rgba, mask=rgba.getchannel("A"))
+        return sfondo
+    return image.convert("RGB")
+
+
+def preprocessa_immagine(sorgente, lato_max=LATO_MAX_PX, formato=FORMATO_OUTPUT, qualita=QUALITA_OUTPUT):
+    """
+    Prepara un'immagine per l'invio a Gemini:
+    1. applica l'orientamento EXIF (le foto da smartphone sono spesso ruotate);
+    2. converte in RGB;
+    3. ridimensiona in modo che il lato più lungo non superi lato_max;
+    4. ricodifica in JPEG/WebP con la qualità scelta.
+    """
+    from PIL import Image, ImageOps # Manipolazione immagini, caricata alla prima immagine
+    formato = formato.upper()
+    if formato not in MIME_TYPES:
+        raise ValueError(f"Formato di output non supportato: {formato}")
+
+    inizio = time.perf_counter()
+    with misura("decodifica"):
+        image, bytes_originali = _leggi_sorgente(sorgente)
+        dimensioni_originali = image.size
+
+        # Per i JPEG chiediamo al decoder di scalare già in lettura (1/2, 1/4, 1/8):
+        # decodificare 12 MP a piena risoluzione per poi ridurli è lo step più costoso.
+        # Il riquadro è quadrato, quindi resta valido anche dopo la rotazione EXIF.
+        if image.format == "JPEG" and max(image.size) > lato_max:
+            image.draft("RGB", (lato_max, lato_max))
+        # Forziamo qui la decodifica (altrimenti pigra) per misurarla separatamente
+        image.load()
+
+    with misura("preprocessing"):
+        # exif_transpose restituisce sempre una copia: l'immagine mostrata
+        # nell'interfaccia non viene modificata dai passaggi successivi
+        decodificata = image
+        image = ImageOps.exif_transpose(image)
+        if decodificata is not sorgente:
+            # L'immagine aperta qui (byte o file caricato) non serve più: liberiamo subito i pixel
+            decodificata.close()
+        image = _in_rgb(image)
+
+        if max(image.size) > lato_max:
+            # thumbnail mantiene le proporzioni
+            image.thumbnail((lato_max, lato_max), Image.Resampling.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=formato, quality=qualita, optimize=True)
+        dati = buffer.getvalue()
+
+    dimensioni = image.size
+    image.close()
+    return ImmaginePreprocessata(
+        dati=dati,
+        mime_type=MIME_TYPES[formato],
+        dimensioni_originali=dimensioni_originali,
+        dimensioni=dimensioni,
+        bytes_originali=bytes_originali,
+        bytes_finali=len(dati),
+        durata_ms=(time.perf_counter() - inizio) * 1000,
+    )
@@ -0,0 +1,359 @@
+import io # Lettura dei byte delle immagini
+import json # Lettura delle regole e serializzazione dei risultati
+import os # Percorsi e variabili d'ambiente
+import re # Parole chiave dei bidoni
+import sqlite3 # Archivio dei risultati validati
+import threading # Accesso concorrente da più sessioni Streamlit
+import time # Data di validazione
+from functools import lru_cache # Memoizzazione della normalizzazione dei bidoni
+from city_search import normalizza # Stessa normalizzazione usata per i comuni
+
+FILE_REGOLE = "regole_smaltimento.json"
+KB_DB_PATH = os.environ.get("ECOVISION_KB_DB", os.path.join(".cache", "knowledge_base.sqlite3"))
+
+# Distanza di Hamming massima (su 64 bit) tra le firme di due foto dello stesso oggetto
+SOGLIA_FIRMA = 3
+# Bit a 1 (e a 0) minimi in una firma utilizzabile: le foto poco strutturate (un oggetto
+# su sfondo uniforme) hanno firme quasi tutte a 0 che si somigliano tra oggetti diversi
+BIT_MIN_FIRMA = 20
+
+# Conferme concordi, da sessioni diverse, perché un risultato validato diventi una regola
+# del comune: una conferma isolata resta in attesa e non cambia le risposte degli altri utenti
+CONFERME_MIN = int(os.environ.get("ECOVISION_KB_CONFERME_MIN", 3))
+
+# Bidoni canonici e nome mostrato all'utente
+BIDONI = {
+    "plastica": "Plastica",
+    "carta": "Carta",
+    "vetro": "Vetro",
+    "organico": "Organico",
+    "indifferenziato": "Indifferenziato",
+    "rifiuto speciale": "Rifiuto Speciale",
+    "non identificato": "Non identificato",
+}
+
+# Sinonimi esatti (già normalizzati): lookup O(1)
+SINONIMI_BIDONI = {
+    **{chiave: chiave for chiave in BIDONI},
+    "plastica e metalli": "plastica",
+    "imballaggi in plastica": "plastica",
+    "multimateriale": "plastica",
+    "metalli": "plastica",
+    "cartone": "carta",
+    "carta e cartone": "carta",
+    "umido": "organico",
+    "frazione organica": "organico",
+    "secco": "indifferenziato",
+    "secco residuo": "indifferenziato",
+    "indifferenziata": "indifferenziato",
+    "rifiuti speciali": "rifiuto speciale",
+    "raee": "rifiuto speciale",
+    "isola ecologica": "rifiuto speciale",
+    "centro di raccolta": "rifiuto speciale",
+}
+
+# Parole chiave per le destinazioni non previste (es. "Plastica rigida"):
+# vince la prima parola chiave che compare nel testo
+_PAROLE_CHIAVE = [
+    (r"plastic|metall|allumini|lattin", "plastica"),
+    (r"cart", "carta"),
+    (r"vetr", "vetro"),
+    (r"organic|umid|compost", "organico"),
+    (r"indifferenziat|secco|residu", "indifferenziato"),
+    (r"special|raee|ecologic|pericolos|farmac|pile", "rifiuto speciale"),
+]
+_MATCHER_BIDONI = re.compile("|".join(f"(?P<b{i}>{pattern})" for i, (pattern, _) in enumerate(_PAROLE_CHIAVE)))
+
+
+@lru_cache(maxsize=1024)
+def normalizza_destinazione(destinazione):
+    """
+    Riporta una destinazione scritta dal modello (es. "Plastica rigida", "UMIDO")
+    a uno dei bidoni canonici di BIDONI. Le destinazioni già viste costano un lookup.
+    """
+    testo = normalizza(destinazione or "")
+    if testo in SINONIMI_BIDONI:
+        return SINONIMI_BIDONI[testo]
+    trovato = _MATCHER_BIDONI.search(testo)
+    if trovato:
+        return _PAROLE_CHIAVE[int(trovato.lastgroup[1:])][1]
+    return "non identificato"
+
+
+def firma_immagine(image):
+    """
+    Firma percettiva (dHash a 64 bit) di un'immagine: foto quasi identiche
+    (stessa immagine ricompressa, ridimensionata o ritagliata di poco)
+    hanno firme a pochi bit di distanza.
+    Accetta un'immagine PIL, un'ImmaginePreprocessata o una firma già calcolata (int).
+    """
+    if isinstance(image, int):
+        return image
+    from PIL import Image # Caricato solo quando serve una firma
+    if not isinstance(image, Image.Image):
+        image = Image.open(io.BytesIO(image.dati))
+        image.draft("L", (64, 64)) # Decodifica JPEG ridotta: bastano pochi pixel
+    piccola = image.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixel = list(piccola.getdata())
+    firma = 0
+    for riga in range(8):
+        for colonna in range(8):
+            firma = (firma << 1) | (pixel[riga * 9 + colonna] > pixel[riga * 9 + colonna + 1])
+    return firma
+
+
+def firma_informativa(firma):
+    """
+    True se la firma ha abbastanza variazioni da distinguere un oggetto da un altro.
+    """
+    uni = firma.bit_count()
+    return BIT_MIN_FIRMA <= uni <= 64 - BIT_MIN_FIRMA
+
+
+class KnowledgeBase:
+    """
+    Base di conoscenza locale per comune:
+    - regole: oggetto -> componente -> bidone, scritte a mano in regole_smaltimento.json
+      ("comuni": {comune: {oggetto: {alias, materiali, azione, note, componenti}}})
+      oppure nate da risultati validati da almeno CONFERME_MIN sessioni diverse;
+      quando il modello nomina esattamente un oggetto con una regola, i bidoni
+      dei componenti corrispondenti vengono presi dalla regola;
+    - esempi: firma dell'immagine -> oggetto, dalle foto confermate. Una foto quasi
+      identica a un esempio dello stesso comune riceve la regola senza chiamare
+      Gemini: è una cache per foto simili già confermate, non un riconoscimento
+      dell'oggetto (un oggetto mai confermato passa sempre dal modello).
+    Ogni destinazione, del modello o delle regole, viene ricondotta a un bidone di BIDONI.
+    """
+
+    def __init__(self, file_regole=FILE_REGOLE, db_path=KB_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+        with open(file_regole, encoding="utf-8") as f:
+            regole = json.load(f)
+        # Le tabelle sono indicizzate per nome normalizzato dell'oggetto: la ricerca è un lookup
+        self._comuni = {comune: self._indicizza(tabella) for comune, tabella in regole.get("comuni", {}).items()}
+        self._esempi = {} # comune -> [(firma, oggetto)]
+        self._conferme = {} # (comune, oggetto, bidoni dei componenti) -> sessioni e firme in attesa
+        self._versioni = {} # comune -> numero di regole validate cambiate (entra nella chiave della cache)
+        self._alias_comuni = {} # comune -> alias delle sue regole, costruiti al primo utilizzo
+        self._carica_validati()
+
+        # Contatori per la quota di richieste servite in locale
+        self.richieste = 0
+        self.origini = {"cache": 0, "locale": 0, "modello": 0}
+
+    @staticmethod
+    def _indicizza(tabella):
+        return {normalizza(oggetto): {"nome": oggetto, **regola} for oggetto, regola in tabella.items()}
+
+    # --- Archivio dei risultati validati ---
+
+    def _connessione(self):
+        if self._conn is None:
+            cartella = os.path.dirname(self.db_path)
+            if cartella:
+                os.makedirs(cartella, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS validati (
+                    firma INTEGER NOT NULL,
+                    comune TEXT NOT NULL,
+                    oggetto TEXT NOT NULL,
+                    risultato TEXT NOT NULL,
+                    validato_il REAL NOT NULL,
+                    sessione TEXT NOT NULL DEFAULT ''
+                )
+            """)
+            # Archivi creati prima del conteggio delle conferme
+            colonne = {riga[1] for riga in self._conn.execute("PRAGMA table_info(validati)")}
+            if "sessione" not in colonne:
+                self._conn.execute("ALTER TABLE validati ADD COLUMN sessione TEXT NOT NULL DEFAULT ''")
+        return self._conn
+
+    def _carica_validati(self):
+        try:
+            righe = self._connessione().execute(
+                "SELECT firma, comune, oggetto, risultato, sessione FROM validati ORDER BY validato_il").fetchall()
+        except sqlite3.Error as db_err:
+            print(f"Errore lettura base di conoscenza: {db_err}")
+            return
+        for firma, comune, oggetto, risultato, sessione in righe:
+            self._aggiungi_validato(firma, comune, oggetto, json.loads(risultato), sessione)
+
+    def _aggiungi_validato(self, firma, comune, oggetto, risultato, sessione):
+        """
+        Conta una conferma. Quando CONFERME_MIN sessioni diverse hanno confermato lo stesso
+        oggetto con gli stessi bidoni, il risultato diventa la regola del comune e le firme
+        delle foto confermate diventano esempi. Restituisce True se la regola è cambiata.
+        """
+        oggetto_norm = normalizza(oggetto)
+        bidoni = tuple(sorted((normalizza(c["nome"]), normalizza_destinazione(c["destinazione"]))
+                              for c in risultato.get("componenti", [])))
+        gruppo = self._conferme.setdefault((comune, oggetto_norm, bidoni), {"sessioni": set(), "firme": []})
+        gruppo["sessioni"].add(sessione)
+        # Firme a 64 bit: salvate come interi con segno in SQLite
+        gruppo["firme"].append(firma & 0xFFFFFFFFFFFFFFFF)
+        if len(gruppo["sessioni"]) < CONFERME_MIN:
+            return False
+
+        self._esempi.setdefault(comune, []).extend((f, oggetto) for f in gruppo["firme"] if firma_informativa(f))
+        gruppo["firme"] = []
+        regola = {
+            "nome": oggetto,
+            "materiali": risultato.get("materiali", ""),
+            "azione": risultato.get("azione", ""),
+            "note": risultato.get("note", ""),
+            "componenti": {c["nome"]: c["destinazione"] for c in risultato.get("componenti", [])},
+        }
+        tabella = self._comuni.setdefault(comune, {})
+        if tabella.get(oggetto_norm) == regola:
+            return False
+        tabella[oggetto_norm] = regola
+        self._versioni[comune] = self._versioni.get(comune, 0) + 1
+        return True
+
+    # --- Riconoscimento degli oggetti ---
+
+    @staticmethod
+    def _alias(tabella):
+        """
+        Nomi e alias (normalizzati) di una tabella -> chiave della regola.
+        """
+        alias = {}
+        for oggetto, regola in tabella.items():
+            for nome in regola.get("alias", []):
+                alias.setdefault(normalizza(nome), oggetto)
+        # Il nome proprio di una regola ha sempre la precedenza sugli alias
+        alias.update({oggetto: oggetto for oggetto in tabella})
+        return alias
+
+    def riconosci_oggetto(self, nome, comune):
+        """
+        Restituisce la chiave della regola del comune che corrisponde al nome dell'oggetto,
+        oppure None. Solo per nome o alias esatto: una regola per "bottiglia" non deve
+        cambiare i componenti di una "bottiglia di vetro".
+        """
+        if not nome:
+            return None
+        if comune not in self._alias_comuni:
+            self._alias_comuni[comune] = self._alias(self._comuni.get(comune, {}))
+        return self._alias_comuni[comune].get(normalizza(nome))
+
+    # --- Interfaccia pubblica ---
+
+    def cerca(self, image, comune):
+        """
+        Prova a rispondere senza Gemini: se la firma dell'immagine è informativa e vicina
+        a quella di un esempio validato nello stesso comune, restituisce la regola validata
+        dell'oggetto nello stesso formato di analizza_immagine. Altrimenti None.
+        """
+        esempi = self._esempi.get(comune or "")
+        if not esempi:
+            return None
+        firma = firma_immagine(image)
+        if not firma_informativa(firma):
+            return None
+        with self._lock:
+            distanza, oggetto = min(((firma ^ f).bit_count(), o) for f, o in esempi)
+            if distanza > SOGLIA_FIRMA:
+                return None
+            regola = self._comuni.get(comune or "", {}).get(normalizza(oggetto))
+            if regola is None:
+                return None
+            return {
+                "oggetto_principale": regola["nome"][:1].upper() + regola["nome"][1:],
+                "materiali": regola.get("materiali", ""),
+                "azione": regola.get("azione", ""),
+                "note": regola.get("note", ""),
+                "componenti": [
+                    {"nome": nome, "destinazione": BIDONI[normalizza_destinazione(dest)]}
+                    for nome, dest in regola["componenti"].items()
+                ],
+            }
+
+    def applica_regole(self, risultato, comune):
+        """
+        Normalizza le destinazioni del modello sui bidoni canonici e, se il comune
+        ha una regola specifica per l'oggetto, la applica ai componenti corrispondenti.
+        """
+        with self._lock:
+            oggetto = self.riconosci_oggetto(risultato.get("oggetto_principale"), comune or "")
+            regola = self._comuni.get(comune or "", {}).get(oggetto) if oggetto else None
+        regole_componenti = {normalizza(n): d for n, d in (regola or {}).get("componenti", {}).items()}
+        for componente in risultato.get("componenti", []):
+            destinazione = regole_componenti.get(normalizza(componente.get("nome", "")), componente.get("destinazione"))
+            componente["destinazione"] = BIDONI[normalizza_destinazione(destinazione)]
+        return risultato
+
+    def versione_regole(self, comune):
+        """
+        Numero di volte in cui le regole validate del comune sono cambiate: fa parte
+        della chiave della cache, così le analisi salvate prima di una nuova regola non vengono più usate.
+        """
+        with self._lock:
+            return self._versioni.get(comune or "", 0)
+
+    def registra_validato(self, image, comune, risultato, sessione=""):
+        """
+        Salva un risultato confermato dall'utente. Diventa una regola del comune
+        (ed esempio per riconoscere foto simili senza chiamare Gemini) solo quando
+        CONFERME_MIN sessioni diverse hanno confermato lo stesso risultato.
+        """
+        oggetto = risultato.get("oggetto_principale")
+        if not oggetto or not risultato.get("componenti"):
+            return
+        firma = firma_immagine(image)
+        with self._lock:
+            try:
+                conn = self._connessione()
+                # SQLite gestisce interi a 64 bit con segno
+                firma_db = firma - (1 << 64) if firma >= (1 << 63) else firma
+                conn.execute(
+                    "INSERT INTO validati (firma, comune, oggetto, risultato, validato_il, sessione) VALUES (?, ?, ?, ?, ?, ?)",
+                    (firma_db, comune or "", oggetto, json.dumps(risultato, ensure_ascii=False), time.time(), sessione)
+                )
+                conn.commit()
+            except sqlite3.Error as db_err:
+                print(f"Errore scrittura base di conoscenza: {db_err}")
+            if self._aggiungi_validato(firma, comune or "", oggetto, risultato, sessione):
+                self._alias_comuni.pop(comune or "", None)
+
+    def registra_origine(self, origine):
+        """
+        Conta da dove è arrivata una risposta: "cache", "locale" o "modello".
+        """
+        with self._lock:
+            self.richieste += 1
+            self.origini[origine] += 1
+
+    def statistiche(self):
+        with self._lock:
+            servite_localmente = self.origini["cache"] + self.origini["locale"]
+            return {
+                "richieste": self.richieste,
+                **self.origini,
+                "quota_locale": servite_localmente / self.richieste if self.richieste else 0.0,
+                "esempi_validati": sum(map(len, self._esempi.values())),
+                "regole_validate": sum(self._versioni.values()),
+                "conferme_in_attesa": sum(len(g["sessioni"]) < CONFERME_MIN for g in self._conferme.values()),
+            }
+
+
+# Istanza condivisa da tutto il processo, creata al primo utilizzo
+_kb = None
+_kb_lock = threading.Lock()
+
+def get_knowledge_base():
+    global _kb
+    with _kb_lock:
+        if _kb is None:
+            _kb = KnowledgeBase()
+        return _kb
+
+def statistiche_knowledge_base():
+    """
+    Scorciatoia per leggere la quota di richieste servite in locale.
+    """
+    return get_knowledge_base().statistiche()
@@ -1,32 +1,80 @@
 import streamlit as st              # Framework per la creazione della web app
-from PIL import Image               # Manipolazione immagini   
 import config                    # Configurazioni della pagina
-from geo_loader import carica_dati_geografici, get_city_from_latlon_italian, disattiva_gps, disattiva_selezioneman  # Funzioni di caricamento dati geografici
+from geo_loader import get_city_from_latlon_italian, disattiva_gps, disattiva_selezioneman  # Funzioni di caricamento dati geografici
+from city_search import cerca_comuni  # Ricerca dei comuni lato server
+from knowledge_base import get_knowledge_base, normalizza_destinazione, firma_immagine  # Regole locali e bidoni canonici
 import ai_engine                    # Funzioni di analisi e risposta AI
-from streamlit_js_eval import get_geolocation  # Per ottenere la geolocalizzazione dell'utente
+from scheduler import ServizioNonDisponibile  # Gemini sovraccarico o non raggiungibile
+from chat_session import SessioneChat  # Memoria della chat entro un budget di token
+import session_store                # Dati delle sessioni con limiti di memoria
+from image_preprocessing import preprocessa_immagine  # Ottimizzazione delle immagini prima dell'invio
+import metrics                      # Durata delle fasi ed esportazione in formato Prometheus
+import assets                       # Icone e logo già ridimensionati e tenuti in memoria
+import hashlib                      # Impronta dei file caricati
 import os
+import time
+import uuid                         # Identificativo della sessione
+from urllib.parse import quote_plus  # Nome della città nell'URL della mappa
+
+# Inizio del rerun: a fine script ne registriamo la durata (vedi metrics.py)
+_inizio_rerun = time.perf_counter()
 
 # --- CONFIFGURAZIONE PAGINA ---
 config.configura_pagina()
 
-# Mappatura dei colori e icone per i bidoni
+# Endpoint/file delle metriche, se configurati (avviato una sola volta per processo)
+metrics.avvia_esportazione()
+
+# Analisi, chat e risultati multipli vivono nel registro delle sessioni, che ne limita la memoria;
+# in st.session_state resta solo l'identificativo (vedi session_store.py)
+stato = session_store.stato_sessione(st.session_state.setdefault("id_sessione", uuid.uuid4().hex))
+
+# Mappatura dei colori e icone per i bidoni canonici (vedi knowledge_base.BIDONI)
+# I sinonimi (cartone, umido, secco, raee...) vengono ricondotti a queste chiavi da normalizza_destinazione
+# Le icone sono nomi dei file in icons/, lette tramite assets.immagine
 CONFIG_BIDONI = {
-    "plastica":        {"bg": "#FFEB3B", "text": "black", "icon": "./icons/yellow.png"},
-    "carta":           {"bg": "#2196F3", "text": "white", "icon": "./icons/blue.png"},
-    "cartone":         {"bg": "#2196F3", "text": "white", "icon": "./icons/blue.png"},
-    "organico":        {"bg": "#795548", "text": "white", "icon": "./icons/brown.png"},
-    "umido":           {"bg": "#795548", "text": "white", "icon": "./icons/brown.png"},
-    "vetro":           {"bg": "#4CAF50", "text": "white", "icon": "./icons/green.png"},
-    "indifferenziato": {"bg": "#9E9E9E", "text": "white", "icon": "./icons/grey.png"},
-    "secco":           {"bg": "#9E9E9E", "text": "white", "icon": "./icons/grey.png"},
-    "rifiuto speciale": {"bg": "#F44336", "text": "white", "icon": "./icons/red.png"},
-    "raee":            {"bg": "#F44336", "text": "white", "icon": "./icons/red.png"}
+    "plastica":        {"bg": "#FFEB3B", "text": "black", "icon": "yellow"},
+    "carta":           {"bg": "#2196F3", "text": "white", "icon": "blue"},
+    "organico":        {"bg": "#795548", "text": "white", "icon": "brown"},
+    "vetro":           {"bg": "#4CAF50", "text": "white", "icon": "green"},
+    "indifferenziato": {"bg": "#9E9E9E", "text": "white", "icon": "grey"},
+    "rifiuto speciale": {"bg": "#F44336", "text": "white", "icon": "red"}
 }
 # Stile di default per i bidoni
-DEFAULT_STYLE = {"bg": "#f0f2f6", "text": "black", "icon": "./icons/grey.png"}
+DEFAULT_STYLE = {"bg": "#f0f2f6", "text": "black", "icon": "grey"}
 
 # Funzioni di utilità e interfaccia
 
+@st.cache_resource(max_entries=64, ttl=session_store.SESSIONE_IDLE_SECONDI, show_spinner=False)
+def immagine_ottimizzata(impronta, _dati):
+    """
+    Decodifica e preprocessa un file caricato una sola volta per contenuto:
+    ai rerun successivi (e per le altre sessioni con la stessa foto) si usa
+    il risultato già pronto. L'impronta (sha256 dei byte) fa da chiave della cache.
+    """
+    return preprocessa_immagine(_dati)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def citta_da_gps(lat, lon):
+    """
+    Reverse geocoding memorizzato per posizione (coordinate arrotondate a ~10 m):
+    i rerun non ripetono la ricerca finché l'utente non si sposta.
+    """
+    return get_city_from_latlon_italian(lat, lon)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def html_mappa(citta, tipo_mappa):
+    """
+    Codice HTML dell'iframe di Google Maps, memorizzato per città e tipo di mappa.
+    """
+    if tipo_mappa == 0:
+        query = citta
+    else:
+        query = f"isola ecologica {citta}"
+
+    url_maps = f"https://maps.google.com/maps?q={quote_plus(query)}&output=embed"
+    return f"<iframe src='{url_maps}' width='100%' height='350' style='border-radius:20px; border:1px solid #ddd;' allowfullscreen='' loading='lazy'></iframe>"
+
 def show_custom_box(label, text, bg_color, text_color="black", icon="", is_small=False):
     """
     Renderizza un box colorato con stile HTML.
@@ -50,21 +98,141 @@ def mostra_mappa(citta, tipo_mappa=0):
     """
     if not citta:
         return
-    if tipo_mappa == 0:
-        query = citta
-    else:
-        query = f"isola ecologica {citta}"
+    st.markdown(html_mappa(citta, tipo_mappa), unsafe_allow_html=True)
+
+def identificato(dati):
+    """
+    False se l'analisi non ha riconosciuto l'oggetto (controlliamo il primo componente).
+    """
+    return bool(dati.get("componenti")) and dati["componenti"][0]["destinazione"].strip().lower() != "non identificato"
 
-    url_maps = f"https://maps.google.com/maps?q={query}&output=embed"
-    st.markdown(
-        f"<iframe src='{url_maps}' width='100%' height='350' style='border-radius:20px; border:1px solid #ddd;' allowfullscreen='' loading='lazy'></iframe>", 
-        unsafe_allow_html=True
-        )
+def mostra_risultato(dati, citta):
+    """
+    Mostra il risultato di un'analisi: oggetto, materiali, azione,
+    bidone di destinazione per ogni componente e nota dell'esperto.
+    Restituisce False se l'oggetto non è stato identificato.
+    """
+    # Se non è stato identificato (controlliamo il primo componente)
+    if not identificato(dati):
+        st.warning("⚠️ Non sono riuscito a capire di che oggetto si tratta. Prova con una foto più chiara.")
+        return False
+
+    st.subheader(f"Oggetto: {dati.get('oggetto_principale', 'Sconosciuto')}")
+
+    # Info materiale
+    if dati.get('materiali'):
+        show_custom_box("Materiali", dati['materiali'], "#f0f2f6", "black", "📦")
+
+    # Info azione
+    if dati.get('azione'):
+        show_custom_box("Azione richiesta", dati['azione'], "#f0f2f6", "black", "⚠️")
+
+    st.markdown("---")
+
+    # ITERAZIONE SUI COMPONENTI 
+    flag_rifiuto_speciale = False # Flag per tracciare se mostrare la mappa DOPO il ciclo
+
+    for comp in dati['componenti']:
+        nome_comp = comp['nome']
+        bidone = normalizza_destinazione(comp['destinazione'])
+        dest_display = comp['destinazione'].upper()
+
+        # Titolo dinamico
+        label = f"Dove buttarlo: {nome_comp}" if len(dati['componenti']) > 1 else "Dove buttarlo"
+
+        # Stile dinamico tramite dizionario: un solo lookup sul bidone canonico
+        stile = CONFIG_BIDONI.get(bidone, DEFAULT_STYLE)
+        # Gestione specifica per Rifiuti speciali
+        if bidone == "rifiuto speciale":
+            flag_rifiuto_speciale = True
+            warning = "Non va nei bidoni di casa. Portalo all'isola ecologica."
+            show_custom_box(label, warning, stile["bg"], stile["text"], "🚫")
+        else:
+            # Rendering standard
+            c1, c2 = st.columns([4, 1])
+            with c1:
+                show_custom_box(label, dest_display, stile["bg"], stile["text"], "🗑️")
+            with c2:
+                st.image(assets.immagine(stile["icon"], assets.LARGHEZZA_ICONA_RISULTATO), width=assets.LARGHEZZA_ICONA_RISULTATO)
+    # Mappa isola ecologia (fuori dal for loop)
+    if flag_rifiuto_speciale:
+        st.warning("⚠️ Questo oggetto richiede smaltimento speciale.")
+        if citta:
+            st.write("📍 Ecco l'isola ecologica più vicina a te:")
+            mostra_mappa(citta, 1) # 1 = Mappa Isola Ecologica
+        else:
+            st.warning("Per favore, seleziona una città per ottenere la mappa.")
+
+    # Note dell'esperto
+    if dati.get('note'):
+        st.markdown("---")
+        show_custom_box("Nota dell'esperto", dati['note'], "#e8f5e9", "#1b5e20", "💡", is_small=True)
+    return True
+
+# I due pannelli sotto l'immagine sono frammenti: un clic o un messaggio al loro interno
+# riesegue solo il frammento, non tutta la pagina (GPS, ricerca comuni, mappe, legenda)
+
+@st.fragment
+def pannello_risultati(dati, citta, firma):
+    """
+    Risultato dell'analisi e conferma dell'utente.
+    Della foto basta la firma percettiva: i pixel non restano in memoria.
+    """
+    with metrics.misura("frammento", nome="risultati"):
+        with metrics.misura("rendering"):
+            mostra_risultato(dati, citta)
+        if identificato(dati):
+            # Conferma dell'utente: il risultato alimenta la base di conoscenza locale,
+            # così foto simili verranno riconosciute senza chiamare Gemini
+            if st.button("👍 Il risultato è corretto", key="valida_risultato"):
+                # Ogni sessione conta come una sola conferma (vedi knowledge_base.CONFERME_MIN)
+                get_knowledge_base().registra_validato(firma, citta, dati, st.session_state["id_sessione"])
+                st.toast("Grazie! Useremo questo risultato per le prossime analisi.")
+
+@st.fragment
+def chat_esperto(dati, api_key, stato):
+    """
+    Chat con l'esperto sull'oggetto analizzato: ogni messaggio riesegue solo questo frammento.
+    La storia mostrata è limitata a session_store.MAX_MESSAGGI_CHAT messaggi.
+    """
+    with metrics.misura("frammento", nome="chat"):
+        st.markdown("---")
+        st.subheader("💬 Hai dubbi? Chiedi all'esperto!")
+        
+        # La sessione invia il contesto una sola volta e ricorda i turni precedenti
+        if stato.chat_sessione is None or stato.chat_sessione.contesto is not dati:
+            stato.chat_sessione = SessioneChat(dati)
+
+        # Mostra la storia della chat
+        for msg in stato.chat:
+            st.chat_message(msg["role"]).markdown(msg["content"])
+        if prompt := st.chat_input("Es. Devo staccare l'etichetta?"):
+            stato.chat.append({"role": "user", "content": prompt})
+            st.chat_message("user").markdown(prompt)
+
+            with st.chat_message("assistant"):
+                # La risposta viene mostrata token per token man mano che arriva;
+                # write_stream restituisce il testo completo a fine generazione
+                stato.chat_metriche = {}
+                reply = st.write_stream(
+                    ai_engine.get_chatbot_response_stream(
+                        prompt, dati, api_key, stato.chat_metriche, stato.chat_sessione
+                    )
+                )
+
+            stato.chat.append({"role": "assistant", "content": reply})
+            # Streaming interrotto a metà: l'errore è un messaggio a parte, non la coda della risposta
+            errore = stato.chat_metriche.get("messaggio_errore")
+            if errore and stato.chat_metriche.get("chunk"):
+                st.chat_message("assistant").markdown(errore)
+                stato.chat.append({"role": "assistant", "content": errore})
+            # Il frammento non arriva in fondo alla pagina: aggiorniamo qui la contabilità
+            session_store.contabilizza(stato)
 
 # INTESTAZIONE E UI PRINCIPALE
 col1, col2 = st.columns([3, 17])
 with col1:
-    st.image("./icons/logo_ecovision_highres.png", width=150)
+    st.image(assets.immagine("logo_ecovision_highres", assets.LARGHEZZA_LOGO), width=assets.LARGHEZZA_LOGO)
 with col2:
     st.title("EcoVision: dove si butta? ♻️")
 st.markdown("""
@@ -76,7 +244,6 @@ config.mostra_legenda_bidoni()
 
 
 # --- CONFIGURAZIONE GEOLOCALIZZAZIONE ---
-comuni_italiani = carica_dati_geografici()
 citta = None # inizializziamo la variabile città
 
 # Checkbox per GPS (disattiva la selezione manuale) 
@@ -84,6 +251,8 @@ usa_gps = st.checkbox("📍 Usa la mia posizione attuale per trovare l'isola eco
 
 
 if usa_gps:
+    # Importato solo se serve davvero: senza GPS la pagina non carica il componente
+    from streamlit_js_eval import get_geolocation  # Per ottenere la geolocalizzazione dell'utente
     # Questa funzione chiama il browser per il permesso GPS
     loc = get_geolocation()
 
@@ -91,7 +260,7 @@ if usa_gps:
     if loc:
         lat = loc['coords']['latitude']
         lon = loc['coords']['longitude']
-        citta = get_city_from_latlon_italian(lat, lon)
+        citta = citta_da_gps(round(lat, 4), round(lon, 4))
         st.success(f"Posizione rilevata: {citta}")
     else:
         st.warning("In attesa del permesso GPS o segnale debole...")
@@ -101,11 +270,23 @@ else:
 # 2 GEOLOCALIZZAZIONE MANUALE (priorità sulla automatica)
 
 with st.expander("📍 Imposta la città manualmente"):
-    citta_man = st.selectbox(
+    # La ricerca avviene sul server: al browser arrivano solo i primi risultati,
+    # non l'elenco completo degli ~8000 comuni a ogni interazione
+    ricerca_citta = st.text_input(
         "Cerca la tua città",
-        options=comuni_italiani,
-        index=None,
         placeholder="Scrivi qui il tuo comune (es. Bari)...",
+        key="ricerca_citta",
+        # Una nuova ricerca azzera il comune scelto in precedenza
+        on_change=disattiva_selezioneman
+    )
+    risultati_citta = cerca_comuni(ricerca_citta)
+    if ricerca_citta and not risultati_citta:
+        st.caption("Nessun comune trovato.")
+    citta_man = st.selectbox(
+        "Seleziona il comune",
+        options=risultati_citta,
+        index=None,
+        placeholder="Scegli tra i comuni trovati...",
         key="select_citta_manuale",
         # Disattiviamo il GPS se l'utente seleziona manualmente la città
         on_change=disattiva_gps 
@@ -145,117 +326,99 @@ if not api_key:
 
 # --- LOGICA DI INPUT E ANALISI ---
 if api_key:
-    # Selezione metodo di input (Upload file e Fotocamera)
-    option = st.radio("Come vuoi caricare l'immagine?", ("Carica file", "Scatta foto"), horizontal=True, label_visibility="collapsed")
+    # Selezione metodo di input (Upload file, Fotocamera o più file insieme)
+    option = st.radio("Come vuoi caricare l'immagine?", ("Carica file", "Scatta foto", "Analisi multipla"), horizontal=True, label_visibility="collapsed")
     
     image_file = None
     if option == "Carica file":
         image_file = st.file_uploader("Scegli un'immagine...", type=["jpg", "jpeg", "png", "webp"])
-    else:
+    elif option == "Scatta foto":
         image_file = st.camera_input("Scatta una foto")
+    else:
+        # --- ANALISI MULTIPLA ---
+        image_files = st.file_uploader("Scegli una o più immagini...", type=["jpg", "jpeg", "png", "webp"], accept_multiple_files=True)
+
+        if image_files and st.button(f"Analizza {len(image_files)} rifiuti 🔍", use_container_width=True):
+            # Un segnaposto per immagine, nell'ordine di caricamento:
+            # ogni risultato compare appena la sua analisi termina
+            segnaposti = [st.empty() for _ in image_files]
+            for segnaposto, file in zip(segnaposti, image_files):
+                segnaposto.info(f"⏳ {file.name}: analisi in corso...")
+            avanzamento = st.progress(0.0, text="Analisi in corso...")
+
+            stato.batch = [None] * len(image_files)
+            inizio = time.perf_counter()
+            for completate, (indice, risultato, errore) in enumerate(ai_engine.analizza_batch(image_files, api_key, citta), start=1):
+                stato.batch[indice] = {
+                    "nome": image_files[indice].name,
+                    "risultato": risultato,
+                    "errore": str(errore) if errore else None,
+                }
+                with segnaposti[indice].container(border=True):
+                    st.markdown(f"**{image_files[indice].name}**")
+                    if isinstance(errore, ServizioNonDisponibile):
+                        st.warning(f"⏳ {errore}")
+                    elif errore:
+                        st.error(f"Si è verificato un errore durante l'analisi: {errore}")
+                    else:
+                        with metrics.misura("rendering"):
+                            mostra_risultato(risultato, citta)
+                avanzamento.progress(completate / len(image_files), text=f"Analizzate {completate} di {len(image_files)} immagini")
+            avanzamento.progress(1.0, text=f"Analisi completata in {time.perf_counter() - inizio:.1f} s")
+
+        # Ai rerun successivi mostriamo i risultati già ottenuti
+        elif stato.batch:
+            for voce in stato.batch:
+                if voce is None:
+                    continue
+                with st.container(border=True):
+                    st.markdown(f"**{voce['nome']}**")
+                    if voce["errore"]:
+                        st.error(f"Si è verificato un errore durante l'analisi: {voce['errore']}")
+                    else:
+                        with metrics.misura("rendering"):
+                            mostra_risultato(voce["risultato"], citta)
 
     # Elaborazione immagine se presente
     if image_file is not None:
-        image = Image.open(image_file)
+        # Decodifica e ottimizzazione avvengono una sola volta per file (vedi immagine_ottimizzata)
+        dati_file = image_file.getvalue()
+        immagine = immagine_ottimizzata(hashlib.sha256(dati_file).hexdigest(), dati_file)
         if option == "Carica file":
-            st.image(image, caption="Immagine caricata", use_container_width=True)
+            # Mostriamo la versione ottimizzata: già orientata e molto più leggera da inviare al browser
+            st.image(immagine.dati, caption="Immagine caricata", use_container_width=True)
 
 
         # Logica del bottone di analisi
         if st.button("Analizza Rifiuto 🔍", use_container_width=True):
             try:
+                st.caption(
+                    f"Immagine ottimizzata per l'invio: {immagine.bytes_originali / 1024:.0f} KB → "
+                    f"{immagine.bytes_finali / 1024:.0f} KB (-{immagine.riduzione:.0f}%)"
+                )
                 # Chiamata alla funzione di analisi AI
-                st.session_state.analysis_result = ai_engine.analizza_immagine(image, api_key, citta)
-                # Resetta la chat quando si analizza un nuovo oggetto
-                st.session_state.chat_history = [] 
+                risultato = ai_engine.analizza_immagine(immagine, api_key, citta)
+                # Resetta la chat quando si analizza un nuovo oggetto; della foto teniamo solo la firma
+                stato.nuova_analisi(risultato, firma_immagine(immagine))
+            except ServizioNonDisponibile as e:
+                # Quota esaurita o servizio giù: messaggio chiaro, senza dettagli tecnici
+                st.warning(f"⏳ {e}")
             except Exception as e:
                 st.error(f"Si è verificato un errore durante l'analisi: {e}")
 
         # --- VISUALIZZAZIONE RISULTATI ---
-        if "analysis_result" in st.session_state:
-            dati = st.session_state.analysis_result
-            
-            # Se non è stato identificato (controlliamo il primo componente)
-            if not dati.get("componenti") or dati["componenti"][0]["destinazione"] == "Non identificato":
-                st.warning("⚠️ Non sono riuscito a capire di che oggetto si tratta. Prova con una foto più chiara.")
-            else:
-                st.subheader(f"Oggetto: {dati.get('oggetto_principale', 'Sconosciuto')}")
-                    
-                # Info materiale
-                if dati.get('materiali'):
-                    show_custom_box("Materiali", dati['materiali'], "#f0f2f6", "black", "📦")
-
-                # Info azione
-                if dati.get('azione'):
-                    show_custom_box("Azione richiesta", dati['azione'], "#f0f2f6", "black", "⚠️")
-
-                st.markdown("---")
-
-                # ITERAZIONE SUI COMPONENTI 
-                flag_rifiuto_speciale = False # Flag per tracciare se mostrare la mappa DOPO il ciclo
-                
-                for comp in dati['componenti']:
-                    nome_comp = comp['nome']
-                    destinazione = comp['destinazione'].lower()
-                    dest_display = comp['destinazione'].upper()
-
-                    # Titolo dinamico
-                    label = f"Dove buttarlo: {nome_comp}" if len(dati['componenti']) > 1 else "Dove buttarlo"
-
-                    # Stile dinamico tramite dizionario
-                    stile = DEFAULT_STYLE
-                    # Cerca una parola chiave (es. "plastica") dentro la destinazione (es. "plastica rigida")
-                    for key, value in CONFIG_BIDONI.items():
-                        if key in destinazione:
-                            stile = value
-                            break
-                    # Gestione specifica per Rifiuti speciali
-                    if "rifiuto speciale" in destinazione or "raee" in destinazione:
-                        flag_rifiuto_speciale = True
-                        warning = "Non va nei bidoni di casa. Portalo all'isola ecologica."
-                        show_custom_box(label, warning, stile["bg"], stile["text"], "🚫")
-                    else:
-                        # Rendering standard
-                        c1, c2 = st.columns([4, 1])
-                        with c1:
-                            show_custom_box(label, dest_display, stile["bg"], stile["text"], "🗑️")
-                        with c2:
-                            st.image(stile["icon"], width=120)
-                # Mappa isola ecologia (fuori dal for loop)
-                if flag_rifiuto_speciale:
-                    st.warning("⚠️ Questo oggetto richiede smaltimento speciale.")
-                    if citta:
-                        st.write("📍 Ecco l'isola ecologica più vicina a te:")
-                        mostra_mappa(citta, 1) # 1 = Mappa Isola Ecologica
-                    else:
-                        st.warning("Per favore, seleziona una città per ottenere la mappa.")
-
-                # Note dell'esperto
-                if dati.get('note'):
-                    st.markdown("---")
-                    show_custom_box("Nota dell'esperto", dati['note'], "#e8f5e9", "#1b5e20", "💡", is_small=True)
+        if stato.analisi is not None:
+            dati = stato.analisi
 
+            pannello_risultati(dati, citta, stato.firma)
+            if identificato(dati):
                 # --- CHATBOT ---
-                st.markdown("---")
-                st.subheader("💬 Hai dubbi? Chiedi all'esperto!")
-                
-                # Inizializza la storia della chat se non esiste
-                if "chat_history" not in st.session_state:
-                    st.session_state.chat_history = []
-
-                # Mostra la storia della chat
-                for msg in st.session_state.chat_history:
-                    st.chat_message(msg["role"]).markdown(msg["content"])
-                if prompt := st.chat_input("Es. Devo staccare l'etichetta?"):
-                    st.session_state.chat_history.append({"role": "user", "content": prompt})
-                    st.chat_message("user").markdown(prompt)
-
-                    with st.chat_message("assistant"):
-                        with st.spinner("..."):
-                            reply = ai_engine.get_chatbot_response(prompt, dati, api_key)
-                            st.markdown(reply)
-                    
-                    st.session_state.chat_history.append({"role": "assistant", "content": reply})
+                chat_esperto(dati, api_key, stato)
 
 st.markdown("---")
-st.caption("Powered by Google Gemini & Streamlit")
\ No newline at end of file
+st.caption("Powered by Google Gemini & Streamlit")
+
+# Stima della memoria della sessione e rispetto dei limiti
+session_store.contabilizza(stato)
+
+metrics.DURATA_FASE.osserva(time.perf_counter() - _inizio_rerun, fase="rerun_pagina")
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+Strumentazione delle fasi di una richiesta (latenze e token) in formato Prometheus.
+
+Le metriche vivono nel processo Streamlit e sono condivise da tutte le sessioni.
+Si possono leggere in due modi, attivabili con variabili d'ambiente:
+    ECOVISION_METRICS_PORT=9464   endpoint HTTP locale (http://localhost:9464/metrics);
+                                  ECOVISION_METRICS_HOST sceglie l'interfaccia (default 127.0.0.1)
+    ECOVISION_METRICS_FILE=...    file di testo riscritto periodicamente
+                                  (es. per il textfile collector di node_exporter)
+"""
+import bisect # Ricerca del bucket dell'istogramma
+import os # Variabili d'ambiente
+import threading # Accesso concorrente e server in background
+import time # Misura delle durate
+from contextlib import contextmanager # Misura delle fasi con "with"
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # Endpoint /metrics
+
+PREFISSO = "ecovision"
+
+# Bucket in secondi: dalle fasi locali (millisecondi) alle chiamate a Gemini (decine di secondi)
+BUCKET_DURATA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Bucket per il numero di token di una singola chiamata
+BUCKET_TOKEN = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+INTERVALLO_FILE_SECONDI = 15
+# Content-Type del formato di esposizione testuale di Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _etichette(etichette):
+    if not etichette:
+        return ""
+    valori = ",".join(f'{chiave}="{str(valore)}"' for chiave, valore in sorted(etichette))
+    return "{" + valori + "}"
+
+
+class Istogramma:
+    """
+    Istogramma cumulativo in stile Prometheus, con una serie per ogni combinazione di etichette.
+    """
+
+    def __init__(self, nome, descrizione, bucket):
+        self.nome = nome
+        self.descrizione = descrizione
+        self.bucket = tuple(bucket)
+        self._serie = {} # etichette -> [conteggi per bucket, somma, totale]
+        self._lock = threading.Lock()
+
+    def osserva(self, valore, **etichette):
+        chiave = tuple(sorted(etichette.items()))
+        with self._lock:
+            serie = self._serie.get(chiave)
+            if serie is None:
+                serie = self._serie[chiave] = [[0] * len(self.bucket), 0.0, 0]
+            indice = bisect.bisect_left(self.bucket, valore)
+            if indice < len(self.bucket):
+                serie[0][indice] += 1
+            serie[1] += valore
+            serie[2] += 1
+
+    def esporta(self):
+        righe = [f"# HELP {self.nome} {self.descrizione}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            for chiave, (conteggi, somma, totale) in sorted(self._serie.items()):
+                cumulato = 0
+                for limite, conteggio in zip(self.bucket, conteggi):
+                    cumulato += conteggio
+                    righe.append(f"{self.nome}_bucket{_etichette(chiave + (('le', limite),))} {cumulato}")
+                righe.append(f"{self.nome}_bucket{_etichette(chiave + (('le', '+Inf'),))} {totale}")
+                righe.append(f"{self.nome}_sum{_etichette(chiave)} {somma}")
+                righe.append(f"{self.nome}_count{_etichette(chiave)} {totale}")
+        return righe
+
+
+class Contatore:
+    """
+    Contatore monotono con etichette.
+    """
+
+    def __init__(self, nome, descrizione):
+        self.nome = nome
+        self.descrizione = descrizione
+        self._serie = {}
+        self._lock = threading.Lock()
+
+    def incrementa(self, valore=1, **etichette):
+        chiave = tuple(sorted(etichette.items()))
+        with self._lock:
+            self._serie[chiave] = self._serie.get(chiave, 0) + valore
+
+    def esporta(self):
+        righe = [f"# HELP {self.nome} {self.descrizione}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            for chiave, valore in sorted(self._serie.items()):
+                righe.append(f"{self.nome}{_etichette(chiave)} {valore}")
+        return righe
+
+
+# --- Metriche dell'applicazione ---
+
+DURATA_FASE = Istogramma(
+    f"{PREFISSO}_fase_durata_secondi",
+    "Durata delle fasi di una richiesta (decodifica, preprocessing, gemini, parsing, geocoding, rendering...)",
+    BUCKET_DURATA,
+)
+TOKEN_CHIAMATA = Istogramma(
+    f"{PREFISSO}_token_per_chiamata",
+    "Token per singola chiamata a Gemini, da usage_metadata",
+    BUCKET_TOKEN,
+)
+TOKEN_TOTALI = Contatore(f"{PREFISSO}_token_total", "Token consumati in totale, da usage_metadata")
+EVENTI = Contatore(f"{PREFISSO}_eventi_total", "Eventi notevoli (errori di parsing, risposte dalla cache...)")
+
+_METRICHE = [DURATA_FASE, TOKEN_CHIAMATA, TOKEN_TOTALI, EVENTI]
+_STATISTICHE = {} # prefisso -> funzione che restituisce un dizionario di numeri
+
+
+@contextmanager
+def misura(fase, **etichette):
+    """
+    Misura la durata del blocco "with" e la registra nell'istogramma delle fasi.
+    La durata viene registrata anche se il blocco solleva un'eccezione.
+    """
+    inizio = time.perf_counter()
+    try:
+        yield
+    finally:
+        DURATA_FASE.osserva(time.perf_counter() - inizio, fase=fase, **etichette)
+
+
+def registra_token(usage_metadata, operazione, modello):
+    """
+    Registra i token di una chiamata a partire dal campo usage_metadata della risposta.
+    I token "cache" sono la parte del prompt servita dalla cache (implicita o esplicita) di Gemini.
+    """
+    if usage_metadata is None:
+        return
+    for tipo, campo in (("prompt", "prompt_token_count"),
+                        ("risposta", "candidates_token_count"),
+                        ("totale", "total_token_count"),
+                        ("cache", "cached_content_token_count")):
+        valore = getattr(usage_metadata, campo, None)
+        if valore:
+            TOKEN_CHIAMATA.osserva(valore, operazione=operazione, modello=modello, tipo=tipo)
+            TOKEN_TOTALI.incrementa(valore, operazione=operazione, modello=modello, tipo=tipo)
+
+
+def registra_evento(evento, **etichette):
+    EVENTI.incrementa(evento=evento, **etichette)
+
+
+def registra_statistiche(prefisso, funzione):
+    """
+    Esporta come gauge i contatori già tenuti da altri moduli (cache, pool dei client...):
+    funzione deve restituire un dizionario {nome: numero}.
+    """
+    _STATISTICHE[prefisso] = funzione
+
+
+def esporta_prometheus():
+    """
+    Restituisce tutte le metriche nel formato testuale di Prometheus.
+    """
+    righe = []
+    for metrica in _METRICHE:
+        righe.extend(metrica.esporta())
+    for prefisso, funzione in sorted(_STATISTICHE.items()):
+        try:
+            valori = funzione()
+        except Exception as e:
+            print(f"Errore lettura statistiche {prefisso}: {e}")
+            continue
+        for chiave, valore in sorted(valori.items()):
+            if isinstance(valore, (int, float)) and not isinstance(valore, bool):
+                nome = f"{PREFISSO}_{prefisso}_{chiave}"
+                righe.append(f"# TYPE {nome} gauge")
+                righe.append(f"{nome} {valore}")
+    return "\n".join(righe) + "\n"
+
+
+# --- Esposizione delle metriche ---
+
+class _GestoreMetriche(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        corpo = esporta_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        pass # Niente log per ogni richiesta dello scraper
+
+
+def scrivi_file(percorso):
+    """
+    Scrive le metriche su file in modo atomico.
+    """
+    temporaneo = f"{percorso}.tmp"
+    with open(temporaneo, "w", encoding="utf-8") as f:
+        f.write(esporta_prometheus())
+    os.replace(temporaneo, percorso)
+
+
+_avviato = False
+_avvio_lock = threading.Lock()
+
+def avvia_esportazione():
+    """
+    Avvia (una sola volta per processo) l'endpoint HTTP e/o la scrittura su file,
+    in base alle variabili d'ambiente ECOVISION_METRICS_PORT ed ECOVISION_METRICS_FILE.
+    """
+    global _avviato
+    with _avvio_lock:
+        if _avviato:
+            return
+        _avviato = True
+
+    porta = os.environ.get("ECOVISION_METRICS_PORT")
+    if porta:
+        try:
+            host = os.environ.get("ECOVISION_METRICS_HOST", "127.0.0.1")
+            server = ThreadingHTTPServer((host, int(porta)), _GestoreMetriche)
+            threading.Thread(target=server.serve_forever, name="ecovision-metrics", daemon=True).start()
+        except OSError as e:
+            print(f"Impossibile avviare l'endpoint delle metriche sulla porta {porta}: {e}")
+
+    percorso = os.environ.get("ECOVISION_METRICS_FILE")
+    if percorso:
+        def _scrittura_periodica():
+            while True:
+                try:
+                    scrivi_file(percorso)
+                except OSError as e:
+                    print(f"Impossibile scrivere le metriche in {percorso}: {e}")
+                time.sleep(INTERVALLO_FILE_SECONDI)
+        threading.Thread(target=_scrittura_periodica, name="ecovision-metrics-file", daemon=True).start()
@@ -0,0 +1,167 @@
+"""
+Profilo dell'avvio a freddo di EcoVision, nel formato di `python -X importtime`.
+
+Su container che scalano automaticamente ogni nuova replica paga, alla prima
+richiesta, l'importazione di tutti i moduli dell'app. Questo profilo la misura
+in un processo Python nuovo (niente moduli già in memoria):
+- per l'app Streamlit importa, come farebbe il server, prima streamlit e poi
+  i moduli che main.py importa in cima al file (letti dal sorgente);
+- per l'API HTTP importa api.py.
+
+Misura solo le importazioni: la prima esecuzione di main.py (indici, icone,
+rendering) la misura benchmarks/bench_avvio.py.
+
+Riporta le righe di -X importtime (tempo proprio e cumulativo in microsecondi)
+oltre una soglia, il totale e le dipendenze pesanti caricate all'avvio:
+google.genai, pydantic, PIL, geopy e simili vanno importate solo nelle funzioni
+che le usano.
+
+Uso:
+    python profilo_avvio.py [--api] [--soglia-ms 1]
+"""
+import argparse # Opzioni da riga di comando
+import ast # Importazioni in cima a main.py
+import json # Risultati del processo figlio
+import os # Percorsi
+import re # Righe di -X importtime
+import subprocess # Avvio a freddo in un processo nuovo
+import sys # Interprete corrente
+from dataclasses import dataclass, field # Contenitori dei risultati
+
+RADICE = os.path.dirname(os.path.abspath(__file__))
+
+# Dipendenze lente da importare che non devono essere caricate all'avvio
+DIPENDENZE_DIFFERITE = ("google.genai", "httpx", "pydantic", "PIL", "numpy", "pandas", "geopy", "streamlit_js_eval")
+
+# Il server Streamlit è già in memoria quando esegue main.py: il suo costo è misurato a parte
+MODULI_BASE_APP = ("streamlit",)
+
+_MARCATORE = "--- moduli dell'app ---"
+_RE_RIGA = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)\s*$")
+
+# Eseguito nel processo figlio: importa la base, poi i moduli da profilare
+_CODICE_FIGLIO = """
+import importlib, json, sys, time
+base, moduli, controllate = json.loads(sys.argv[1])
+inizio = time.perf_counter()
+for nome in base:
+    importlib.import_module(nome)
+meta = time.perf_counter()
+sys.stderr.write(%r + "\\n")
+mancanti = []
+for nome in moduli:
+    try:
+        importlib.import_module(nome)
+    except ImportError:
+        mancanti.append(nome)
+fine = time.perf_counter()
+print(json.dumps({
+    "base_ms": (meta - inizio) * 1000,
+    "moduli_ms": (fine - meta) * 1000,
+    "mancanti": mancanti,
+    "caricate": [nome for nome in controllate if nome in sys.modules],
+}))
+""" % _MARCATORE
+
+
+@dataclass
+class VoceImport:
+    """
+    Una riga di -X importtime: tempi in microsecondi, livello di annidamento.
+    """
+    modulo: str
+    proprio_us: int
+    cumulativo_us: int
+    livello: int
+
+
+@dataclass
+class ProfiloAvvio:
+    """
+    Risultato di un avvio a freddo.
+    """
+    base_ms: float # importazione della base (streamlit per l'app)
+    moduli_ms: float # importazione dei moduli dell'app, oltre alla base
+    voci: list = field(default_factory=list) # VoceImport dei moduli dell'app, in ordine di importazione
+    mancanti: list = field(default_factory=list) # moduli non installati (saltati)
+    caricate: list = field(default_factory=list) # DIPENDENZE_DIFFERITE caricate all'avvio
+
+
+def moduli_main(percorso=None):
+    """
+    Moduli importati in cima a main.py (non quelli importati dentro funzioni o rami),
+    nell'ordine in cui compaiono.
+    """
+    percorso = percorso or os.path.join(RADICE, "main.py")
+    with open(percorso, encoding="utf-8") as f:
+        albero = ast.parse(f.read(), filename=percorso)
+    moduli = []
+    for nodo in albero.body:
+        if isinstance(nodo, ast.Import):
+            moduli.extend(alias.name for alias in nodo.names)
+        elif isinstance(nodo, ast.ImportFrom) and nodo.module and not nodo.level:
+            moduli.append(nodo.module)
+    return list(dict.fromkeys(moduli))
+
+
+def bersaglio(api=False, radice=RADICE):
+    """
+    Coppia (moduli di base, moduli da profilare) per l'app Streamlit o per l'API.
+    """
+    if api:
+        return (), ["api"]
+    moduli = moduli_main(os.path.join(radice, "main.py"))
+    base = [m for m in moduli if m.split(".")[0] in MODULI_BASE_APP]
+    return base, [m for m in moduli if m not in base]
+
+
+def profila(base, moduli, radice=RADICE, controllate=DIPENDENZE_DIFFERITE):
+    """
+    Importa base e moduli in un nuovo processo con -X importtime e ne raccoglie i tempi.
+    """
+    argomento = json.dumps([list(base), list(moduli), list(controllate)])
+    esito = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CODICE_FIGLIO, argomento],
+        cwd=radice, capture_output=True, text=True, check=False,
+    )
+    if esito.returncode != 0:
+        raise RuntimeError(f"Avvio non riuscito:\n{esito.stderr[-2000:]}")
+
+    voci = []
+    dopo_marcatore = False
+    for riga in esito.stderr.splitlines():
+        if riga == _MARCATORE:
+            dopo_marcatore = True
+            continue
+        trovata = _RE_RIGA.match(riga)
+        if dopo_marcatore and trovata:
+            proprio, cumulativo, rientro, modulo = trovata.groups()
+            voci.append(VoceImport(modulo, int(proprio), int(cumulativo), len(rientro) // 2))
+    dati = json.loads(esito.stdout.strip().splitlines()[-1])
+    return ProfiloAvvio(dati["base_ms"], dati["moduli_ms"], voci, dati["mancanti"], dati["caricate"])
+
+
+def formatta(profilo, soglia_ms=1.0):
+    """
+    Report in stile -X importtime: le importazioni (con il loro annidamento)
+    che costano almeno soglia_ms, poi il riepilogo.
+    """
+    righe = ["import time: self [us] | cumulative | imported package"]
+    for voce in profilo.voci:
+        if voce.cumulativo_us >= soglia_ms * 1000:
+            righe.append(f"import time: {voce.proprio_us:>9} | {voce.cumulativo_us:>10} | {'  ' * voce.livello}{voce.modulo}")
+    righe.append("")
+    righe.append(f"Base (già caricata dal server): {profilo.base_ms:.0f} ms")
+    righe.append(f"Moduli dell'app: {profilo.moduli_ms:.0f} ms")
+    if profilo.mancanti:
+        righe.append(f"Moduli non installati (saltati): {', '.join(profilo.mancanti)}")
+    righe.append(f"Dipendenze pesanti caricate all'avvio: {', '.join(profilo.caricate) or 'nessuna'}")
+    return "\n".join(righe)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", action="store_true", help="profila l'API HTTP invece dell'app Streamlit")
+    parser.add_argument("--soglia-ms", type=float, default=1.0, help="nasconde le importazioni più veloci")
+    args = parser.parse_args()
+    print(formatta(profila(*bersaglio(args.api)), args.soglia_ms))
@@ -0,0 +1,262 @@
+import os # Variabili d'ambiente
+import random # Jitter del backoff
+import threading # Limiti condivisi tra sessioni e thread
+import time # Scadenze, attese e finestre del circuito
+import metrics # Attese in coda, tentativi e stato del circuito
+
+# Chiamate a Gemini contemporanee nell'intero processo (tutte le sessioni)
+MAX_CONCORRENZA = int(os.environ.get("ECOVISION_GEMINI_CONCORRENZA", 8))
+# Token bucket: richieste al secondo a regime e raffica massima
+RICHIESTE_AL_SECONDO = float(os.environ.get("ECOVISION_GEMINI_RPS", 5))
+RAFFICA_MAX = int(os.environ.get("ECOVISION_GEMINI_RAFFICA", 10))
+
+# Nuovi tentativi su 429/5xx/errori di rete, con backoff esponenziale e jitter
+MAX_TENTATIVI = 3
+BACKOFF_BASE_SECONDI = 0.5
+BACKOFF_MAX_SECONDI = 8.0
+
+# Circuito: dopo N errori consecutivi del servizio smettiamo di chiamarlo per un po'
+SOGLIA_ERRORI_CIRCUITO = 5
+APERTURA_CIRCUITO_SECONDI = 30.0
+
+# Codici HTTP per cui ha senso riprovare
+CODICI_TEMPORANEI = {408, 429, 500, 502, 503, 504}
+
+
+class ServizioNonDisponibile(Exception):
+    """
+    Gemini non è raggiungibile o è sovraccarico. Il messaggio è pensato
+    per essere mostrato così com'è nell'interfaccia.
+    """
+
+
+class CircuitoAperto(ServizioNonDisponibile):
+    pass
+
+
+class ScadenzaSuperata(ServizioNonDisponibile):
+    pass
+
+
+def _errore_temporaneo(errore):
+    """
+    True per gli errori che dipendono dal servizio (quota, sovraccarico, rete)
+    e non dalla richiesta: sono quelli da riprovare e da contare nel circuito.
+    """
+    # Importati qui: servono solo quando una chiamata fallisce, e google.genai
+    # (con httpx) è la dipendenza più lenta da caricare all'avvio
+    import httpx # Errori di rete del client GenAI
+    from google.genai import errors # Errori restituiti dall'API Gemini
+    if isinstance(errore, errors.APIError):
+        return errore.code in CODICI_TEMPORANEI
+    return isinstance(errore, httpx.TransportError)
+
+
+class BucketToken:
+    """
+    Limitatore di frequenza a token bucket: ogni richiesta consuma un token,
+    i token si ricaricano a "velocita" al secondo fino a "capacita".
+    """
+
+    def __init__(self, velocita, capacita):
+        self.velocita = velocita
+        self.capacita = capacita
+        self._token = float(capacita)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def preleva(self, scadenza):
+        """
+        Attende un token fino alla scadenza (time.monotonic). Restituisce False se non arriva in tempo.
+        """
+        while True:
+            with self._lock:
+                adesso = time.monotonic()
+                self._token = min(self.capacita, self._token + (adesso - self._ultimo) * self.velocita)
+                self._ultimo = adesso
+                if self._token >= 1:
+                    self._token -= 1
+                    return True
+                attesa = (1 - self._token) / self.velocita
+            if adesso + attesa > scadenza:
+                return False
+            time.sleep(attesa)
+
+
+class Circuito:
+    """
+    Circuit breaker: "chiuso" lascia passare tutto, "aperto" rifiuta subito,
+    "semiaperto" lascia passare una sola richiesta di prova dopo la pausa.
+    """
+
+    def __init__(self, soglia=SOGLIA_ERRORI_CIRCUITO, apertura_secondi=APERTURA_CIRCUITO_SECONDI):
+        self.soglia = soglia
+        self.apertura_secondi = apertura_secondi
+        self.stato = "chiuso"
+        self.errori_consecutivi = 0
+        self._aperto_il = 0.0
+        self._prova_in_corso = False
+        self._lock = threading.Lock()
+
+    def ammetti(self):
+        """
+        Solleva CircuitoAperto se in questo momento le chiamate vanno rifiutate.
+        """
+        with self._lock:
+            if self.stato == "aperto":
+                restanti = self.apertura_secondi - (time.monotonic() - self._aperto_il)
+                if restanti > 0:
+                    raise CircuitoAperto(
+                        f"Il servizio di analisi è temporaneamente non disponibile. Riprova tra {restanti:.0f} secondi.")
+                self.stato = "semiaperto"
+            if self.stato == "semiaperto":
+                if self._prova_in_corso:
+                    raise CircuitoAperto("Il servizio di analisi si sta riprendendo. Riprova tra qualche secondo.")
+                self._prova_in_corso = True
+
+    def successo(self):
+        with self._lock:
+            self.stato = "chiuso"
+            self.errori_consecutivi = 0
+            self._prova_in_corso = False
+
+    def errore(self):
+        with self._lock:
+            self.errori_consecutivi += 1
+            self._prova_in_corso = False
+            if self.stato == "semiaperto" or self.errori_consecutivi >= self.soglia:
+                if self.stato != "aperto":
+                    metrics.registra_evento("circuito_aperto")
+                self.stato = "aperto"
+                self._aperto_il = time.monotonic()
+
+    def rilascia(self):
+        """
+        La richiesta di prova è terminata con un errore non dovuto al servizio:
+        un'altra richiesta potrà fare da prova.
+        """
+        with self._lock:
+            self._prova_in_corso = False
+
+
+class Scheduler:
+    """
+    Controllo di ammissione condiviso per tutte le chiamate a Gemini del processo:
+    limite di concorrenza, limite di frequenza, scadenza per richiesta,
+    nuovi tentativi con backoff e circuit breaker.
+    """
+
+    def __init__(self, max_concorrenza=MAX_CONCORRENZA, richieste_al_secondo=RICHIESTE_AL_SECONDO,
+                 raffica_max=RAFFICA_MAX, max_tentativi=MAX_TENTATIVI):
+        self.max_concorrenza = max_concorrenza
+        self.max_tentativi = max_tentativi
+        self._slot = threading.BoundedSemaphore(max_concorrenza)
+        self._bucket = BucketToken(richieste_al_secondo, raffica_max)
+        self.circuito = Circuito()
+
+        self._lock = threading.Lock()
+        self.in_coda = 0
+        self.in_corso = 0
+        self.completate = 0
+        self.tentativi_ripetuti = 0
+        self.rifiutate = 0
+
+    def _entra(self, scadenza, operazione):
+        """
+        Attende uno slot di concorrenza e un token entro la scadenza.
+        """
+        inizio = time.monotonic()
+        with self._lock:
+            self.in_coda += 1
+        try:
+            if not self._slot.acquire(timeout=max(0.0, scadenza - inizio)):
+                raise ScadenzaSuperata("Troppe richieste in corso: riprova tra qualche istante.")
+            if not self._bucket.preleva(scadenza):
+                self._slot.release()
+                raise ScadenzaSuperata("Troppe richieste in corso: riprova tra qualche istante.")
+        except ScadenzaSuperata:
+            with self._lock:
+                self.rifiutate += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_coda -= 1
+            metrics.DURATA_FASE.osserva(time.monotonic() - inizio, fase="attesa_coda", operazione=operazione)
+        with self._lock:
+            self.in_corso += 1
+
+    def _esci(self):
+        with self._lock:
+            self.in_corso -= 1
+            self.completate += 1
+        self._slot.release()
+
+    def esegui(self, funzione, operazione, timeout_secondi):
+        """
+        Esegue funzione(timeout_ms) rispettando i limiti condivisi; timeout_ms è il tempo
+        che resta prima della scadenza, da usare come timeout della chiamata HTTP.
+        Gli errori temporanei vengono ripetuti con backoff finché c'è tempo;
+        se il servizio resta non disponibile viene sollevata ServizioNonDisponibile.
+        """
+        scadenza = time.monotonic() + timeout_secondi
+        for tentativo in range(self.max_tentativi):
+            self.circuito.ammetti()
+            try:
+                self._entra(scadenza, operazione)
+            except ScadenzaSuperata:
+                self.circuito.rilascia()
+                raise
+            try:
+                risultato = funzione(max(1000, int((scadenza - time.monotonic()) * 1000)))
+            except Exception as e:
+                if not _errore_temporaneo(e):
+                    self.circuito.rilascia()
+                    raise
+                self.circuito.errore()
+                ultimo_errore = e
+            else:
+                self.circuito.successo()
+                return risultato
+            finally:
+                self._esci()
+
+            # Backoff esponenziale con "full jitter": le sessioni non riprovano tutte insieme
+            attesa = random.uniform(0, min(BACKOFF_MAX_SECONDI, BACKOFF_BASE_SECONDI * 2 ** tentativo))
+            if tentativo + 1 >= self.max_tentativi or time.monotonic() + attesa >= scadenza:
+                break
+            with self._lock:
+                self.tentativi_ripetuti += 1
+            metrics.registra_evento("nuovo_tentativo", operazione=operazione)
+            time.sleep(attesa)
+
+        codice = getattr(ultimo_errore, "code", None)
+        if codice == 429:
+            messaggio = "Il limite di richieste a Gemini è stato raggiunto. Riprova tra qualche minuto."
+        else:
+            messaggio = "Il servizio di analisi non risponde in questo momento. Riprova tra poco."
+        raise ServizioNonDisponibile(messaggio) from ultimo_errore
+
+    def statistiche(self):
+        with self._lock:
+            return {
+                "in_coda": self.in_coda,
+                "in_corso": self.in_corso,
+                "completate": self.completate,
+                "tentativi_ripetuti": self.tentativi_ripetuti,
+                "rifiutate": self.rifiutate,
+                "circuito_aperto": int(self.circuito.stato != "chiuso"),
+                "errori_consecutivi": self.circuito.errori_consecutivi,
+            }
+
+
+# Istanza condivisa da tutto il processo (tutte le sessioni Streamlit)
+_scheduler = Scheduler()
+
+def esegui(funzione, operazione, timeout_secondi):
+    """
+    Scorciatoia per eseguire una chiamata tramite lo scheduler condiviso.
+    """
+    return _scheduler.esegui(funzione, operazione, timeout_secondi)
+
+def statistiche_scheduler():
+    return _scheduler.statistiche()
@@ -0,0 +1,180 @@
+"""
+Dati delle sessioni utente con limiti di memoria e contabilità.
+
+Con molti utenti contemporanei la memoria del server cresce con i dati che ogni
+sessione Streamlit si porta dietro (analisi, storia della chat, analisi multiple).
+Qui quei dati vivono in un registro del processo con limiti rigidi:
+- al massimo MAX_SESSIONI sessioni (le meno usate di recente vengono eliminate);
+- le sessioni inattive da SESSIONE_IDLE_SECONDI vengono eliminate;
+- ogni sessione resta entro MAX_BYTE_SESSIONE (stima), scartando i dati più vecchi;
+- la chat mostrata tiene al massimo MAX_MESSAGGI_CHAT messaggi
+  (il modello ricorda comunque la conversazione tramite il riassunto di SessioneChat);
+- dell'immagine analizzata si conserva solo la firma percettiva, non i pixel.
+
+La memoria occupata dalle sessioni è quindi al più MAX_SESSIONI * MAX_BYTE_SESSIONE,
+un valore da usare per dimensionare il container.
+"""
+import os # Variabili d'ambiente
+import sys # Dimensione degli oggetti in memoria
+import threading # Registro condiviso tra le sessioni
+import time # Inattività delle sessioni
+from collections import OrderedDict, deque # Registro per ultimo utilizzo, chat a lunghezza fissa
+import metrics # Esportazione della contabilità delle sessioni
+from chat_session import SessioneChat # Memoria della chat entro un budget di token
+
+MAX_SESSIONI = int(os.environ.get("ECOVISION_SESSIONI_MAX", 500))
+SESSIONE_IDLE_SECONDI = int(os.environ.get("ECOVISION_SESSIONE_IDLE", 30 * 60))
+MAX_BYTE_SESSIONE = int(os.environ.get("ECOVISION_SESSIONE_MAX_KB", 512)) * 1024
+MAX_MESSAGGI_CHAT = int(os.environ.get("ECOVISION_CHAT_MAX_MESSAGGI", 40))
+
+
+def stima_byte(oggetto, visti=None):
+    """
+    Stima della memoria occupata da un oggetto e da tutto ciò che contiene
+    (dizionari, liste, attributi). Gli oggetti condivisi vengono contati una volta sola.
+    """
+    if visti is None:
+        visti = set()
+    if id(oggetto) in visti:
+        return 0
+    visti.add(id(oggetto))
+    totale = sys.getsizeof(oggetto)
+    if isinstance(oggetto, (str, bytes, bytearray, int, float, bool, type(None))):
+        return totale
+    if isinstance(oggetto, dict):
+        totale += sum(stima_byte(k, visti) + stima_byte(v, visti) for k, v in oggetto.items())
+    elif isinstance(oggetto, (list, tuple, set, frozenset, deque)):
+        totale += sum(stima_byte(elemento, visti) for elemento in oggetto)
+    elif hasattr(oggetto, "__dict__"):
+        totale += stima_byte(vars(oggetto), visti)
+    return totale
+
+
+class StatoSessione:
+    """
+    Dati di una sessione che occupano memoria: ultima analisi, chat e analisi multipla.
+    """
+
+    def __init__(self, max_messaggi_chat=MAX_MESSAGGI_CHAT):
+        self.analisi = None
+        self.firma = None # firma percettiva della foto analizzata (per la conferma del risultato)
+        self.chat = deque(maxlen=max_messaggi_chat) # [{"role", "content"}]
+        self.chat_sessione = None
+        self.chat_metriche = {}
+        self.batch = []
+        self.byte = 0 # ultima stima della memoria occupata
+        self.ultimo_uso = time.monotonic()
+
+    def nuova_analisi(self, risultato, firma):
+        """
+        Registra una nuova analisi: la chat precedente non serve più.
+        """
+        self.analisi = risultato
+        self.firma = firma
+        self.chat.clear()
+        self.chat_sessione = SessioneChat(risultato)
+        self.chat_metriche = {}
+
+    def riduci(self, limite):
+        """
+        Scarta i dati più vecchi (analisi multiple, poi messaggi della chat)
+        finché la stima non rientra nel limite. Restituisce il numero di elementi scartati.
+        """
+        scartati = 0
+        self.byte = stima_byte(self)
+        while self.byte > limite and (self.batch or self.chat):
+            if self.batch:
+                self.batch.pop(0)
+            else:
+                self.chat.popleft()
+            scartati += 1
+            self.byte = stima_byte(self)
+        return scartati
+
+
+class RegistroSessioni:
+    """
+    Registro thread-safe dei dati delle sessioni, condiviso da tutto il processo.
+    """
+
+    def __init__(self, max_sessioni=MAX_SESSIONI, idle_secondi=SESSIONE_IDLE_SECONDI,
+                 max_byte_sessione=MAX_BYTE_SESSIONE, max_messaggi_chat=MAX_MESSAGGI_CHAT):
+        self.max_sessioni = max_sessioni
+        self.idle_secondi = idle_secondi
+        self.max_byte_sessione = max_byte_sessione
+        self.max_messaggi_chat = max_messaggi_chat
+
+        self._sessioni = OrderedDict() # id sessione -> StatoSessione
+        self._lock = threading.Lock()
+
+        # Contatori delle eliminazioni
+        self.eliminate_inattive = 0
+        self.eliminate_limite = 0
+        self.elementi_scartati = 0
+
+    def _elimina_scadute(self, adesso):
+        # Il registro è ordinato per ultimo uso: le sessioni scadute sono in testa
+        for id_sessione in list(self._sessioni):
+            if adesso - self._sessioni[id_sessione].ultimo_uso <= self.idle_secondi:
+                break
+            del self._sessioni[id_sessione]
+            self.eliminate_inattive += 1
+        while len(self._sessioni) > self.max_sessioni:
+            self._sessioni.popitem(last=False)
+            self.eliminate_limite += 1
+
+    def get(self, id_sessione):
+        """
+        Restituisce i dati della sessione, creandoli se mancano o se sono stati eliminati.
+        """
+        adesso = time.monotonic()
+        with self._lock:
+            stato = self._sessioni.get(id_sessione)
+            if stato is None:
+                stato = self._sessioni[id_sessione] = StatoSessione(self.max_messaggi_chat)
+            else:
+                self._sessioni.move_to_end(id_sessione)
+            stato.ultimo_uso = adesso
+            self._elimina_scadute(adesso)
+        return stato
+
+    def contabilizza(self, stato):
+        """
+        Aggiorna la stima della memoria della sessione e la riporta entro il limite.
+        Va chiamata dopo ogni modifica (fine del rerun, nuovo messaggio in chat).
+        """
+        scartati = stato.riduci(self.max_byte_sessione)
+        if scartati:
+            with self._lock:
+                self.elementi_scartati += scartati
+
+    def statistiche(self):
+        with self._lock:
+            byte = [stato.byte for stato in self._sessioni.values()]
+            return {
+                "attive": len(byte),
+                "byte_totali": sum(byte),
+                "byte_max_sessione": max(byte, default=0),
+                "eliminate_inattive": self.eliminate_inattive,
+                "eliminate_limite": self.eliminate_limite,
+                "elementi_scartati": self.elementi_scartati,
+            }
+
+
+# Istanza condivisa da tutto il processo (tutte le sessioni Streamlit)
+_registro = RegistroSessioni()
+
+def stato_sessione(id_sessione):
+    """
+    Scorciatoia per leggere i dati di una sessione dal registro condiviso.
+    """
+    return _registro.get(id_sessione)
+
+def contabilizza(stato):
+    _registro.contabilizza(stato)
+
+def statistiche_sessioni():
+    return _registro.statistiche()
+
+
+metrics.registra_statistiche("sessioni", statistiche_sessioni)